@@ -12,8 +12,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
+import importlib.util
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -150,6 +153,54 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Cache
+# CACHE_BACKEND: locmem (по умолчанию, на процесс), file или redis (локальный Redis;
+# пакет redis не входит в requirements.txt — ставится отдельно, см. там же).
+# Алиас "pages" — кэш отрендеренных публичных страниц (shop/page_cache.py).
+# При нескольких воркерах нужен общий кэш (file или redis): через "default" процессы
+# узнают о сбросе страниц, фасетов и подсказок (check --deploy предупреждает, shop.W001).
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem').strip().lower()
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/1')
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(
+        f'CACHE_BACKEND={CACHE_BACKEND!r}: допустимы {", ".join(CACHE_BACKENDS)}'
+    )
+if CACHE_BACKEND == 'redis' and importlib.util.find_spec('redis') is None:
+    raise ImproperlyConfigured('CACHE_BACKEND=redis: установите пакет redis (pip install redis==5.2.1)')
+
+
+def _cache_config(alias, timeout):
+    if CACHE_BACKEND == 'file':
+        location = str(BASE_DIR / 'cache' / alias)
+    elif CACHE_BACKEND == 'redis':
+        location = CACHE_REDIS_URL
+    else:
+        location = f'buket-{alias}'
+    return {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': location,
+        'TIMEOUT': timeout,
+        'KEY_PREFIX': alias,
+    }
+
+
+CACHES = {
+    'default': _cache_config('default', 300),
+    'pages': _cache_config('pages', int(os.getenv('PAGE_CACHE_TIMEOUT', '600'))),
+}
+
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', 'true').lower() != 'false'
+
+# Фоновые задачи (shop/jobs.py, команда run_worker). false — превью создаются прямо в запросе
+JOBS_ENABLED = os.getenv('JOBS_ENABLED', 'true').lower() != 'false'
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -163,7 +214,9 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    # Пагинация задаётся во viewset'ах (pagination_class, shop/pagination.py):
+    # остальные ответы API остаются списками в порядке Meta.ordering
 }
 
 SIMPLE_JWT = {
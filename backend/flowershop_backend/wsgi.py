@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flowershop_backend.settings')
 
 application = get_wsgi_application()
+
+# Индекс подсказок поиска (shop/suggest.py) строится в фоне, пока воркер принимает запросы
+from shop import suggest  # noqa: E402
+
+suggest.warm_up()
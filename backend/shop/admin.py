@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Product, ProductImage, Discount, Order, OrderItem, Category, Review, HeroBanner, Store, StoreManager, StorePhone, StorePhoto, FlowerTag, SitePage, ShowcaseItem, Ticker
+from . import page_cache
+from .models import Product, ProductImage, Discount, Order, OrderItem, Category, Review, HeroBanner, Store, StoreManager, StorePhone, StorePhoto, FlowerTag, SitePage, ShowcaseItem, Ticker, Job
 
 admin.site.site_header = 'Администрирование Buket.by'
 admin.site.site_title = 'Buket.by Admin'
@@ -22,7 +23,7 @@ class ProductAdmin(admin.ModelAdmin):
         'showcase_sort_order',
     )
     search_fields = ('title', 'article', 'slug')
-    list_filter = ('is_online_showcase', 'stores', 'is_published')
+    list_filter = ('is_online_showcase', 'stores', 'is_published', 'import_source')
     list_per_page = 50
     readonly_fields = ('slug', 'image_preview_large', 'all_images_preview')
     fields = (
@@ -39,6 +40,7 @@ class ProductAdmin(admin.ModelAdmin):
         'is_online_showcase',
         'showcase_sort_order',
         'created_by',
+        'import_source',
         'category',
         'categories',
         'flower_tags',
@@ -47,10 +49,8 @@ class ProductAdmin(admin.ModelAdmin):
     inlines = []
 
     def _image_src(self, obj):
-        if obj.uploaded_image:
-            return obj.uploaded_image.url
-        if obj.image:
-            return obj.image
+        if obj.primary_image_url:
+            return obj.primary_image_url
         first_image = obj.images.order_by('sort_order', 'id').first()
         if first_image and first_image.image:
             return first_image.image.url
@@ -225,10 +225,13 @@ class ReviewAdmin(admin.ModelAdmin):
     @admin.action(description='Опубликовать выбранные отзывы')
     def publish_reviews(self, request, queryset):
         queryset.update(is_published=True)
+        # update() не шлёт post_save (shop/signals.py) — отзывы на главной сбрасываем сами
+        page_cache.invalidate_on_commit('home')
 
     @admin.action(description='Снять с публикации выбранные отзывы')
     def unpublish_reviews(self, request, queryset):
         queryset.update(is_published=False)
+        page_cache.invalidate_on_commit('home')
 
 
 @admin.register(HeroBanner)
@@ -278,3 +281,17 @@ class TickerAdmin(admin.ModelAdmin):
     def short_text(self, obj):
         return obj.text[:80] + ('…' if len(obj.text) > 80 else '')
     short_text.short_description = 'Текст'
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'run_after', 'locked_by', 'updated_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('dedupe_key',)
+    readonly_fields = ('created_at', 'updated_at', 'locked_by', 'locked_at', 'last_error')
+    actions = ('retry',)
+
+    @admin.action(description='Повторить выбранные задачи')
+    def retry(self, request, queryset):
+        from django.utils import timezone
+        queryset.update(status=Job.STATUS_PENDING, attempts=0, run_after=timezone.now(), locked_at=None, locked_by='')
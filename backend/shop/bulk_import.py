@@ -0,0 +1,268 @@
+"""
+Пакетная запись для команд импорта из старой БД (reimport_vm, import_jshopping_nov,
+sync_vm_images).
+
+Импорт не удаляет каталог целиком, а сверяет его с источником: diff_objects()
+и diff_links() собирают Changeset (новые / изменённые поля / лишние), который
+печатается в --dry-run или применяется пачками: bulk_create, bulk_update только
+по изменившимся полям, delete по pk. id товаров, витрины и ссылки сохраняются.
+
+Товары сверяются по артикулу только с товарами своего источника (Product.import_source)
+и ещё не помеченными; удаляются (--prune) только товары своего источника — добавленные
+на сайте, через бота или другим импортом не трогаются.
+
+Транзакцию (одну на весь импорт) открывает команда. bulk_create/bulk_update
+не вызывают save() и сигналы, поэтому primary_image_url и slug товаров
+заполняются здесь, а кэш страниц, поисковый индекс, подсказки и фасеты
+обновляются один раз в finish() (after_bulk_write — то же для других пакетных
+записей, например альбома из бота).
+"""
+
+import time
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from . import facets, page_cache, search, suggest
+from .models import Product
+
+DEFAULT_BATCH_SIZE = 500
+CATALOG_GROUPS = ('home', 'catalog', 'categories', 'products')
+
+
+def after_bulk_write(product_ids=None, groups=CATALOG_GROUPS):
+    """То, что для save() делают сигналы (shop/signals.py), — после bulk_create/bulk_update
+    товаров: сброс кэша страниц groups, поисковый индекс (product_ids=None — перестроить
+    целиком), подсказки и фасеты. Выполняется после коммита текущей транзакции."""
+    def refresh():
+        page_cache.invalidate(*groups)
+        search.index_products(None if product_ids is None else list(product_ids))
+        suggest.invalidate()
+        facets.invalidate()
+
+    transaction.on_commit(refresh)
+
+
+def products_by_article(source):
+    """({артикул: товар}, [повторяющиеся артикулы]) — товары, с которыми сверяется импорт
+    из source: уже импортированные из него и не помеченные (кроме добавленных через бота).
+    Повтор артикула — команда должна остановиться: непонятно, какой товар обновлять."""
+    existing = {}
+    duplicates = set()
+    candidates = Product.objects.filter(
+        import_source__in=(source, ''), created_by__isnull=True,
+    ).exclude(article='').order_by('pk')
+    for product in candidates:
+        if product.article in existing:
+            duplicates.add(product.article)
+        else:
+            existing[product.article] = product
+    return existing, sorted(duplicates)
+
+
+def stale_products(existing, desired, source):
+    """pk товаров source, которых больше нет в дампе (для --prune)."""
+    return [
+        product.pk for article, product in existing.items()
+        if article not in desired and product.import_source == source
+    ]
+
+
+def fill_product_slugs(products):
+    """Проставить уникальные slug товарам без него — как у товаров из бота (serializers.py):
+    slugify из названия, кириллица не транслитерируется, поэтому иначе из артикула."""
+    taken = set(Product.objects.exclude(slug='').values_list('slug', flat=True))
+    taken.update(p.slug for p in products if p.slug)
+    for product in products:
+        if product.slug:
+            continue
+        base = slugify(product.title)
+        if not base or base.isdigit():
+            # Из «Букет 7» остаётся только «7» — такой slug похож на id
+            base = slugify(product.article) or 'buket'
+        base = base[:110]
+        slug = base
+        counter = 2
+        while slug in taken:
+            slug = f'{base}-{counter}'
+            counter += 1
+        taken.add(slug)
+        product.slug = slug
+
+
+class BulkWriter:
+    """bulk_create пачками с отчётом о прогрессе и скорости.
+
+    log — функция вывода строки (self.stdout.write команды) или None.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, log=None):
+        if batch_size < 1:
+            raise ValueError('batch_size должен быть >= 1')
+        self.batch_size = batch_size
+        self.log = log
+        self.started = time.monotonic()
+        # label -> [строк, секунд]
+        self.totals = {}
+
+    def _write(self, message):
+        if self.log is not None:
+            self.log(message)
+
+    def create(self, model, objs, label=None, **kwargs):
+        """Записать объекты пачками; возвращает их список (с pk, если БД его отдаёт)."""
+        objs = list(objs)
+        label = label or str(model._meta.verbose_name_plural)
+        if model is Product:
+            for obj in objs:
+                obj.primary_image_url = obj.resolve_primary_image_url()
+        started = time.monotonic()
+        done = 0
+        for start in range(0, len(objs), self.batch_size):
+            batch = objs[start:start + self.batch_size]
+            model.objects.bulk_create(batch, **kwargs)
+            done += len(batch)
+            if len(objs) > self.batch_size:
+                elapsed = time.monotonic() - started
+                self._write(f'  {label}: {done}/{len(objs)} ({done / max(elapsed, 1e-6):,.0f}/с)')
+        total = self.totals.setdefault(label, [0, 0.0])
+        total[0] += done
+        total[1] += time.monotonic() - started
+        return objs
+
+    def link(self, relation, pairs, label=None):
+        """Связи M2M пачками: relation — дескриптор (Product.categories), pairs — (pk, pk связанного)."""
+        field = relation.field
+        through = relation.through
+        source = f'{field.m2m_field_name()}_id'
+        target = f'{field.m2m_reverse_field_name()}_id'
+        rows = [through(**{source: a, target: b}) for a, b in dict.fromkeys(pairs)]
+        return self.create(through, rows, label or _link_label(field), ignore_conflicts=True)
+
+    def update(self, model, objs, fields, label=None):
+        """bulk_update пачками только по полям fields."""
+        objs = list(objs)
+        fields = list(fields)
+        if not objs or not fields:
+            return objs
+        label = label or str(model._meta.verbose_name_plural)
+        if model is Product and {'image', 'uploaded_image'} & set(fields):
+            for obj in objs:
+                obj.primary_image_url = obj.resolve_primary_image_url()
+            fields.append('primary_image_url')
+        started = time.monotonic()
+        model.objects.bulk_update(objs, fields, batch_size=self.batch_size)
+        total = self.totals.setdefault(f'{label} (изменено)', [0, 0.0])
+        total[0] += len(objs)
+        total[1] += time.monotonic() - started
+        return objs
+
+    def delete(self, model, pks, label=None):
+        """Удалить по pk пачками (каскады и сигналы — как у обычного delete())."""
+        pks = list(pks)
+        label = label or str(model._meta.verbose_name_plural)
+        started = time.monotonic()
+        for start in range(0, len(pks), self.batch_size):
+            model.objects.filter(pk__in=pks[start:start + self.batch_size]).delete()
+        if pks:
+            total = self.totals.setdefault(f'{label} (удалено)', [0, 0.0])
+            total[0] += len(pks)
+            total[1] += time.monotonic() - started
+
+    def finish(self):
+        """Итог по скорости, сброс кэша страниц, перестройка поискового индекса,
+        подсказок и фасетов (сигналы при bulk_create не срабатывали)."""
+        if any(rows for rows, _ in self.totals.values()):
+            after_bulk_write()
+        else:
+            page_cache.invalidate(*CATALOG_GROUPS)
+        elapsed = time.monotonic() - self.started
+        self._write(f'Записано за {elapsed:.1f} с:')
+        for label, (rows, seconds) in self.totals.items():
+            self._write(f'  {label}: {rows} ({rows / max(seconds, 1e-6):,.0f}/с)')
+
+
+def _link_label(field):
+    return f'{field.model._meta.verbose_name_plural} → {field.verbose_name}'
+
+
+class Changeset:
+    """Изменения одной модели: create — новые объекты, update — объекты
+    с изменёнными полями (changed: поле -> сколько объектов), delete — pk лишних."""
+
+    def __init__(self, model, label=None):
+        self.model = model
+        self.label = label or str(model._meta.verbose_name_plural)
+        self.create = []
+        self.update = []
+        self.changed = {}
+        self.delete = []
+
+    def __len__(self):
+        return len(self.create) + len(self.update) + len(self.delete)
+
+    def summary(self):
+        line = f'{self.label}: +{len(self.create)} ~{len(self.update)} -{len(self.delete)}'
+        if self.changed:
+            line += ' (' + ', '.join(f'{name}: {n}' for name, n in sorted(self.changed.items())) + ')'
+        return line
+
+    def apply(self, writer):
+        """Сначала удаления (освобождают уникальные значения), затем вставки и обновления."""
+        writer.delete(self.model, self.delete, self.label)
+        writer.create(self.model, self.create, self.label, **(
+            {'ignore_conflicts': True} if self.model._meta.auto_created else {}
+        ))
+        writer.update(self.model, self.update, self.changed, self.label)
+
+
+def diff_objects(model, existing, desired, fields, *, prune=False, label=None):
+    """Сравнить {ключ: объект из БД} с {ключ: несохранённый объект из источника}.
+
+    Совпавшим по ключу объектам из existing переносятся значения полей fields,
+    которые отличаются; отсутствующие в БД идут в create, лишние в БД — в delete
+    (только при prune). Возвращает (Changeset, {ключ: итоговый объект}).
+    """
+    changeset = Changeset(model, label)
+    model_fields = [model._meta.get_field(name) for name in fields]
+    result = {}
+    for key, new in desired.items():
+        old = existing.get(key)
+        if old is None:
+            changeset.create.append(new)
+            result[key] = new
+            continue
+        dirty = False
+        for field in model_fields:
+            value = field.to_python(getattr(new, field.attname))
+            if getattr(old, field.attname) != value:
+                setattr(old, field.attname, value)
+                changeset.changed[field.name] = changeset.changed.get(field.name, 0) + 1
+                dirty = True
+        if dirty:
+            changeset.update.append(old)
+        result[key] = old
+    if prune:
+        changeset.delete = [obj.pk for key, obj in existing.items() if key not in desired]
+    return changeset, result
+
+
+def diff_links(relation, desired_pairs, source_pks, *, label=None):
+    """Связи M2M у объектов source_pks привести к desired_pairs ((pk, pk связанного)).
+
+    Пары с pk None (объект ещё не создан, --dry-run) считаются новыми.
+    """
+    field = relation.field
+    through = relation.through
+    source = f'{field.m2m_field_name()}_id'
+    target = f'{field.m2m_reverse_field_name()}_id'
+    changeset = Changeset(through, label or _link_label(field))
+    desired = set(desired_pairs)
+    existing = {
+        (a, b): pk for pk, a, b in through.objects.filter(
+            **{f'{source}__in': [pk for pk in source_pks if pk is not None]}
+        ).values_list('pk', source, target)
+    }
+    changeset.create = [through(**{source: a, target: b}) for a, b in desired if (a, b) not in existing]
+    changeset.delete = [pk for pair, pk in existing.items() if pair not in desired]
+    return changeset
@@ -0,0 +1,36 @@
+"""
+Проверки manage.py check для продакшена.
+"""
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии кэша страниц, фасетов и подсказок и дерево категорий должны быть общими
+    для всех воркеров: с locmem каждый процесс видит только свои изменения."""
+    if not isinstance(caches['default'], LocMemCache):
+        return []
+    return [checks.Warning(
+        'Кэш по умолчанию — locmem: сброс кэша страниц, фасетов и подсказок не дойдёт '
+        'до других воркеров (они обновятся только по TTL).',
+        hint='Задайте CACHE_BACKEND=file или CACHE_BACKEND=redis (+ CACHE_REDIS_URL).',
+        id='shop.W001',
+    )]
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_jobs_cache(app_configs, **kwargs):
+    """Воркер run_worker — отдельный процесс: с locmem сброс кэша страниц после обработки
+    загрузки до сайта не доходит (srcset сайт прочитает из storage, но страницы — только по TTL)."""
+    if not getattr(settings, 'JOBS_ENABLED', False) or not isinstance(caches['default'], LocMemCache):
+        return []
+    return [checks.Warning(
+        'JOBS_ENABLED=true при кэше locmem: страницы после обработки изображений воркером '
+        'обновятся только по истечении кэша.',
+        hint='Задайте CACHE_BACKEND=file или CACHE_BACKEND=redis либо JOBS_ENABLED=false.',
+        id='shop.W002',
+    )]
@@ -0,0 +1,358 @@
+"""
+Фасетный фильтр каталога: несколько цветов, диапазоны цен, магазины и канал витрины
+с количеством товаров у каждого значения.
+
+Для каждого значения (FlowerTag, Category, Store, диапазон цены, канал) заранее
+строится битовая маска опубликованных товаров: бит N — товар с id N (int Python).
+Пересечение фасетов — &, несколько значений одного фасета — |, количество —
+int.bit_count(), так что счётчики не требуют COUNT(DISTINCT) с JOIN на каждый фасет,
+а страница каталога берёт из маски нужные id и читает из БД только их.
+
+Счётчик значения считается без учёта выбора в его собственном фасете
+(«+3 при добавлении ещё одного цветка»), но с учётом остальных.
+
+Для сортировок по цене и популярности заранее отсортированы ключи (цена, id) и
+(продано, id): страница — первые совпадения с маской после курсора (товары без
+цены — в конце), границы ?min_price=/?max_price= — срез по bisect.
+
+Маски живут в памяти процесса и перестраиваются при первом запросе после
+изменения товаров, связей, магазинов, цветов, категорий или заказов (shop/signals.py
+сдвигает версию в кэше после коммита). Версию видят все воркеры, только если кэш
+общий (CACHE_BACKEND=file или redis); с locmem чужие изменения доходят до процесса
+не позже чем через MAX_AGE секунд.
+"""
+
+import bisect
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+
+VERSION_KEY = 'facets:version'
+# Маски старше перестраиваются, даже если версия в кэше не менялась
+MAX_AGE = 5 * 60
+
+FLOWER = 'flower'
+PRICE = 'price'
+STORE = 'store'
+CHANNEL = 'channel'
+FACETS = (FLOWER, PRICE, STORE, CHANNEL)
+
+# (ключ в URL, от, до) — границы: от <= цена < до
+PRICE_RANGES = (
+    ('0-50', None, 50),
+    ('50-100', 50, 100),
+    ('100-150', 100, 150),
+    ('150-250', 150, 250),
+    ('250-', 250, None),
+)
+PRICE_LABELS = {
+    '0-50': 'до 50',
+    '50-100': '50–100',
+    '100-150': '100–150',
+    '150-250': '150–250',
+    '250-': 'от 250',
+}
+# Канал витрины: товар с каналом «both» есть и в доставке, и в самовывозе
+CHANNELS = (('delivery', 'Доставка'), ('pickup', 'Самовывоз'))
+
+SORT_NEW = 'new'
+SORTS = (
+    (SORT_NEW, 'Сначала новые'),
+    ('popular', 'Популярные'),
+    ('price', 'Сначала дешевле'),
+    ('-price', 'Сначала дороже'),
+)
+
+
+# Ключ сортировки для товаров без цены: в конце выдачи при любом направлении
+NO_PRICE = Decimal('Infinity')
+
+
+def _mask(ids):
+    """Битовая маска из набора id."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for pk in ids:
+        bits[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _union(masks):
+    result = 0
+    for mask in masks:
+        result |= mask
+    return result
+
+
+def ids_desc(mask, limit, before=None):
+    """Первые limit id маски по убыванию (только id < before, если задан)."""
+    if before:
+        mask &= (1 << before) - 1
+    ids = []
+    while mask and len(ids) < limit:
+        pk = mask.bit_length() - 1
+        ids.append(pk)
+        mask ^= 1 << pk
+    return ids
+
+
+def parse_price(value):
+    """Граница цены из параметра (?min_price=50); пустое или некорректное значение — None."""
+    try:
+        price = Decimal(str(value).replace(',', '.').strip())
+    except (InvalidOperation, ValueError):
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+
+class Selection:
+    """Выбор в каталоге: значения фасетов {фасет: кортеж значений в порядке выбора},
+    границы цены (Decimal или None) и сортировка."""
+
+    def __init__(self, min_price=None, max_price=None, sort=SORT_NEW, **values):
+        self.values = {facet: tuple(dict.fromkeys(values.get(facet) or ())) for facet in FACETS}
+        self.min_price = min_price
+        self.max_price = max_price
+        self.sort = sort
+
+    @classmethod
+    def from_query(cls, params, index, flowers=()):
+        """Из QueryDict (?flower=roza&flower=pion&price=50-100&store=3&channel=pickup
+        &min_price=40&max_price=120&sort=price); неизвестные значения отбрасываются.
+        flowers — цветы, заданные путём URL."""
+        known = {
+            FLOWER: index.masks[FLOWER],
+            PRICE: index.masks[PRICE],
+            STORE: index.masks[STORE],
+            CHANNEL: index.masks[CHANNEL],
+        }
+        values = {facet: [value for value in params.getlist(facet) if value in known[facet]] for facet in FACETS}
+        values[FLOWER] = [flower for flower in flowers if flower in known[FLOWER]] + values[FLOWER]
+        sort = params.get('sort')
+        return cls(
+            min_price=parse_price(params.get('min_price')),
+            max_price=parse_price(params.get('max_price')),
+            sort=sort if sort in dict(SORTS) else SORT_NEW,
+            **values,
+        )
+
+    def __bool__(self):
+        """Есть ли фильтры (сортировка не считается)."""
+        return any(self.values.values()) or self.min_price is not None or self.max_price is not None
+
+    def __getitem__(self, facet):
+        return self.values[facet]
+
+    def replace(self, **changes):
+        fields = {'min_price': self.min_price, 'max_price': self.max_price, 'sort': self.sort, **self.values}
+        fields.update(changes)
+        return Selection(**fields)
+
+    def toggle(self, facet, value):
+        current = self.values[facet]
+        changed = tuple(v for v in current if v != value) if value in current else current + (value,)
+        return self.replace(**{facet: changed})
+
+    def without(self, facet):
+        return self.replace(**{facet: ()})
+
+    def query(self, skip=()):
+        """Пары (параметр, значение) для urlencode."""
+        pairs = [(facet, value) for facet in FACETS if facet not in skip for value in self.values[facet]]
+        for name in ('min_price', 'max_price'):
+            value = getattr(self, name)
+            if value is not None and name not in skip:
+                pairs.append((name, str(value)))
+        if self.sort != SORT_NEW and 'sort' not in skip:
+            pairs.append(('sort', self.sort))
+        return pairs
+
+
+def _parse_id(value):
+    try:
+        return max(int(value or 0), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _parse_key(value):
+    """Курсор сортировки «a:b» -> (Decimal(a), int(b)) или None."""
+    try:
+        first, second = str(value).split(':')
+        return Decimal(first), int(second)
+    except (InvalidOperation, ValueError):
+        return None
+
+
+class FacetIndex:
+    """Маски опубликованных товаров по значениям фасетов и по категориям
+    и ключи сортировок orders: {сортировка: отсортированный список (ключ, ±id)}."""
+
+    def __init__(self, published, masks, categories, labels, orders):
+        self.published = published
+        self.masks = masks
+        self.categories = categories
+        self.labels = labels
+        self.orders = orders
+
+    def category_mask(self, category_ids):
+        return _union(self.categories.get(pk, 0) for pk in category_ids)
+
+    def price_mask(self, low=None, high=None):
+        """Товары с ценой в [low, high] (товары без цены не попадают)."""
+        keys = self.orders['price']
+        start = bisect.bisect_left(keys, (low,)) if low is not None else 0
+        if high is None:
+            end = bisect.bisect_left(keys, (NO_PRICE,))
+        else:
+            end = bisect.bisect_right(keys, (high, float('inf')))
+        return _mask(pk for _, pk in keys[start:end])
+
+    def match(self, selection, category_ids=None, exclude=None):
+        """Маска товаров под выбор (exclude — фасет, выбор в котором не учитывается)."""
+        mask = self.published
+        if category_ids is not None:
+            mask &= self.category_mask(category_ids)
+        for facet in FACETS:
+            if facet != exclude and selection[facet]:
+                mask &= _union(self.masks[facet][value] for value in selection[facet])
+        if selection.min_price is not None or selection.max_price is not None:
+            mask &= self.price_mask(selection.min_price, selection.max_price)
+        return mask
+
+    def page(self, mask, sort, after, limit):
+        """id страницы (до limit) в порядке sort после курсора after и курсор следующей
+        страницы (или None). Курсор «Сначала новые» — id последнего товара, остальных
+        сортировок — его ключ «a:b»."""
+        if sort == SORT_NEW:
+            ids = ids_desc(mask, limit + 1, before=_parse_id(after))
+            return ids[:limit], (ids[limit - 1] if len(ids) > limit else None)
+        keys = self.orders[sort]
+        cursor = _parse_key(after) if after else None
+        start = bisect.bisect_right(keys, cursor) if cursor is not None else 0
+        bits = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+        found = []
+        for i in range(start, len(keys)):
+            pk = abs(keys[i][1])
+            if pk >> 3 < len(bits) and bits[pk >> 3] >> (pk & 7) & 1:
+                found.append(keys[i])
+                if len(found) > limit:
+                    break
+        next_cursor = '{}:{}'.format(*found[limit - 1]) if len(found) > limit else None
+        return [abs(key[1]) for key in found[:limit]], next_cursor
+
+    def counts(self, selection, category_ids=None):
+        """{фасет: {значение: число товаров}}."""
+        result = {}
+        for facet in FACETS:
+            base = self.match(selection, category_ids, exclude=facet)
+            result[facet] = {value: (base & mask).bit_count() for value, mask in self.masks[facet].items()}
+        return result
+
+    def category_counts(self, selection, tree):
+        """{id категории: число товаров} для категорий вместе с дочерними; tree — {id: [id детей]}."""
+        base = self.match(selection)
+        return {pk: (base & self.category_mask([pk, *children])).bit_count() for pk, children in tree.items()}
+
+
+def build_index():
+    from .models import Category, FlowerTag, Product, Store
+
+    published = {}
+    by_category = {}
+    by_price = {key: [] for key, _, _ in PRICE_RANGES}
+    by_channel = {key: [] for key, _ in CHANNELS}
+    # Ключи сортировок: по возрастанию ключа — порядок показа (id в ключе — для устойчивости)
+    orders = {'price': [], '-price': [], 'popular': []}
+    rows = Product.objects.filter(is_published=True).values_list(
+        'id', 'price', 'category_id', 'is_online_showcase', 'showcase_channel', 'sold_count',
+    )
+    for pk, price, category_id, is_showcase, channel, sold in rows:
+        published[pk] = True
+        orders['popular'].append((-sold, -pk))
+        orders['price'].append((NO_PRICE if price is None else price, pk))
+        orders['-price'].append((NO_PRICE if price is None else -price, -pk))
+        if category_id is not None:
+            by_category.setdefault(category_id, []).append(pk)
+        if price is not None:
+            for key, low, high in PRICE_RANGES:
+                if (low is None or price >= Decimal(low)) and (high is None or price < Decimal(high)):
+                    by_price[key].append(pk)
+                    break
+        if is_showcase:
+            for key, _ in CHANNELS:
+                if channel in (key, Product.SHOWCASE_CHANNEL_BOTH):
+                    by_channel[key].append(pk)
+
+    def through_ids(relation, target):
+        grouped = {}
+        for target_id, pk in relation.through.objects.values_list(target, 'product_id'):
+            if pk in published:
+                grouped.setdefault(target_id, []).append(pk)
+        return grouped
+
+    for category_id, pks in through_ids(Product.categories, 'category_id').items():
+        by_category.setdefault(category_id, []).extend(pks)
+
+    tag_ids = through_ids(Product.flower_tags, 'flowertag_id')
+    tags = list(FlowerTag.objects.exclude(slug='').order_by('sort_order', 'name').values_list('id', 'slug', 'name'))
+    store_ids = through_ids(Product.stores, 'store_id')
+    stores = list(Store.objects.filter(is_active=True).order_by('sort_order', 'name').values_list('id', 'name'))
+
+    masks = {
+        FLOWER: {slug: _mask(tag_ids.get(pk, ())) for pk, slug, _ in tags},
+        PRICE: {key: _mask(pks) for key, pks in by_price.items()},
+        STORE: {str(pk): _mask(store_ids.get(pk, ())) for pk, _ in stores},
+        CHANNEL: {key: _mask(pks) for key, pks in by_channel.items()},
+    }
+    labels = {
+        FLOWER: {slug: name for _, slug, name in tags},
+        PRICE: PRICE_LABELS,
+        STORE: {str(pk): name for pk, name in stores},
+        CHANNEL: dict(CHANNELS),
+    }
+    categories = {pk: _mask(pks) for pk, pks in by_category.items()}
+    # Категории без товаров — пустая маска, чтобы счётчик был 0, а не KeyError
+    for pk in Category.objects.values_list('id', flat=True):
+        categories.setdefault(pk, 0)
+    for keys in orders.values():
+        keys.sort()
+    return FacetIndex(_mask(published), masks, categories, labels, orders)
+
+
+_index = None
+_version = None
+_built_at = 0.0
+_lock = threading.Lock()
+
+
+def _is_fresh(version):
+    return _index is not None and version == _version and time.monotonic() - _built_at < MAX_AGE
+
+
+def get_index():
+    global _index, _version, _built_at
+    version = cache.get(VERSION_KEY, 0)
+    if _is_fresh(version):
+        return _index
+    with _lock:
+        if not _is_fresh(version):
+            _index = build_index()
+            _version = version
+            _built_at = time.monotonic()
+        return _index
+
+
+def invalidate():
+    """Маски устарели — все процессы перестроят их при следующем запросе."""
+    global _index
+    _index = None
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
@@ -0,0 +1,153 @@
+"""
+Параллельное копирование и проверка файлов картинок для команд импорта
+(sync_vm_images, sync_legacy_product_images, import_jshopping_nov, check_images).
+
+Копирование и stat упираются в диск/сеть, а не в CPU, поэтому работают в пуле
+потоков. Уже лежащий на месте файл с тем же содержимым (размер, затем хэш)
+не копируется повторно, изменившийся — перезаписывается:
+
+    sync = FileSync(workers=8, log=self.stdout.write)
+    report = sync.copy([(src, dest), ...])
+    report.results[dest]   # 'copied' | 'replaced' | 'identical' | 'missing' | 'error'
+    sync.check(paths)      # 'present' | 'missing' | 'error'
+    self.stdout.write(report.summary())
+"""
+
+import hashlib
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = 8
+HASH_CHUNK = 1 << 20
+# Как часто печатать прогресс (в файлах)
+PROGRESS_EVERY = 500
+
+COPIED = 'copied'
+REPLACED = 'replaced'
+IDENTICAL = 'identical'
+PRESENT = 'present'
+MISSING = 'missing'
+ERROR = 'error'
+
+
+def file_hash(path):
+    """blake2b содержимого файла (читается кусками)."""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def same_content(src, dest):
+    """True, если dest существует и совпадает с src по размеру и хэшу."""
+    try:
+        if os.path.getsize(src) != os.path.getsize(dest):
+            return False
+    except OSError:
+        return False
+    return file_hash(src) == file_hash(dest)
+
+
+class FileSyncReport:
+    """Итог прогона: results — {dest (или путь при check): статус},
+    errors — {путь: текст ошибки}, bytes — скопировано байт
+    (при check — размер найденных файлов)."""
+
+    def __init__(self, label):
+        self.label = label
+        self.results = {}
+        self.errors = {}
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def count(self, status):
+        return sum(1 for value in self.results.values() if value == status)
+
+    def paths(self, status):
+        return [path for path, value in self.results.items() if value == status]
+
+    def summary(self):
+        counts = {}
+        for status in self.results.values():
+            counts[status] = counts.get(status, 0) + 1
+        seconds = max(self.seconds, 1e-6)
+        parts = ', '.join(f'{status}: {n}' for status, n in sorted(counts.items()))
+        return (
+            f'{self.label}: {len(self.results)} файлов за {self.seconds:.1f} с '
+            f'({len(self.results) / seconds:,.0f} файлов/с, {self.bytes / seconds / 2**20:,.1f} МБ/с)'
+            + (f' — {parts}' if parts else '')
+        )
+
+
+class FileSync:
+    """Пул потоков для копирования (copy) и проверки наличия (check) файлов.
+
+    dry_run=True — copy() только определяет, что было бы скопировано, и ничего не пишет.
+    log — функция вывода строки (self.stdout.write команды) или None.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, dry_run=False, log=None):
+        if workers < 1:
+            raise ValueError('workers должен быть >= 1')
+        self.workers = workers
+        self.dry_run = dry_run
+        self.log = log
+
+    def _write(self, message):
+        if self.log is not None:
+            self.log(message)
+
+    def _run(self, label, fn, items):
+        report = FileSyncReport(label)
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for done, (key, status, size, error) in enumerate(pool.map(fn, items), 1):
+                report.results[key] = status
+                report.bytes += size
+                if error:
+                    report.errors[key] = error
+                if len(items) > PROGRESS_EVERY and done % PROGRESS_EVERY == 0:
+                    self._write(f'  {label}: {done}/{len(items)}')
+        report.seconds = time.monotonic() - started
+        return report
+
+    def _copy_one(self, task):
+        src, dest = task
+        try:
+            if not os.path.exists(src):
+                return dest, MISSING, 0, None
+            exists = os.path.exists(dest)
+            if exists and same_content(src, dest):
+                return dest, IDENTICAL, 0, None
+            size = os.path.getsize(src)
+            if not self.dry_run:
+                os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+                # Через временный файл: оборванное копирование не оставит половину картинки
+                tmp = f'{dest}.part'
+                shutil.copy2(src, tmp)
+                os.replace(tmp, dest)
+            return dest, REPLACED if exists else COPIED, size, None
+        except OSError as exc:
+            return dest, ERROR, 0, str(exc)
+
+    def copy(self, tasks, label='Копирование'):
+        """Скопировать пары (src, dest). Повторяющийся dest копируется один раз (первая пара)."""
+        items = {}
+        for src, dest in tasks:
+            items.setdefault(str(dest), (str(src), str(dest)))
+        return self._run(label, self._copy_one, list(items.values()))
+
+    def _check_one(self, path):
+        try:
+            return path, PRESENT, os.path.getsize(path), None
+        except FileNotFoundError:
+            return path, MISSING, 0, None
+        except OSError as exc:
+            return path, ERROR, 0, str(exc)
+
+    def check(self, paths, label='Проверка'):
+        """Проверить наличие файлов: статус 'present' или 'missing'."""
+        return self._run(label, self._check_one, list(dict.fromkeys(str(p) for p in paths)))
@@ -0,0 +1,184 @@
+"""
+Очередь фоновых задач в БД (модель Job), выполняется командой run_worker.
+
+Запрос только ставит задачу (enqueue) и сразу отвечает; тяжёлая работа —
+пережатие загруженных изображений, удаление EXIF, создание превью — идёт в воркере.
+"""
+
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Job
+
+log = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+# Задержка перед повтором: RETRY_BASE_DELAY * 2 ** (attempts - 1) секунд
+RETRY_BASE_DELAY = 30
+# Задача в статусе running дольше этого считается брошенной (воркер упал)
+STALE_AFTER = 10 * 60
+# Выполненные и окончательно упавшие задачи хранятся столько, затем удаляются (purge_finished)
+KEEP_FINISHED = 7 * 24 * 60 * 60
+
+
+def handler(kind):
+    """Регистрирует обработчик задач типа kind: fn(**payload)."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue(kind, dedupe_key='', delay=0, max_attempts=3, **payload):
+    """Поставить задачу. С dedupe_key новая не ставится, пока такая же ждёт в очереди
+    (выполняющаяся не считается — она могла прочитать уже устаревшие данные).
+    Возвращает Job (существующую при дедупликации)."""
+    if dedupe_key:
+        existing = Job.objects.filter(dedupe_key=dedupe_key, status=Job.STATUS_PENDING).first()
+        if existing is not None:
+            return existing
+    return Job.objects.create(
+        kind=kind,
+        payload=payload,
+        dedupe_key=dedupe_key,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def failed_recently(dedupe_key, seconds):
+    """Задача с таким ключом окончательно упала за последние seconds секунд."""
+    return Job.objects.filter(
+        dedupe_key=dedupe_key,
+        status=Job.STATUS_FAILED,
+        updated_at__gte=timezone.now() - timedelta(seconds=seconds),
+    ).exists()
+
+
+def purge_finished(keep=KEEP_FINISHED):
+    """Удалить выполненные и окончательно упавшие задачи старше keep секунд. Возвращает их число."""
+    deleted, _ = Job.objects.filter(
+        status__in=(Job.STATUS_DONE, Job.STATUS_FAILED),
+        updated_at__lt=timezone.now() - timedelta(seconds=keep),
+    ).delete()
+    return deleted
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(worker_id, stale_after=STALE_AFTER):
+    """Взять одну готовую к выполнению задачу. Захват — условный UPDATE,
+    поэтому несколько процессов не возьмут одну и ту же задачу."""
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=stale_after)
+    candidates = (
+        Job.objects.filter(status=Job.STATUS_PENDING, run_after__lte=now)
+        | Job.objects.filter(status=Job.STATUS_RUNNING, locked_at__lt=stale_before)
+    ).order_by('run_after', 'id').values_list('id', 'status', 'locked_at')[:10]
+    for job_id, status, locked_at in candidates:
+        taken = Job.objects.filter(id=job_id, status=status, locked_at=locked_at).update(
+            status=Job.STATUS_RUNNING, locked_by=worker_id, locked_at=now, updated_at=now,
+        )
+        if taken:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    """Выполнить захваченную задачу; при ошибке — повтор с экспоненциальной задержкой."""
+    job.attempts += 1
+    fn = HANDLERS.get(job.kind)
+    try:
+        if fn is None:
+            raise LookupError(f'Unknown job kind: {job.kind}')
+        fn(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if fn is None or job.attempts >= job.max_attempts:
+            job.status = Job.STATUS_FAILED
+            log.error('Job %s failed permanently', job, exc_info=True)
+        else:
+            job.status = Job.STATUS_PENDING
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+            log.warning('Job %s failed, retry at %s', job, job.run_after, exc_info=True)
+    else:
+        job.status = Job.STATUS_DONE
+        job.last_error = ''
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=['attempts', 'status', 'run_after', 'last_error', 'locked_by', 'locked_at', 'updated_at'])
+    return job.status == Job.STATUS_DONE
+
+
+def run_pending(worker_id=None, limit=None):
+    """Выполнить готовые задачи в текущем процессе (для --once и тестов). Возвращает число задач."""
+    worker_id = worker_id or default_worker_id()
+    count = 0
+    while limit is None or count < limit:
+        job = claim(worker_id)
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def enqueue_image_processing(instance, *fields):
+    """Поставить обработку загруженных файлов instance.<field> (после коммита транзакции).
+    Без очереди (JOBS_ENABLED=false) — обработать прямо после коммита, в запросе."""
+    label = instance._meta.label
+    jobs_enabled = getattr(settings, 'JOBS_ENABLED', False)
+    for field in fields:
+        if not getattr(instance, field):
+            continue
+        if not jobs_enabled:
+            # robust: ошибка обработки не должна ронять уже сохранивший данные запрос
+            transaction.on_commit(
+                lambda field=field: process_image(model=label, pk=instance.pk, field=field), robust=True,
+            )
+            continue
+        transaction.on_commit(lambda field=field: enqueue(
+            'process_image',
+            dedupe_key=f'process_image:{label}:{instance.pk}:{field}',
+            model=label, pk=instance.pk, field=field,
+        ))
+
+
+@handler('process_image')
+def process_image(model, pk, field):
+    """Пережать загруженный оригинал (EXIF, размер) и создать превью."""
+    from . import signals, thumbnails
+
+    obj = apps.get_model(model).objects.filter(pk=pk).first()
+    if obj is None:
+        return
+    name = getattr(obj, field).name
+    if not name:
+        return
+    thumbnails.optimize_original(name)
+    if not thumbnails.generate_renditions(name, overwrite=True):
+        raise OSError(f'Cannot generate renditions for {name}')
+    # Страницы могли закэшироваться с оригиналом без srcset
+    signals.invalidate_instance(obj)
+
+
+@handler('generate_renditions')
+def generate_renditions(name):
+    """Ленивое создание превью для старых файлов. Кэш страниц не сбрасываем:
+    таких задач много на одну страницу, srcset появится при истечении кэша.
+    Ошибка — повтор; после последней попытки файл не ставится снова FAILED_TTL."""
+    from . import thumbnails
+
+    if not thumbnails.generate_renditions(name):
+        raise OSError(f'Cannot generate renditions for {name}')
@@ -0,0 +1,256 @@
+"""
+Потоковый парсер MySQL-дампов старого сайта (VirtueMart / JShopping: old/*.sql).
+
+Дамп читается кусками по chunk_size символов за один проход, поэтому память
+не зависит от размера файла, а строки всех нужных таблиц разбираются сразу —
+команды импорта не перечитывают файл ради каждой таблицы:
+
+    for table, row in iter_rows(path, ['wzx3q_jshopping_attr', 'wzx3q_jshopping_products']):
+        ...
+
+Значения в строках типизированы: NULL -> None, строки в кавычках -> str
+(экранирование MySQL раскрыто), целые -> int, дробные -> Decimal, прочее
+(0x..., CURRENT_TIMESTAMP) — как записано в дампе.
+"""
+
+import re
+from decimal import Decimal
+
+CHUNK_SIZE = 1 << 20
+# Сколько символов должно быть в буфере перед разбором начала оператора:
+# заголовок INSERT со списком колонок JShopping занимает несколько килобайт
+LOOKAHEAD = 64 * 1024
+
+# Строка в кавычках: развёрнутый цикл без вложенных квантификаторов,
+# чтобы незакрытая на границе куска строка не вызывала экспоненциальный откат
+_STRING = r"'([^'\\]*(?:(?:\\.|'')[^'\\]*)*)'"
+
+_SPACE_RE = re.compile(r'(?:\s+|--[^\n]*\n|#[^\n]*\n|/\*.*?\*/;?)*', re.S)
+_INSERT_RE = re.compile(
+    r'(?:INSERT|REPLACE)(?:\s+(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|IGNORE))*\s+INTO\s+'
+    r'`?([^`\s(]+)`?\s*(?:\(([^)]*)\)\s*)?VALUES\s*',
+    re.I,
+)
+_CREATE_RE = re.compile(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?`?([^`\s(]+)`?\s*\(', re.I)
+_VALUE_RE = re.compile(r"\s*(?:" + _STRING + r"|([^,)\s']+))\s*([,)])", re.S)
+_ROW_END_RE = re.compile(r'\s*([,;])')
+# До конца оператора: всё, кроме кавычек и ';', плюс строки целиком
+_SKIP_RE = re.compile(r"[^';]*(?:'[^'\\]*(?:\\.[^'\\]*)*'[^';]*)*")
+_COLUMN_RE = re.compile(r'^\s*`([^`]+)`\s', re.M)
+_QUOTED_NAME_RE = re.compile(r'`([^`]+)`')
+_INT_RE = re.compile(r'[-+]?\d+')
+_DECIMAL_RE = re.compile(r'[-+]?(?:\d+\.\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?\d+[eE][-+]?\d+')
+
+_ESCAPE_RE = re.compile(r"\\(.)|''", re.S)
+_ESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+
+
+class DumpError(ValueError):
+    """Дамп оборвался или повреждён посреди оператора."""
+
+
+def _unescape(match):
+    char = match.group(1)
+    if char is None:
+        return "'"
+    return _ESCAPES.get(char, char)
+
+
+def _typed(literal):
+    if literal.upper() == 'NULL':
+        return None
+    if _INT_RE.fullmatch(literal):
+        return int(literal)
+    if _DECIMAL_RE.fullmatch(literal):
+        return Decimal(literal)
+    return literal
+
+
+class DumpReader:
+    """Итератор (table, row) по INSERT-ам дампа для таблиц tables (None — все таблицы).
+
+    columns[table] — имена колонок: из списка колонок INSERT, а если его нет —
+    из CREATE TABLE. В дампах оба идут раньше данных, поэтому к первой строке
+    таблицы имена уже известны. bytes_read — сколько байт файла прочитано.
+    """
+
+    def __init__(self, path, tables=None, *, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+        self.path = path
+        self.tables = None if tables is None else frozenset(tables)
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.columns = {}
+        self.bytes_read = 0
+
+    def _wanted(self, table):
+        return self.tables is None or table in self.tables
+
+    # --- буфер ---
+
+    def _fill(self):
+        """Дочитать кусок; всё до self._pos отбрасывается. False — файл кончился."""
+        chunk = self._fh.read(self.chunk_size) if not self._eof else ''
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        if not chunk:
+            self._eof = True
+        self.bytes_read = self._fh.buffer.tell()
+        return bool(chunk)
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding=self.encoding, errors='replace') as fh:
+            self._fh = fh
+            self._buf = ''
+            self._pos = 0
+            self._eof = False
+            try:
+                yield from self._statements()
+            finally:
+                self._fh = None
+                self._buf = ''
+
+    # --- операторы ---
+
+    def _statements(self):
+        while True:
+            if len(self._buf) - self._pos < LOOKAHEAD and not self._eof:
+                self._fill()
+                continue
+            self._pos = _SPACE_RE.match(self._buf, self._pos).end()
+            if self._pos >= len(self._buf):
+                if self._eof:
+                    return
+                self._fill()
+                continue
+
+            m = _INSERT_RE.match(self._buf, self._pos)
+            if m and self._wanted(m.group(1)):
+                table = m.group(1)
+                if m.group(2) is not None:
+                    self.columns[table] = _QUOTED_NAME_RE.findall(m.group(2))
+                self._pos = m.end()
+                for row in self._rows():
+                    yield table, row
+                continue
+
+            m = _CREATE_RE.match(self._buf, self._pos)
+            if m and self._wanted(m.group(1)):
+                body = self._skip_statement(keep=True)
+                self.columns.setdefault(m.group(1), _COLUMN_RE.findall(body))
+                continue
+
+            self._skip_statement()
+
+    def _skip_statement(self, keep=False):
+        """Пропустить оператор до ';' вне строк. keep=True — вернуть его текст."""
+        parts = []
+        while True:
+            start = self._pos
+            end = _SKIP_RE.match(self._buf, start).end()
+            if keep:
+                parts.append(self._buf[start:end])
+            if end < len(self._buf) and self._buf[end] == ';':
+                self._pos = end + 1
+                return ''.join(parts)
+            # Конец буфера или незакрытая строка — читаем дальше с этого места
+            self._pos = end
+            if not self._fill():
+                if self._pos < len(self._buf):
+                    raise DumpError(f'{self.path}: незакрытая строка в конце дампа')
+                self._pos = len(self._buf)
+                return ''.join(parts)
+
+    def _rows(self):
+        """Строки VALUES (...), (...); текущего INSERT."""
+        while True:
+            row, end = self._parse_row(self._pos)
+            if row is None:
+                if not self._fill():
+                    raise DumpError(f'{self.path}: оборванный INSERT в конце дампа')
+                continue
+            m = _ROW_END_RE.match(self._buf, end)
+            if m is None:
+                if self._buf[end:].strip():
+                    raise DumpError(f'{self.path}: ожидалась "," или ";" после строки VALUES')
+                # Разделитель ещё не прочитан; строка разберётся заново из нового буфера
+                if self._fill():
+                    continue
+                # Последний оператор дампа без ';'
+                self._pos = len(self._buf)
+                yield row
+                return
+            self._pos = m.end()
+            yield row
+            if m.group(1) == ';':
+                return
+
+    def _parse_row(self, pos):
+        """(кортеж значений, позиция после ')') или (None, None), если строка не влезла в буфер."""
+        buf = self._buf
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if pos >= len(buf):
+            return None, None
+        if buf[pos] != '(':
+            raise DumpError(f'{self.path}: ожидалась "(" в VALUES, найдено {buf[pos:pos + 20]!r}')
+        pos += 1
+        values = []
+        while True:
+            m = _VALUE_RE.match(buf, pos)
+            if m is None:
+                if buf.startswith(')', pos) and not values:
+                    return (), pos + 1
+                return None, None
+            string, literal, delimiter = m.groups()
+            if string is not None:
+                if '\\' in string or "''" in string:
+                    string = _ESCAPE_RE.sub(_unescape, string)
+                values.append(string)
+            else:
+                values.append(_typed(literal))
+            pos = m.end()
+            if delimiter == ')':
+                return tuple(values), pos
+
+
+def iter_rows(path, tables=None, **kwargs):
+    """Один проход по дампу: (table, row) для строк таблиц tables в порядке файла."""
+    return iter(DumpReader(path, tables, **kwargs))
+
+
+def read_tables(path, handlers, **kwargs):
+    """Один проход по дампу с раздачей строк: handlers = {table: fn(row)}.
+
+    Возвращает {table: число строк}.
+    """
+    counts = dict.fromkeys(handlers, 0)
+    for table, row in DumpReader(path, handlers, **kwargs):
+        handlers[table](row)
+        counts[table] += 1
+    return counts
+
+
+def read_dicts(path, handlers, **kwargs):
+    """Как read_tables, но строки — dict по именам колонок (для дампов, где
+    порядок колонок не фиксирован). Строки, у которых число значений не совпадает
+    с числом колонок, пропускаются. Возвращает {table: число переданных строк}."""
+    counts = dict.fromkeys(handlers, 0)
+    reader = DumpReader(path, handlers, **kwargs)
+    for table, row in reader:
+        columns = reader.columns.get(table)
+        if columns and len(columns) == len(row):
+            handlers[table](dict(zip(columns, row)))
+            counts[table] += 1
+    return counts
+
+
+def iter_dicts(path, table, **kwargs):
+    """Строки одной таблицы как dict по именам колонок.
+
+    Строки, у которых число значений не совпадает с числом колонок, пропускаются.
+    """
+    reader = DumpReader(path, [table], **kwargs)
+    for _, row in reader:
+        columns = reader.columns.get(table)
+        if columns and len(columns) == len(row):
+            yield dict(zip(columns, row))
@@ -0,0 +1,49 @@
+"""
+Пересчитывает Product.primary_image_url (uploaded_image → image) для всех товаров.
+Нужна после миграции и после массовых импортов через update()/bulk_create,
+которые не вызывают Product.save().
+"""
+from django.core.management.base import BaseCommand
+
+from shop import page_cache
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает готовый URL основного изображения товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки bulk_update')
+        parser.add_argument('--dry-run', action='store_true', help='Не сохранять, только показать')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        qs = Product.objects.only('id', 'image', 'uploaded_image', 'primary_image_url').order_by('id')
+        pending = []
+        checked = 0
+        updated = 0
+        for product in qs.iterator(chunk_size=batch_size):
+            checked += 1
+            resolved = product.resolve_primary_image_url()
+            if resolved == product.primary_image_url:
+                continue
+            product.primary_image_url = resolved
+            pending.append(product)
+            if len(pending) >= batch_size:
+                updated += self._flush(pending, dry_run)
+        updated += self._flush(pending, dry_run)
+        if updated and not dry_run:
+            # bulk_update не шлёт post_save — сбрасываем кэш страниц вручную
+            page_cache.invalidate(page_cache.SITE_GROUP)
+
+        prefix = '[DRY RUN] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(f'{prefix}Проверено: {checked}, обновлено: {updated}'))
+
+    def _flush(self, pending, dry_run):
+        count = len(pending)
+        if count and not dry_run:
+            Product.objects.bulk_update(pending, ['primary_image_url'])
+        pending.clear()
+        return count
@@ -1,16 +1,20 @@
 """
-Проверяет наличие файлов изображений товаров.
+Проверяет наличие файлов изображений товаров (параллельно, см. shop/file_sync.py).
 """
 
 import os
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from shop.file_sync import DEFAULT_WORKERS, MISSING, PRESENT, FileSync
 from shop.models import Product, ProductImage
 
 
 class Command(BaseCommand):
     help = 'Проверяет наличие файлов изображений товаров'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Потоков для проверки файлов')
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('\nПроверка изображений товаров...\n'))
 
@@ -22,19 +26,19 @@ class Command(BaseCommand):
         self.stdout.write(f'Всего записей изображений: {total_images}')
 
         # Проверяем наличие файлов
-        missing_files = []
-        existing_files = 0
-
         self.stdout.write('\nПроверка наличия файлов...')
 
-        for img in ProductImage.objects.all():
-            file_path = os.path.join(settings.MEDIA_ROOT, img.image.name)
-            if os.path.exists(file_path):
-                existing_files += 1
-            else:
-                missing_files.append(img.image.name)
+        names = list(ProductImage.objects.values_list('image', flat=True))
+        report = FileSync(workers=options['workers'], log=self.stdout.write).check(
+            os.path.join(settings.MEDIA_ROOT, name) for name in names
+        )
+        status = {name: report.results[os.path.join(settings.MEDIA_ROOT, name)] for name in names}
+        missing_files = [name for name in dict.fromkeys(names) if status[name] == MISSING]
 
-        self.stdout.write(self.style.SUCCESS(f'\nСуществующих файлов: {existing_files}'))
+        self.stdout.write(self.style.SUCCESS(f'\nСуществующих файлов: {report.count(PRESENT)}'))
+        self.stdout.write(report.summary())
+        for path, error in report.errors.items():
+            self.stdout.write(self.style.ERROR(f'Ошибка чтения {path}: {error}'))
 
         if missing_files:
             self.stdout.write(self.style.WARNING(f'Отсутствующих файлов: {len(missing_files)}'))
@@ -57,9 +61,7 @@ class Command(BaseCommand):
         for p in Product.objects.filter(images__isnull=False).distinct()[:5]:
             self.stdout.write(self.style.SUCCESS(f'\n{p.title[:50]}:'))
             for img in p.images.all()[:3]:
-                file_path = os.path.join(settings.MEDIA_ROOT, img.image.name)
-                exists = os.path.exists(file_path)
-                status = '[OK]' if exists else '[MISSING]'
-                self.stdout.write(f'  {status} {img.image.name}')
+                exists = status.get(img.image.name) == PRESENT
+                self.stdout.write(f"  {'[OK]' if exists else '[MISSING]'} {img.image.name}")
 
         self.stdout.write('\n' + '='*60)
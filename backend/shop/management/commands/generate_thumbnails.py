@@ -0,0 +1,51 @@
+"""
+Заранее создаёт адаптивные превью (320/640/1280, WebP + JPEG) для загруженных
+изображений: Product.uploaded_image, ProductImage, HeroBanner (desktop/mobile), StorePhoto.
+Без этой команды превью создаются лениво при первом показе.
+"""
+from django.core.management.base import BaseCommand
+
+from shop import thumbnails
+from shop.models import HeroBanner, Product, ProductImage, StorePhoto
+
+SOURCES = {
+    'product': (Product, ('uploaded_image',)),
+    'product_image': (ProductImage, ('image',)),
+    'hero': (HeroBanner, ('desktop_image', 'mobile_image')),
+    'store_photo': (StorePhoto, ('image',)),
+}
+
+
+class Command(BaseCommand):
+    help = 'Генерирует превью изображений (srcset) для товаров, баннеров и фото магазинов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only', choices=sorted(SOURCES), action='append',
+            help='Обработать только указанные источники (можно несколько раз)',
+        )
+        parser.add_argument('--overwrite', action='store_true', help='Пересоздать уже существующие превью')
+
+    def handle(self, *args, **options):
+        selected = options['only'] or sorted(SOURCES)
+        total_ok = 0
+        total_failed = 0
+        for key in selected:
+            model, fields = SOURCES[key]
+            names = set()
+            for row in model.objects.values_list(*fields):
+                names.update(thumbnails.media_name(value) for value in row)
+            names.discard('')
+
+            ok = failed = 0
+            for name in sorted(names):
+                if thumbnails.generate_renditions(name, overwrite=options['overwrite']):
+                    ok += 1
+                else:
+                    failed += 1
+            total_ok += ok
+            total_failed += failed
+            self.stdout.write(f'{key}: готово {ok}, ошибок {failed}')
+
+        style = self.style.SUCCESS if not total_failed else self.style.WARNING
+        self.stdout.write(style(f'Итого: готово {total_ok}, ошибок {total_failed}'))
@@ -7,10 +7,8 @@
   wzx3q_jshopping_products_attr2 : product_id, attr_id, addcount (количество — игнорируем)
 
 Что делает:
-  1. Читает SQL-файл
-  2. Парсит таблицу attr -> dict {attr_id: flower_name}
-  3. Парсит таблицу products -> dict {product_id: article}
-  4. Парсит таблицу products_attr2 -> dict {product_id: [attr_id, ...]}
+  1-4. За один проход по SQL-файлу парсит таблицы attr -> {attr_id: flower_name},
+       products -> {product_id: article}, products_attr2 -> {product_id: [attr_id, ...]}
   5. Собирает: article -> [flower_name, ...]
   6. Создаёт/обновляет FlowerTag объекты (get_or_create)
   7. Привязывает теги к Product по артикулу (add — не заменяет, а дополняет)
@@ -27,8 +25,8 @@
 """
 
 import os
-import re
 from django.core.management.base import BaseCommand
+from shop import legacy_sql
 from shop.models import Product, FlowerTag
 
 
@@ -37,183 +35,54 @@ DEFAULT_SQL = os.path.join(
 )
 
 
-def parse_fields(row_str):
-    """Парсит одну строку VALUES (...) в список значений."""
-    fields = []
-    cur = []
-    in_q = False
-    dep = 0
-    i = 0
-    s = row_str + ','
-    L = len(s)
-    while i < L:
-        ch = s[i]
-        if in_q:
-            if ch == '\\' and i + 1 < L:
-                cur.append(ch)
-                cur.append(s[i + 1])
-                i += 2
-                continue
-            elif ch == "'":
-                if i + 1 < L and s[i + 1] == "'":
-                    cur.append("'")
-                    i += 2
-                    continue
-                in_q = False
-                cur.append(ch)
-            else:
-                cur.append(ch)
-        else:
-            if ch == "'":
-                in_q = True
-                cur.append(ch)
-            elif ch == '(' and not in_q:
-                dep += 1
-                cur.append(ch)
-            elif ch == ')' and dep > 0 and not in_q:
-                dep -= 1
-                cur.append(ch)
-            elif ch == ',' and dep == 0 and not in_q:
-                val = ''.join(cur).strip()
-                if val.startswith("'") and val.endswith("'"):
-                    val = val[1:-1].replace("\\'", "'").replace('\\\\', '\\')
-                elif val.upper() == 'NULL':
-                    val = None
-                fields.append(val)
-                cur = []
-            else:
-                cur.append(ch)
-        i += 1
-    return fields
-
-
-def iter_insert_rows(sql, table_name):
-    """Итератор по строкам INSERT INTO `table_name` VALUES (...)."""
-    search_str = f'INSERT INTO `{table_name}`'
-    start_pos = 0
-    L = len(sql)
-    while True:
-        idx = sql.find(search_str, start_pos)
-        if idx < 0:
-            break
-        val_idx = sql.find('VALUES', idx)
-        if val_idx < 0:
-            break
-        val_idx += len('VALUES')
-        while val_idx < L and sql[val_idx] in ' \t\r\n':
-            val_idx += 1
-
-        pos = val_idx
-        in_q = False
-        while pos < L:
-            while pos < L:
-                if not in_q and sql[pos] == ';':
-                    break
-                if not in_q and sql[pos] == '(':
-                    break
-                if sql[pos] == "'" and not in_q:
-                    in_q = True
-                    pos += 1
-                    continue
-                if sql[pos] == "'" and in_q:
-                    in_q = False
-                    pos += 1
-                    continue
-                pos += 1
-            if pos >= L or (sql[pos] == ';' and not in_q):
-                break
-            pos += 1  # пропускаем '('
-
-            depth = 0
-            in_q2 = False
-            start = pos
-            while pos < L:
-                ch = sql[pos]
-                if in_q2:
-                    if ch == '\\' and pos + 1 < L:
-                        pos += 2
-                        continue
-                    elif ch == "'":
-                        in_q2 = False
-                elif ch == "'":
-                    in_q2 = True
-                elif ch == '(':
-                    depth += 1
-                elif ch == ')':
-                    if depth == 0:
-                        break
-                    depth -= 1
-                pos += 1
-            row_str = sql[start:pos]
-            pos += 1
-            if row_str.strip():
-                yield parse_fields(row_str)
-            while pos < L and sql[pos] in ' \t\r\n,':
-                pos += 1
-            if pos < L and sql[pos] == ';':
-                break
-
-        start_pos = pos + 1
-
-
-def extract_attrs(sql):
+def read_dump(path, **kwargs):
     """
-    Парсит wzx3q_jshopping_attr.
-    Структура: attr_id, attr_ordering, attr_type, independent, allcats, cats,
-               group, name_en-GB, description_en-GB, name_ru-RU, description_ru-RU
-    Возвращает dict: attr_id (int) -> flower_name (str)
+    Один проход по дампу (shop.legacy_sql). Возвращает (attrs, products, product_attrs):
+
+    attrs         — wzx3q_jshopping_attr: attr_id, attr_ordering, attr_type, independent, allcats,
+                    cats, group, name_en-GB, description_en-GB, name_ru-RU (9), description_ru-RU
+                    -> dict attr_id (int) -> flower_name (str)
+    products      — wzx3q_jshopping_products: product_id (0), parent_id (1), product_ean (2), ...
+                    -> dict product_id (int) -> article (str)
+    product_attrs — wzx3q_jshopping_products_attr2: id (0), product_id (1), attr_id (2),
+                    attr_value_id (3), price_mod (4), addprice (5), addcount (6)
+                    -> dict product_id (int) -> set of attr_id (int)
     """
     attrs = {}
-    for fields in iter_insert_rows(sql, 'wzx3q_jshopping_attr'):
+    products = {}
+    product_attrs = {}
+
+    def add_attr(fields):
         if len(fields) >= 10:
             try:
-                attr_id = int(fields[0])
                 name_ru = (fields[9] or '').strip()
                 if name_ru:
-                    attrs[attr_id] = name_ru
-            except (ValueError, TypeError):
+                    attrs[int(fields[0])] = name_ru
+            except (ValueError, TypeError, AttributeError):
                 pass
-    return attrs
-
 
-def extract_products(sql):
-    """
-    Парсит wzx3q_jshopping_products — берём product_id и product_ean (артикул).
-    Структура: product_id (0), parent_id (1), product_ean (2), ...
-    Возвращает dict: product_id (int) -> article (str)
-    """
-    products = {}
-    for fields in iter_insert_rows(sql, 'wzx3q_jshopping_products'):
+    def add_product(fields):
         if len(fields) >= 3:
             try:
-                product_id = int(fields[0])
-                article = (fields[2] or '').strip()
+                article = str(fields[2] or '').strip()
                 if article:
-                    products[product_id] = article
+                    products[int(fields[0])] = article
             except (ValueError, TypeError):
                 pass
-    return products
-
 
-def extract_product_attrs(sql):
-    """
-    Парсит wzx3q_jshopping_products_attr2.
-    Структура: id (0), product_id (1), attr_id (2), attr_value_id (3),
-               price_mod (4), addprice (5), addcount (6)
-    Возвращает dict: product_id (int) -> set of attr_id (int)
-    """
-    result = {}
-    for fields in iter_insert_rows(sql, 'wzx3q_jshopping_products_attr2'):
+    def add_product_attr(fields):
         if len(fields) >= 3:
             try:
-                product_id = int(fields[1])
-                attr_id = int(fields[2])
-                if product_id not in result:
-                    result[product_id] = set()
-                result[product_id].add(attr_id)
+                product_attrs.setdefault(int(fields[1]), set()).add(int(fields[2]))
             except (ValueError, TypeError):
                 pass
-    return result
+
+    legacy_sql.read_tables(path, {
+        'wzx3q_jshopping_attr': add_attr,
+        'wzx3q_jshopping_products': add_product,
+        'wzx3q_jshopping_products_attr2': add_product_attr,
+    }, **kwargs)
+    return attrs, products, product_attrs
 
 
 class Command(BaseCommand):
@@ -249,22 +118,11 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR(f'Файл не найден: {sql_path}'))
             return
 
-        # --- Загрузка SQL ---
-        self.stdout.write(f'Читаю SQL: {sql_path}')
-        with open(sql_path, 'r', encoding='utf-8', errors='replace') as f:
-            sql = f.read()
-        self.stdout.write(f'  Загружено байт: {len(sql):,}')
-
-        # --- Парсинг ---
-        self.stdout.write('\nПарсинг таблиц...')
-
-        attrs = extract_attrs(sql)
+        # --- Парсинг (один проход по файлу) ---
+        self.stdout.write(f'Читаю SQL: {sql_path} ({os.path.getsize(sql_path):,} байт)')
+        attrs, products, product_attrs = read_dump(sql_path)
         self.stdout.write(f'  Цветков в словаре (jshopping_attr): {len(attrs)}')
-
-        products = extract_products(sql)
         self.stdout.write(f'  Товаров в SQL (jshopping_products): {len(products)}')
-
-        product_attrs = extract_product_attrs(sql)
         self.stdout.write(f'  Товаров с составом (jshopping_products_attr2): {len(product_attrs)}')
 
         # --- Сборка: article -> [flower_name, ...] ---
@@ -3,13 +3,13 @@ from __future__ import annotations
 from dataclasses import dataclass
 from decimal import Decimal, InvalidOperation
 from pathlib import Path
-import re
 import shutil
-from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 
+from shop import legacy_sql
 from shop.models import Category, Product
 
 
@@ -182,140 +182,8 @@ class Command(BaseCommand):
 
 
 def iter_table_rows(sql_path: Path, table_name: str) -> Iterator[Dict[str, object]]:
-    prefix = f"INSERT INTO `{table_name}`"
-    buffer: List[str] = []
-    collecting = False
-
-    with sql_path.open("r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            if not collecting:
-                if line.startswith(prefix):
-                    collecting = True
-                    buffer = [line]
-                    if line.rstrip().endswith(";"):
-                        yield from parse_insert_statement("".join(buffer))
-                        collecting = False
-                        buffer = []
-            else:
-                buffer.append(line)
-                if line.rstrip().endswith(";"):
-                    yield from parse_insert_statement("".join(buffer))
-                    collecting = False
-                    buffer = []
-
-
-def parse_insert_statement(statement: str) -> Iterator[Dict[str, object]]:
-    match = re.match(
-        r"INSERT INTO `[^`]+` \((?P<cols>.+?)\) VALUES\s*(?P<values>.+);\s*$",
-        statement,
-        flags=re.S,
-    )
-    if not match:
-        return
-
-    cols = re.findall(r"`([^`]+)`", match.group("cols"))
-    values_blob = match.group("values").strip()
-
-    for row_blob in split_rows(values_blob):
-        raw_values = split_fields(row_blob[1:-1])
-        parsed_values = [parse_sql_value(v.strip()) for v in raw_values]
-        if len(parsed_values) != len(cols):
-            continue
-        yield dict(zip(cols, parsed_values))
-
-
-def split_rows(values_blob: str) -> List[str]:
-    rows: List[str] = []
-    in_quote = False
-    escape = False
-    depth = 0
-    start = -1
-
-    for i, ch in enumerate(values_blob):
-        if in_quote:
-            if escape:
-                escape = False
-            elif ch == "\\":
-                escape = True
-            elif ch == "'":
-                in_quote = False
-            continue
-
-        if ch == "'":
-            in_quote = True
-            continue
-        if ch == "(":
-            depth += 1
-            if depth == 1:
-                start = i
-            continue
-        if ch == ")":
-            depth -= 1
-            if depth == 0 and start >= 0:
-                rows.append(values_blob[start : i + 1])
-            continue
-
-    return rows
-
-
-def split_fields(row_blob: str) -> List[str]:
-    fields: List[str] = []
-    in_quote = False
-    escape = False
-    token: List[str] = []
-
-    for ch in row_blob:
-        if in_quote:
-            token.append(ch)
-            if escape:
-                escape = False
-            elif ch == "\\":
-                escape = True
-            elif ch == "'":
-                in_quote = False
-            continue
-
-        if ch == "'":
-            in_quote = True
-            token.append(ch)
-            continue
-        if ch == ",":
-            fields.append("".join(token))
-            token = []
-            continue
-        token.append(ch)
-
-    fields.append("".join(token))
-    return fields
-
-
-def parse_sql_value(token: str) -> object:
-    upper = token.upper()
-    if upper == "NULL":
-        return None
-
-    if token.startswith("'") and token.endswith("'"):
-        value = token[1:-1]
-        value = value.replace("\\\\", "\\")
-        value = value.replace("\\'", "'")
-        value = value.replace("\\r", "\r")
-        value = value.replace("\\n", "\n")
-        value = value.replace("\\t", "\t")
-        return value
-
-    if re.fullmatch(r"-?\d+", token):
-        try:
-            return int(token)
-        except ValueError:
-            return token
-
-    if re.fullmatch(r"-?\d+\.\d+", token):
-        try:
-            return Decimal(token)
-        except InvalidOperation:
-            return token
-
-    return token
+    """Строки таблицы как dict по именам колонок (потоковый парсер shop.legacy_sql)."""
+    return legacy_sql.iter_dicts(sql_path, table_name)
 
 
 def first_by_key(rows: Iterable[Dict[str, object]], key_name: str) -> Dict[int, Dict[str, object]]:
@@ -4,23 +4,28 @@ from collections import defaultdict
 from dataclasses import dataclass
 from decimal import Decimal
 from pathlib import Path
-import shutil
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 
-from shop.management.commands.import_joomla_catalog import int_or_zero, iter_table_rows, parse_price, safe_str
+from shop.bulk_import import (
+    DEFAULT_BATCH_SIZE, BulkWriter, diff_links, diff_objects, fill_product_slugs, products_by_article, stale_products,
+)
+from shop.file_sync import DEFAULT_WORKERS, FileSync
+from shop import legacy_sql
+from shop.management.commands.import_joomla_catalog import int_or_zero, parse_price, safe_str
 from shop.models import Category, Product, ProductImage, Store
 
 
+# Product fields taken from the dump; slug, showcase and publishing are edited on the site.
+SYNC_FIELDS = ["title", "description", "price", "category", "image", "uploaded_image", "import_source"]
+
+
 @dataclass
 class ImportStats:
     categories_created: int = 0
-    products_created: int = 0
-    product_images_created: int = 0
-    image_files_copied: int = 0
     images_missing: int = 0
     products_without_image: int = 0
 
@@ -83,32 +88,89 @@ def choose_article(row: Dict[str, object], product_id: int) -> str:
     return f"JS{product_id}"
 
 
-def build_product_category_map(rows: Iterable[Dict[str, object]]) -> Dict[int, List[Tuple[int, int]]]:
-    by_product: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
-    for row in rows:
+@dataclass
+class LegacyCategory:
+    legacy_id: int
+    parent_id: int
+    ordering: int
+    name: str
+
+
+@dataclass
+class LegacyProduct:
+    product_id: int
+    title: str
+    description: str
+    price: Decimal
+    article: str
+    image: str
+
+
+class JShoppingDump:
+    """Published categories and products with their category/image refs, collected in
+    one streaming pass over the dump (shop.legacy_sql). Only the fields the import
+    uses are kept, never the full rows."""
+
+    TABLES = (
+        "wzx3q_jshopping_categories",
+        "wzx3q_jshopping_products",
+        "wzx3q_jshopping_products_to_categories",
+        "wzx3q_jshopping_products_images",
+    )
+
+    def __init__(self):
+        self.categories: List[LegacyCategory] = []
+        self.products: List[LegacyProduct] = []
+        self.product_categories: Dict[int, List[Tuple[int, int]]] = defaultdict(list)  # (ordering, category_id)
+        self.product_images: Dict[int, List[Tuple[int, str]]] = defaultdict(list)  # (ordering, image_name)
+        self.rows = 0
+
+    @classmethod
+    def read(cls, path: Path, **kwargs) -> "JShoppingDump":
+        dump = cls()
+        counts = legacy_sql.read_dicts(path, dict(zip(cls.TABLES, (
+            dump.add_category, dump.add_product, dump.add_product_category, dump.add_product_image,
+        ))), **kwargs)
+        dump.rows = sum(counts.values())
+        for refs in dump.product_categories.values():
+            refs.sort()
+        for refs in dump.product_images.values():
+            refs.sort()
+        return dump
+
+    def add_category(self, row: Dict[str, object]) -> None:
+        legacy_id = int_or_zero(row.get("category_id"))
+        name = choose_category_name(row)
+        if legacy_id <= 0 or not name or int_or_zero(row.get("category_publish")) != 1:
+            return
+        self.categories.append(LegacyCategory(
+            legacy_id, int_or_zero(row.get("category_parent_id")), int_or_zero(row.get("ordering")), name,
+        ))
+
+    def add_product(self, row: Dict[str, object]) -> None:
+        product_id = int_or_zero(row.get("product_id"))
+        if product_id <= 0 or int_or_zero(row.get("product_publish")) != 1:
+            return
+        self.products.append(LegacyProduct(
+            product_id=product_id,
+            title=choose_product_title(row, product_id),
+            description=choose_product_description(row),
+            price=max(parse_price(row.get("product_price")), Decimal("0.00")),
+            article=choose_article(row, product_id),
+            image=safe_str(row.get("image")).strip(),
+        ))
+
+    def add_product_category(self, row: Dict[str, object]) -> None:
         product_id = int_or_zero(row.get("product_id"))
         category_id = int_or_zero(row.get("category_id"))
-        ordering = int_or_zero(row.get("product_ordering"))
         if product_id > 0 and category_id > 0:
-            by_product[product_id].append((ordering, category_id))
-
-    for product_id in by_product:
-        by_product[product_id].sort(key=lambda x: (x[0], x[1]))
-    return by_product
+            self.product_categories[product_id].append((int_or_zero(row.get("product_ordering")), category_id))
 
-
-def build_product_images_map(rows: Iterable[Dict[str, object]]) -> Dict[int, List[Tuple[int, str]]]:
-    by_product: Dict[int, List[Tuple[int, str]]] = defaultdict(list)
-    for row in rows:
+    def add_product_image(self, row: Dict[str, object]) -> None:
         product_id = int_or_zero(row.get("product_id"))
         image_name = safe_str(row.get("image_name")).strip()
-        ordering = int_or_zero(row.get("ordering"))
         if product_id > 0 and image_name:
-            by_product[product_id].append((ordering, image_name))
-
-    for product_id in by_product:
-        by_product[product_id].sort(key=lambda x: (x[0], x[1]))
-    return by_product
+            self.product_images[product_id].append((int_or_zero(row.get("ordering")), image_name))
 
 
 def build_image_index(old_root: Path) -> Dict[str, List[Path]]:
@@ -168,23 +230,37 @@ def unique_dest_name(existing: set, base_name: str) -> str:
         idx += 1
 
 
-def create_unique_category(name: str, parent: Optional[Category], sort_order: int) -> Category:
+def get_or_create_category(
+    name: str, parent: Optional[Category], sort_order: int, claimed: set,
+) -> Tuple[Category, bool]:
+    """Reuse the category with this name under parent, so re-imports keep ids.
+
+    A category already claimed in this run (two legacy categories with the same
+    name) gets a " (2)" suffix, as the original clean import did.
+    """
     base = name[:100]
     candidate = base
     idx = 2
-    while Category.objects.filter(name=candidate, parent=parent).exists():
+    while True:
+        category = Category.objects.filter(name=candidate, parent=parent).order_by("pk").first()
+        if category is None:
+            category = Category.objects.create(name=candidate, parent=parent, sort_order=max(0, sort_order))
+            claimed.add(category.pk)
+            return category, True
+        if category.pk not in claimed:
+            claimed.add(category.pk)
+            return category, False
         suffix = f" ({idx})"
         candidate = f"{base[: 100 - len(suffix)]}{suffix}"
         idx += 1
-    return Category.objects.create(
-        name=candidate,
-        parent=parent,
-        sort_order=max(0, sort_order),
-    )
 
 
 class Command(BaseCommand):
-    help = "Full import from JShopping (buketby_nov.sql): categories -> products -> prices -> images."
+    help = (
+        "Sync the catalog with JShopping (buketby_nov.sql): categories -> products -> prices -> images. "
+        "Products are matched by article; only changed fields are written. "
+        "--prune deletes only products earlier imported from JShopping."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -198,15 +274,34 @@ class Command(BaseCommand):
             help="Path to old Joomla public_html directory.",
         )
         parser.add_argument(
+            "--prune",
             "--clear",
+            dest="prune",
+            action="store_true",
+            help="Delete JShopping-imported products whose article is not in the dump (their images go with them).",
+        )
+        parser.add_argument(
+            "--dry-run",
             action="store_true",
-            help="Delete existing ProductImage, Product and Category records before import.",
+            help="Print the changeset and roll it back.",
         )
         parser.add_argument(
             "--assign-active-stores",
             action="store_true",
             help="Assign all imported products to all active stores.",
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Rows per bulk_create batch.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=DEFAULT_WORKERS,
+            help="Parallel file copy threads.",
+        )
         parser.add_argument(
             "--backend-base-url",
             default="http://127.0.0.1:3002",
@@ -216,7 +311,8 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         dump_path = Path(options["dump"]).resolve()
         old_root = Path(options["old_root"]).resolve()
-        clear_existing = bool(options["clear"])
+        prune = bool(options["prune"])
+        dry_run = bool(options["dry_run"])
         assign_stores = bool(options["assign_active_stores"])
         backend_base_url = safe_str(options["backend_base_url"]).rstrip("/")
 
@@ -226,121 +322,96 @@ class Command(BaseCommand):
             raise CommandError(f"Old root directory not found: {old_root}")
 
         media_products_dir = Path(settings.MEDIA_ROOT) / "products"
-        media_products_dir.mkdir(parents=True, exist_ok=True)
+        if not dry_run:
+            media_products_dir.mkdir(parents=True, exist_ok=True)
         fallback_url = f"{backend_base_url}/static/legacy-old/image/no_image.jpg"
 
         self.stdout.write("Loading JShopping tables from SQL dump...")
-        category_rows = list(iter_table_rows(dump_path, "wzx3q_jshopping_categories"))
-        product_rows = list(iter_table_rows(dump_path, "wzx3q_jshopping_products"))
-        product_row_by_legacy_id = {int_or_zero(r.get("product_id")): r for r in product_rows}
-        product_to_cat_rows = list(iter_table_rows(dump_path, "wzx3q_jshopping_products_to_categories"))
-        product_image_rows = list(iter_table_rows(dump_path, "wzx3q_jshopping_products_images"))
-
-        product_categories = build_product_category_map(product_to_cat_rows)
-        product_images = build_product_images_map(product_image_rows)
+        dump = JShoppingDump.read(dump_path)
+        self.stdout.write(f"Rows read: {dump.rows}")
         image_index = build_image_index(old_root)
 
         stats = ImportStats()
         used_dest_names: set = set()
+        claimed_categories: set = set()
+        writer = BulkWriter(batch_size=options["batch_size"], log=self.stdout.write)
+        file_sync = FileSync(workers=options["workers"], dry_run=dry_run, log=self.stdout.write)
 
         with transaction.atomic():
-            if clear_existing:
-                ProductImage.objects.all().delete()
-                Product.objects.all().delete()
-                Category.objects.all().delete()
-
             category_by_legacy_id: Dict[int, Category] = {}
 
             # First pass: root categories
-            roots = [
-                row for row in category_rows
-                if int_or_zero(row.get("category_parent_id")) in (0, -1)
-                and int_or_zero(row.get("category_publish")) == 1
-            ]
-            roots.sort(key=lambda r: (int_or_zero(r.get("ordering")), int_or_zero(r.get("category_id"))))
-
-            for row in roots:
-                legacy_id = int_or_zero(row.get("category_id"))
-                name = choose_category_name(row)
-                if legacy_id <= 0 or not name:
-                    continue
-                category = create_unique_category(name, None, int_or_zero(row.get("ordering")))
-                category_by_legacy_id[legacy_id] = category
-                stats.categories_created += 1
+            roots = [legacy for legacy in dump.categories if legacy.parent_id in (0, -1)]
+            roots.sort(key=lambda c: (c.ordering, c.legacy_id))
+
+            for legacy in roots:
+                category, created = get_or_create_category(
+                    legacy.name, None, legacy.ordering, claimed_categories,
+                )
+                category_by_legacy_id[legacy.legacy_id] = category
+                stats.categories_created += created
 
             # Remaining categories until all possible parents are resolved
-            unresolved = [
-                row for row in category_rows
-                if int_or_zero(row.get("category_publish")) == 1
-                and int_or_zero(row.get("category_id")) not in category_by_legacy_id
-            ]
+            unresolved = [legacy for legacy in dump.categories if legacy.legacy_id not in category_by_legacy_id]
             prev_unresolved_count = -1
             while unresolved and prev_unresolved_count != len(unresolved):
                 prev_unresolved_count = len(unresolved)
                 next_round = []
-                for row in unresolved:
-                    legacy_id = int_or_zero(row.get("category_id"))
-                    parent_legacy_id = int_or_zero(row.get("category_parent_id"))
-                    name = choose_category_name(row)
-                    if legacy_id <= 0 or not name:
-                        continue
-                    parent = category_by_legacy_id.get(parent_legacy_id)
-                    if parent_legacy_id not in (0, -1) and parent is None:
-                        next_round.append(row)
+                for legacy in unresolved:
+                    parent = category_by_legacy_id.get(legacy.parent_id)
+                    if legacy.parent_id not in (0, -1) and parent is None:
+                        next_round.append(legacy)
                         continue
 
-                    category = create_unique_category(name, parent, int_or_zero(row.get("ordering")))
-                    category_by_legacy_id[legacy_id] = category
-                    stats.categories_created += 1
+                    category, created = get_or_create_category(
+                        legacy.name, parent, legacy.ordering, claimed_categories,
+                    )
+                    category_by_legacy_id[legacy.legacy_id] = category
+                    stats.categories_created += created
                 unresolved = next_round
 
             if unresolved:
                 self.stdout.write(self.style.WARNING(f"Unresolved categories skipped: {len(unresolved)}"))
 
-            products_by_legacy_id: Dict[int, Product] = {}
+            # Only this importer's products and unmarked ones; bot uploads and VirtueMart imports stay.
+            existing, duplicates = products_by_article(Product.IMPORT_SOURCE_JSHOPPING)
+            if duplicates:
+                raise CommandError(
+                    f"Duplicate articles in the catalog ({len(duplicates)}): {', '.join(duplicates[:20])}. "
+                    "Fix them in the admin and run again."
+                )
 
-            for row in product_rows:
-                product_id = int_or_zero(row.get("product_id"))
-                is_published = int_or_zero(row.get("product_publish")) == 1
-                if product_id <= 0 or not is_published:
-                    continue
+            desired: Dict[str, Product] = {}
+            desired_cats: Dict[str, List[Category]] = {}
+            image_rows: List[Tuple[str, str, int]] = []  # (article, media path, sort_order)
+            copy_tasks: List[Tuple[Path, Path]] = []
 
-                title = choose_product_title(row, product_id)
-                description = choose_product_description(row)
-                price = parse_price(row.get("product_price"))
-                if price < Decimal("0.00"):
-                    price = Decimal("0.00")
-                article = choose_article(row, product_id)
+            for legacy in dump.products:
+                product_id = legacy.product_id
+                article = legacy.article
+                if article in desired:
+                    continue
 
-                cat_refs = product_categories.get(product_id, [])
+                cat_refs = dump.product_categories.get(product_id, [])
                 cat_list = [category_by_legacy_id[cid] for _, cid in cat_refs if cid in category_by_legacy_id]
                 main_category = cat_list[0] if cat_list else None
 
-                product = Product.objects.create(
-                    title=title,
+                product = Product(
+                    title=legacy.title,
                     article=article,
-                    description=description,
-                    price=price,
+                    description=legacy.description,
+                    price=legacy.price,
                     category=main_category,
                     image=fallback_url,
                     is_published=True,
+                    import_source=Product.IMPORT_SOURCE_JSHOPPING,
                 )
-                if cat_list:
-                    # Preserve order, remove duplicates by id.
-                    deduped = list(dict.fromkeys(cat_list))
-                    product.categories.set(deduped)
-
-                products_by_legacy_id[product_id] = product
-                stats.products_created += 1
-
-            for product_id, product in products_by_legacy_id.items():
-                raw_images = product_images.get(product_id, [])
-                if not raw_images:
-                    main_fallback = safe_str((product_row_by_legacy_id.get(product_id) or {}).get("image")).strip()
-                    if main_fallback:
-                        raw_images = [(0, main_fallback)]
-
-                created_any_for_product = False
+
+                # Files are copied before the write so the first image goes straight into the row.
+                raw_images = dump.product_images.get(product_id, [])
+                if not raw_images and legacy.image:
+                    raw_images = [(0, legacy.image)]
+
                 for sort_order, image_name in raw_images:
                     legacy_path = resolve_legacy_image(image_name, image_index)
                     if legacy_path is None:
@@ -348,43 +419,84 @@ class Command(BaseCommand):
                         continue
 
                     suffix = Path(legacy_path.name).suffix
-                    clean_article = "".join(ch for ch in (product.article or "") if ch.isalnum() or ch in ("-", "_"))
-                    clean_article = clean_article or f"p{product.id}"
+                    clean_article = "".join(ch for ch in article if ch.isalnum() or ch in ("-", "_"))
+                    clean_article = clean_article or f"p{product_id}"
                     base_dest = f"{clean_article}_{int(sort_order):02d}{suffix}"
                     dest_name = unique_dest_name(used_dest_names, base_dest)
                     dest_path = media_products_dir / dest_name
 
-                    if not dest_path.exists():
-                        shutil.copy2(legacy_path, dest_path)
-                        stats.image_files_copied += 1
+                    copy_tasks.append((legacy_path, dest_path))
 
                     rel_media_path = f"products/{dest_name}"
-                    ProductImage.objects.create(
-                        product=product,
-                        image=rel_media_path,
-                        sort_order=max(0, int(sort_order)),
-                    )
-                    stats.product_images_created += 1
-
+                    image_rows.append((article, rel_media_path, max(0, int(sort_order))))
                     if not product.uploaded_image:
                         product.uploaded_image = rel_media_path
                         product.image = f"{backend_base_url}/media/{rel_media_path}"
-                        product.save(update_fields=["uploaded_image", "image"])
-                    created_any_for_product = True
 
-                if not created_any_for_product and not product.uploaded_image:
+                if not product.uploaded_image:
                     stats.products_without_image += 1
+                    # No legacy photo: keep whatever the existing product already shows.
+                    if article in existing:
+                        product.uploaded_image = existing[article].uploaded_image
+                        product.image = existing[article].image
+                desired[article] = product
+                # Preserve order, remove duplicates by id.
+                desired_cats[article] = list(dict.fromkeys(cat_list))
+
+            # Files are copied in parallel; ones already in media with the same content are skipped.
+            copy_report = file_sync.copy(copy_tasks, label="Image files")
+            for dest, error in copy_report.errors.items():
+                self.stdout.write(self.style.WARNING(f"Copy failed: {dest}: {error}"))
+
+            products_cs, products = diff_objects(Product, existing, desired, SYNC_FIELDS)
+            if prune:
+                products_cs.delete = stale_products(existing, desired, Product.IMPORT_SOURCE_JSHOPPING)
+            fill_product_slugs(products_cs.create)
+            products_cs.apply(writer)
+
+            categories_cs = diff_links(
+                Product.categories,
+                ((products[article].pk, category.pk) for article, cats in desired_cats.items() for category in cats),
+                [product.pk for product in products.values()],
+            )
+            categories_cs.apply(writer)
+
+            # Stale images are removed only for products that have images in the dump.
+            desired_images = {
+                (article, path): ProductImage(product=products[article], image=path, sort_order=sort_order)
+                for article, path, sort_order in image_rows
+            }
+            with_images = {products[article].pk: article for article, _, _ in image_rows}
+            existing_images = {
+                (with_images[image.product_id], image.image.name): image
+                for image in ProductImage.objects.filter(product_id__in=[pk for pk in with_images if pk])
+            }
+            images_cs, _ = diff_objects(ProductImage, existing_images, desired_images, ["sort_order"], prune=True)
+            images_cs.apply(writer)
+            changesets = [products_cs, categories_cs, images_cs]
 
             if assign_stores:
-                active_stores = list(Store.objects.filter(is_active=True))
-                if active_stores:
-                    for p in products_by_legacy_id.values():
-                        p.stores.set(active_stores)
-
-        self.stdout.write(self.style.SUCCESS("JShopping import completed."))
+                active_stores = list(Store.objects.filter(is_active=True).values_list("pk", flat=True))
+                stores_cs = diff_links(
+                    Product.stores,
+                    ((product.pk, store_pk) for product in products.values() for store_pk in active_stores),
+                    [product.pk for product in products.values()],
+                )
+                # Stores are only added; manual assignments stay.
+                stores_cs.delete = []
+                stores_cs.apply(writer)
+                changesets.append(stores_cs)
+
+            if dry_run:
+                transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("JShopping dry run (nothing saved)." if dry_run else "JShopping import completed."))
+        self.stdout.write("Changes (+created ~updated -deleted):")
+        for changeset in changesets:
+            self.stdout.write(f"  {changeset.summary()}")
         self.stdout.write(f"Categories created: {stats.categories_created}")
-        self.stdout.write(f"Products created: {stats.products_created}")
-        self.stdout.write(f"ProductImage created: {stats.product_images_created}")
-        self.stdout.write(f"Image files copied: {stats.image_files_copied}")
+        self.stdout.write(copy_report.summary())
         self.stdout.write(f"Missing legacy images: {stats.images_missing}")
         self.stdout.write(f"Products without images: {stats.products_without_image}")
+        if not dry_run:
+            writer.finish()
@@ -4,8 +4,8 @@
 Для товаров без alias генерирует slug из title через python-slugify.
 """
 import os
-import re
 from django.core.management.base import BaseCommand
+from shop import legacy_sql
 from shop.models import Product
 
 DEFAULT_SQL = os.path.join(
@@ -13,117 +13,6 @@ DEFAULT_SQL = os.path.join(
 )
 
 
-def parse_fields(row_str):
-    """Парсит строку VALUES (...) в список значений (тот же парсер что в import_flower_tags_sql)."""
-    fields = []
-    cur = []
-    in_q = False
-    dep = 0
-    i = 0
-    s = row_str + ','
-    L = len(s)
-    while i < L:
-        ch = s[i]
-        if in_q:
-            if ch == '\\' and i + 1 < L:
-                cur.append(ch); cur.append(s[i + 1]); i += 2; continue
-            elif ch == "'":
-                if i + 1 < L and s[i + 1] == "'":
-                    cur.append("'"); i += 2; continue
-                in_q = False; cur.append(ch)
-            else:
-                cur.append(ch)
-        else:
-            if ch == "'":
-                in_q = True; cur.append(ch)
-            elif ch == '(' and not in_q:
-                dep += 1; cur.append(ch)
-            elif ch == ')' and dep > 0 and not in_q:
-                dep -= 1; cur.append(ch)
-            elif ch == ',' and dep == 0 and not in_q:
-                val = ''.join(cur).strip()
-                if val.startswith("'") and val.endswith("'"):
-                    val = val[1:-1].replace("\\'", "'").replace('\\\\', '\\')
-                elif val.upper() == 'NULL':
-                    val = None
-                fields.append(val)
-                cur = []
-            else:
-                cur.append(ch)
-        i += 1
-    return fields
-
-
-def iter_insert_rows(sql, table_name):
-    """Итератор по строкам INSERT INTO `table_name`."""
-    search_str = f'INSERT INTO `{table_name}`'
-    start_pos = 0
-    L = len(sql)
-    while True:
-        idx = sql.find(search_str, start_pos)
-        if idx < 0:
-            break
-        val_idx = sql.find('VALUES', idx)
-        if val_idx < 0:
-            break
-        val_idx += len('VALUES')
-        while val_idx < L and sql[val_idx] in ' \t\r\n':
-            val_idx += 1
-        pos = val_idx
-        in_q = False
-        while pos < L:
-            while pos < L:
-                if not in_q and sql[pos] == ';':
-                    break
-                if not in_q and sql[pos] == '(':
-                    break
-                if sql[pos] == "'" and not in_q:
-                    in_q = True; pos += 1; continue
-                if sql[pos] == "'" and in_q:
-                    in_q = False; pos += 1; continue
-                pos += 1
-            if pos >= L or (sql[pos] == ';' and not in_q):
-                break
-            pos += 1
-            depth = 0; in_q2 = False; start = pos
-            while pos < L:
-                ch = sql[pos]
-                if in_q2:
-                    if ch == '\\' and pos + 1 < L:
-                        pos += 2; continue
-                    elif ch == "'":
-                        in_q2 = False
-                elif ch == "'":
-                    in_q2 = True
-                elif ch == '(':
-                    depth += 1
-                elif ch == ')':
-                    if depth == 0:
-                        yield parse_fields(sql[start:pos])
-                        pos += 1
-                        break
-                    depth -= 1
-                pos += 1
-        start_pos = val_idx + 1
-
-
-def get_col_indices(sql, table_name):
-    """Возвращает словарь {имя_колонки: индекс} из CREATE TABLE."""
-    m = re.search(
-        rf'CREATE TABLE `{re.escape(table_name)}`\s*\((.*?)\)\s*ENGINE',
-        sql, re.DOTALL | re.IGNORECASE
-    )
-    if not m:
-        return {}
-    cols = {}
-    for i, line in enumerate(m.group(1).splitlines()):
-        line = line.strip()
-        cm = re.match(r'`([^`]+)`\s+', line)
-        if cm:
-            cols[cm.group(1)] = len(cols)
-    return cols
-
-
 def make_unique_slug(base_slug, existing_slugs):
     slug = base_slug
     counter = 2
@@ -149,28 +38,22 @@ class Command(BaseCommand):
             return
 
         self.stdout.write(f'Читаю: {sql_path}')
-        with open(sql_path, encoding='utf-8', errors='replace') as f:
-            sql = f.read()
-
-        # Индексы колонок
-        cols = get_col_indices(sql, 'wzx3q_jshopping_products')
-        if not cols:
-            self.stderr.write('CREATE TABLE wzx3q_jshopping_products не найдена')
-            return
 
-        idx_ean = cols.get('product_ean')
-        idx_alias = cols.get('alias_ru-RU')
-
-        if idx_ean is None or idx_alias is None:
-            self.stderr.write(f'Не найдены колонки. Доступные: {list(cols.keys())[:15]}')
-            return
-
-        self.stdout.write(f'product_ean[{idx_ean}], alias_ru-RU[{idx_alias}]')
-
-        # Строим словарь article -> alias
+        # Строим словарь article -> alias; индексы колонок — из CREATE TABLE / INSERT
+        table = 'wzx3q_jshopping_products'
+        reader = legacy_sql.DumpReader(sql_path, [table])
         article_to_alias = {}
         row_count = 0
-        for row in iter_insert_rows(sql, 'wzx3q_jshopping_products'):
+        idx_ean = idx_alias = None
+        for _, row in reader:
+            if row_count == 0:
+                cols = reader.columns.get(table, [])
+                if 'product_ean' not in cols or 'alias_ru-RU' not in cols:
+                    self.stderr.write(f'Не найдены колонки. Доступные: {cols[:15]}')
+                    return
+                idx_ean = cols.index('product_ean')
+                idx_alias = cols.index('alias_ru-RU')
+                self.stdout.write(f'product_ean[{idx_ean}], alias_ru-RU[{idx_alias}]')
             row_count += 1
             if len(row) > max(idx_ean, idx_alias):
                 ean = str(row[idx_ean] or '').strip()
@@ -178,6 +61,9 @@ class Command(BaseCommand):
                 if ean:
                     article_to_alias[ean] = alias
 
+        if not row_count:
+            self.stderr.write(f'Нет данных {table} в дампе')
+            return
         self.stdout.write(f'Строк: {row_count}, пар артикул->alias: {len(article_to_alias)}')
 
         # Slugify функция
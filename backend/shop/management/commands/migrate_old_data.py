@@ -10,12 +10,53 @@ Django management command для миграции данных из старой
     --images-only : Только создать записи изображений
 """
 
-import re
 import os
 from django.core.management.base import BaseCommand
+from shop import legacy_sql
 from shop.models import Category, Product, ProductImage
 
 
+class OldDump:
+    """Нужные миграции данные VirtueMart, собранные за один проход по дампу
+    (shop.legacy_sql): строки не хранятся, только словари ниже."""
+
+    def __init__(self):
+        self.categories = {}             # vm_cat_id -> {name, description}
+        self.hierarchy = {}              # vm_cat_id -> vm_parent_id
+        self.products = {}               # vm_product_id -> {name, description}
+        self.skus = {}                   # vm_product_id -> sku ('' если нет)
+        self.product_categories = {}     # vm_product_id -> [vm_cat_id, ...]
+        self.medias = {}                 # vm_media_id -> file_url (только type='product')
+        self.product_medias = []         # (vm_product_id, vm_media_id, ordering)
+
+    def add_category(self, row):
+        description = row[2] if len(row) > 2 else ''
+        self.categories[int(row[0])] = {'name': row[1], 'description': description}
+
+    def add_category_relation(self, row):
+        self.hierarchy[int(row[0])] = int(row[1])
+
+    def add_product(self, row):
+        description = (row[3] if len(row) > 3 else '') or ''
+        self.products[int(row[0])] = {'name': row[1], 'description': description}
+
+    def add_product_sku(self, row):
+        self.skus[int(row[0])] = row[3] if len(row) > 3 and row[3] else ''
+
+    def add_product_category(self, row):
+        self.product_categories.setdefault(int(row[1]), []).append(int(row[2]))
+
+    def add_media(self, row):
+        file_url = row[8] if len(row) > 8 else ''
+        file_type = row[7] if len(row) > 7 else ''
+        if file_type == 'product' and file_url:
+            self.medias[int(row[0])] = file_url
+
+    def add_product_media(self, row):
+        ordering = int(row[3]) if len(row) > 3 else 0
+        self.product_medias.append((int(row[1]), int(row[2]), ordering))
+
+
 class Command(BaseCommand):
     help = 'Миграция данных из старой VirtueMart базы данных'
 
@@ -54,37 +95,53 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f'Файл не найден: {sql_file}'))
             return
 
-        self.stdout.write(self.style.SUCCESS(f'Загрузка SQL файла: {sql_file}'))
-
-        with open(sql_file, 'r', encoding='utf-8') as f:
-            sql_content = f.read()
-
-        self.stdout.write(self.style.SUCCESS(f'Загружено {len(sql_content)} байт'))
-
         # Определяем, что нужно мигрировать
         do_categories = options['categories_only'] or not (options['products_only'] or options['images_only'])
         do_products = options['products_only'] or not (options['categories_only'] or options['images_only'])
         do_images = options['images_only'] or not (options['categories_only'] or options['products_only'])
 
+        # Нужные таблицы читаются за один проход по дампу; строки не копятся —
+        # обработчики сразу сводят их в словари OldDump
+        self.dump = dump = OldDump()
+        handlers = {}
+        if do_categories or do_products:
+            handlers['wzx3q_virtuemart_categories_ru_ru'] = dump.add_category
+            handlers['wzx3q_virtuemart_category_categories'] = dump.add_category_relation
+        if do_products:
+            handlers['wzx3q_virtuemart_products_ru_ru'] = dump.add_product
+            handlers['wzx3q_virtuemart_product_categories'] = dump.add_product_category
+        if do_products or do_images:
+            handlers['wzx3q_virtuemart_products'] = dump.add_product_sku
+        if do_images:
+            handlers['wzx3q_virtuemart_medias'] = dump.add_media
+            handlers['wzx3q_virtuemart_product_medias'] = dump.add_product_media
+
+        self.stdout.write(self.style.SUCCESS(f'Загрузка SQL файла: {sql_file}'))
+        counts = legacy_sql.read_tables(sql_file, handlers)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {sum(counts.values())} '
+            f'из {os.path.getsize(sql_file)} байт'
+        ))
+
         vm_to_django_categories = {}
         vm_to_django_products = {}
 
         if do_categories:
-            vm_to_django_categories = self.migrate_categories(sql_content)
+            vm_to_django_categories = self.migrate_categories()
 
         if do_products:
             if not vm_to_django_categories:
                 # Загружаем существующие категории
-                vm_to_django_categories = self.load_existing_categories(sql_content)
+                vm_to_django_categories = self.load_existing_categories()
 
-            vm_to_django_products = self.migrate_products(sql_content, vm_to_django_categories)
+            vm_to_django_products = self.migrate_products(vm_to_django_categories)
 
         if do_images:
             if not vm_to_django_products:
                 # Загружаем существующие товары
-                vm_to_django_products = self.load_existing_products(sql_content)
+                vm_to_django_products = self.load_existing_products()
 
-            self.migrate_images(sql_content, vm_to_django_products)
+            self.migrate_images(vm_to_django_products)
 
         # Итоговая статистика
         self.stdout.write(self.style.SUCCESS('\n' + '='*60))
@@ -94,79 +151,14 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS(f'  Изображений в БД: {ProductImage.objects.count()}'))
         self.stdout.write(self.style.SUCCESS('='*60))
 
-    def parse_sql_insert(self, table_name, sql_content):
-        """Парсит INSERT INTO запросы из SQL дампа."""
-        pattern = rf"INSERT INTO `{table_name}`.*?VALUES\s*(.*?);"
-        matches = re.findall(pattern, sql_content, re.DOTALL | re.IGNORECASE)
-
-        all_rows = []
-        for match in matches:
-            rows_pattern = r"\(([^)]+)\)"
-            rows = re.findall(rows_pattern, match)
-
-            for row in rows:
-                values = []
-                current_value = ''
-                in_quotes = False
-                escape_next = False
-
-                for char in row + ',':
-                    if escape_next:
-                        current_value += char
-                        escape_next = False
-                        continue
-
-                    if char == '\\':
-                        escape_next = True
-                        current_value += char
-                        continue
-
-                    if char == "'" and not escape_next:
-                        in_quotes = not in_quotes
-                        current_value += char
-                        continue
-
-                    if char == ',' and not in_quotes:
-                        value = current_value.strip()
-                        if value.startswith("'") and value.endswith("'"):
-                            value = value[1:-1]
-                        if value.upper() == 'NULL' or value == '':
-                            value = None
-                        else:
-                            value = value.replace("\\'", "'").replace("\\\\", "\\")
-                        values.append(value)
-                        current_value = ''
-                    else:
-                        current_value += char
-
-                if values:
-                    all_rows.append(tuple(values))
-
-        return all_rows
-
-    def migrate_categories(self, sql_content):
+    def migrate_categories(self):
         """Мигрирует категории из VirtueMart."""
         self.stdout.write(self.style.WARNING('\n[CATEGORIES] Миграция категорий...'))
 
-        categories_ru = self.parse_sql_insert('wzx3q_virtuemart_categories_ru_ru', sql_content)
-
-        vm_categories = {}
-        for row in categories_ru:
-            vm_id = int(row[0])
-            name = row[1]
-            description = row[2] if len(row) > 2 else ''
-            vm_categories[vm_id] = {'name': name, 'description': description}
-
+        vm_categories = self.dump.categories
         self.stdout.write(f'  Найдено категорий: {len(vm_categories)}')
 
-        category_relations = self.parse_sql_insert('wzx3q_virtuemart_category_categories', sql_content)
-
-        hierarchy = {}
-        for row in category_relations:
-            child_id = int(row[0])
-            parent_id = int(row[1])
-            hierarchy[child_id] = parent_id
-
+        hierarchy = self.dump.hierarchy
         self.stdout.write(f'  Найдено связей: {len(hierarchy)}')
 
         vm_to_django = {}
@@ -195,14 +187,11 @@ class Command(BaseCommand):
 
         return vm_to_django
 
-    def load_existing_categories(self, sql_content):
+    def load_existing_categories(self):
         """Загружает маппинг существующих категорий."""
-        categories_ru = self.parse_sql_insert('wzx3q_virtuemart_categories_ru_ru', sql_content)
-
         vm_to_django = {}
-        for row in categories_ru:
-            vm_id = int(row[0])
-            name = row[1]
+        for vm_id, data in self.dump.categories.items():
+            name = data['name']
 
             try:
                 category = Category.objects.get(name=name)
@@ -212,40 +201,18 @@ class Command(BaseCommand):
 
         return vm_to_django
 
-    def migrate_products(self, sql_content, vm_to_django_categories):
+    def migrate_products(self, vm_to_django_categories):
         """Мигрирует товары из VirtueMart."""
         self.stdout.write(self.style.WARNING('\n[PRODUCTS] Миграция товаров...'))
 
-        products_ru = self.parse_sql_insert('wzx3q_virtuemart_products_ru_ru', sql_content)
-
-        vm_products = {}
-        for row in products_ru:
-            vm_id = int(row[0])
-            name = row[1]
-            description = row[3] if len(row) > 3 else ''
-            vm_products[vm_id] = {'name': name, 'description': description}
-
+        vm_products = self.dump.products
         self.stdout.write(f'  Найдено товаров: {len(vm_products)}')
 
-        products_main = self.parse_sql_insert('wzx3q_virtuemart_products', sql_content)
-
-        for row in products_main:
-            vm_id = int(row[0])
-            sku = row[3] if len(row) > 3 and row[3] else ''
-
+        for vm_id, sku in self.dump.skus.items():
             if vm_id in vm_products:
                 vm_products[vm_id]['sku'] = sku
 
-        product_categories = self.parse_sql_insert('wzx3q_virtuemart_product_categories', sql_content)
-
-        product_to_categories = {}
-        for row in product_categories:
-            product_id = int(row[1])
-            category_id = int(row[2])
-
-            if product_id not in product_to_categories:
-                product_to_categories[product_id] = []
-            product_to_categories[product_id].append(category_id)
+        product_to_categories = self.dump.product_categories
 
         vm_to_django_products = {}
 
@@ -289,16 +256,9 @@ class Command(BaseCommand):
 
         return vm_to_django_products
 
-    def load_existing_products(self, sql_content):
+    def load_existing_products(self):
         """Загружает маппинг существующих товаров."""
-        products_ru = self.parse_sql_insert('wzx3q_virtuemart_products_ru_ru', sql_content)
-        products_main = self.parse_sql_insert('wzx3q_virtuemart_products', sql_content)
-
-        vm_skus = {}
-        for row in products_main:
-            vm_id = int(row[0])
-            sku = row[3] if len(row) > 3 and row[3] else f'VM{vm_id}'
-            vm_skus[vm_id] = sku
+        vm_skus = {vm_id: sku or f'VM{vm_id}' for vm_id, sku in self.dump.skus.items()}
 
         vm_to_django = {}
         for vm_id, sku in vm_skus.items():
@@ -310,30 +270,14 @@ class Command(BaseCommand):
 
         return vm_to_django
 
-    def migrate_images(self, sql_content, vm_to_django_products):
+    def migrate_images(self, vm_to_django_products):
         """Мигрирует изображения товаров."""
         self.stdout.write(self.style.WARNING('\n[IMAGES]  Миграция изображений...'))
 
-        medias = self.parse_sql_insert('wzx3q_virtuemart_medias', sql_content)
-
-        vm_medias = {}
-        for row in medias:
-            media_id = int(row[0])
-            file_url = row[8] if len(row) > 8 else ''
-            file_type = row[7] if len(row) > 7 else ''
-
-            if file_type == 'product' and file_url:
-                vm_medias[media_id] = file_url
-
+        vm_medias = self.dump.medias
         self.stdout.write(f'  Найдено медиафайлов: {len(vm_medias)}')
 
-        product_medias = self.parse_sql_insert('wzx3q_virtuemart_product_medias', sql_content)
-
-        for row in product_medias:
-            product_id = int(row[1])
-            media_id = int(row[2])
-            ordering = int(row[3]) if len(row) > 3 else 0
-
+        for product_id, media_id, ordering in self.dump.product_medias:
             if product_id in vm_to_django_products and media_id in vm_medias:
                 product = vm_to_django_products[product_id]
                 image_url = vm_medias[media_id]
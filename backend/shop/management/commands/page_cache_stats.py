@@ -0,0 +1,27 @@
+"""
+Статистика кэша публичных страниц: попадания/промахи.
+"""
+from django.core.management.base import BaseCommand
+
+from shop import page_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает hit/miss кэша публичных страниц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счётчики')
+        parser.add_argument('--flush', action='store_true', help='Сбросить все закэшированные страницы')
+
+    def handle(self, *args, **options):
+        stats = page_cache.cache_stats()
+        self.stdout.write(f"Попаданий: {stats['hits']}")
+        self.stdout.write(f"Промахов:  {stats['misses']}")
+        self.stdout.write(f"Hit ratio: {stats['hit_ratio']:.2%}")
+
+        if options['flush']:
+            page_cache.invalidate(page_cache.SITE_GROUP)
+            self.stdout.write(self.style.SUCCESS('Кэш страниц сброшен'))
+        if options['reset']:
+            page_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счётчики обнулены'))
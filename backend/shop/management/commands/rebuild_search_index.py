@@ -0,0 +1,31 @@
+"""
+Перестраивает поисковый индекс товаров (shop/search.py) с нуля.
+Нужна после массовых изменений через update()/bulk_create в обход сигналов.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop import search
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--query', default='', help='После перестройки выполнить поиск и показать время')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            search.index_products()
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано товаров: {Product.objects.count()} за {time.monotonic() - started:.1f} с'
+        ))
+        if options['query']:
+            started = time.monotonic()
+            ids = search.search_ids(options['query'])
+            elapsed = (time.monotonic() - started) * 1000
+            self.stdout.write(f'«{options["query"]}»: {len(ids)} товаров за {elapsed:.1f} мс')
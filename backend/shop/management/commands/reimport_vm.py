@@ -7,17 +7,28 @@
 3. Читает все товары VM (ru_ru)
 4. Читает привязки товар->категории VM
 5. Читает изображения VM
-6. Очищает существующие товары и изображения (категории оставляет)
-7. Создаёт товары с правильными привязками к категориям
+6. Сверяет с текущими товарами по артикулу (product_sku, иначе VM<id>):
+   новые создаёт, у существующих меняет только изменившиеся поля,
+   отсутствующие в дампе удаляет только с --prune и только импортированные
+   отсюда (import_source='vm'). id товаров, витрины и ссылки сохраняются,
+   повторный запуск ничего не меняет. Повтор артикула в базе — ошибка.
+7. Так же сверяет привязки к категориям, фото и магазины
+
+Запись идёт пачками (--batch-size) в одной транзакции; --dry-run печатает
+сводку изменений и откатывает их.
 
 Маппинг старых VM-категорий на новые Django-категории делается по названию.
 Если названия не совпадают — выводит список несовпадений.
 """
 
-import re
 import os
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import transaction
+from shop import legacy_sql
+from shop.bulk_import import (
+    DEFAULT_BATCH_SIZE, BulkWriter, diff_links, diff_objects, fill_product_slugs, products_by_article, stale_products,
+)
 from shop.models import Category, Product, ProductImage, Store
 
 
@@ -25,6 +36,9 @@ SQL_FILE = os.path.join(
     os.path.dirname(__file__), '..', '..', '..', '..', 'old', 'buketby_newbd.sql'
 )
 
+# Поля товара, которые берутся из дампа; остальное (slug, витрина, публикация, фото) правится на сайте
+SYNC_FIELDS = ['title', 'description', 'price', 'category', 'import_source']
+
 EXCEL_FILE = os.path.join(
     os.path.dirname(__file__), '..', '..', '..', '..', 'bukety_tablica.xlsx'
 )
@@ -113,240 +127,114 @@ CATEGORY_NAME_MAP = {
 }
 
 
-def read_sql():
-    path = os.path.normpath(SQL_FILE)
-    # Файл в utf-8, errors='replace' на случай битых байт
-    with open(path, 'r', encoding='utf-8', errors='replace') as f:
-        return f.read()
-
-
-def parse_fields(row_str):
-    """
-    Универсальный парсер одной строки SQL VALUES: 'val1', 'val2', 123, NULL, ...
-    Возвращает список значений (строки или None).
-    Корректно обрабатывает строки с HTML, переносами строк, экранированными символами.
-    """
-    fields = []
-    cur = []
-    in_q = False
-    dep = 0
-    i = 0
-    s = row_str + ','
-    L = len(s)
-    while i < L:
-        ch = s[i]
-        if in_q:
-            if ch == '\\' and i + 1 < L:
-                cur.append(ch)
-                cur.append(s[i + 1])
-                i += 2
-                continue
-            elif ch == "'":
-                if i + 1 < L and s[i + 1] == "'":
-                    cur.append("'")
-                    i += 2
-                    continue
-                in_q = False
-                cur.append(ch)
-            else:
-                cur.append(ch)
-        else:
-            if ch == "'":
-                in_q = True
-                cur.append(ch)
-            elif ch == '(':
-                dep += 1
-                cur.append(ch)
-            elif ch == ')' and dep > 0:
-                dep -= 1
-                cur.append(ch)
-            elif ch == ',' and dep == 0:
-                val = ''.join(cur).strip()
-                if val.startswith("'") and val.endswith("'"):
-                    val = val[1:-1].replace("\\'", "'").replace('\\\\', '\\')
-                elif val.upper() == 'NULL':
-                    val = None
-                fields.append(val)
-                cur = []
-            else:
-                cur.append(ch)
-        i += 1
-    return fields
-
-
-def iter_insert_rows(sql, table_name):
-    """
-    Генератор: для каждой строки из INSERT INTO `table_name` ... VALUES (...), (...);
-    Корректно обрабатывает значения со знаком ';' внутри строковых литералов.
-    """
-    search_str = f'INSERT INTO `{table_name}`'
-    start_pos = 0
-    L = len(sql)
-    while True:
-        idx = sql.find(search_str, start_pos)
-        if idx < 0:
-            break
-        val_idx = sql.find('VALUES', idx)
-        if val_idx < 0:
-            break
-        val_idx += len('VALUES')
-        while val_idx < L and sql[val_idx] in ' \t\r\n':
-            val_idx += 1
-
-        pos = val_idx
-        in_q = False
-        while pos < L:
-            # Ищем '(' начало строки значений
-            while pos < L:
-                if not in_q and sql[pos] == ';':
-                    break
-                if not in_q and sql[pos] == '(':
-                    break
-                if sql[pos] == "'" and not in_q:
-                    in_q = True
-                    pos += 1
-                    continue
-                if sql[pos] == "'" and in_q:
-                    in_q = False
-                    pos += 1
-                    continue
-                pos += 1
-            if pos >= L or (sql[pos] == ';' and not in_q):
-                break
-            pos += 1  # пропускаем '('
-
-            # Собираем содержимое строки значений
-            depth = 0
-            in_q2 = False
-            start = pos
-            while pos < L:
-                ch = sql[pos]
-                if in_q2:
-                    if ch == '\\' and pos + 1 < L:
-                        pos += 2
-                        continue
-                    elif ch == "'":
-                        in_q2 = False
-                elif ch == "'":
-                    in_q2 = True
-                elif ch == '(':
-                    depth += 1
-                elif ch == ')':
-                    if depth == 0:
-                        break
-                    depth -= 1
-                pos += 1
-            row_str = sql[start:pos]
-            pos += 1  # пропускаем ')'
-            if row_str.strip():
-                yield parse_fields(row_str)
-            # Пропускаем пробелы и запятую до следующей строки
-            while pos < L and sql[pos] in ' \t\r\n,':
-                pos += 1
-            if pos < L and sql[pos] == ';':
-                break
-
-        start_pos = pos + 1
-
-
-def extract_vm_categories(sql):
-    """Возвращает dict: vm_cat_id -> category_name"""
-    cats = {}
-    # Структура: virtuemart_category_id, category_name, category_description, ...
-    for fields in iter_insert_rows(sql, 'wzx3q_virtuemart_categories_ru_ru'):
+class VmDump:
+    """Таблицы VirtueMart, собранные за один проход по дампу (shop.legacy_sql)."""
+
+    def __init__(self):
+        self.categories = {}          # vm_cat_id -> category_name
+        self.product_categories = {}  # vm_product_id -> [vm_cat_id, ...] по ordering
+        self.products = {}            # vm_product_id -> {name, description}
+        self.products_main = {}       # vm_product_id -> {sku}
+        self.prices = {}              # vm_product_id -> price
+        self.medias = {}              # vm_media_id -> file_url (только type='product')
+        self.product_medias = {}      # vm_product_id -> [(ordering, media_id), ...]
+
+    @classmethod
+    def read(cls, path=SQL_FILE, **kwargs):
+        dump = cls()
+        legacy_sql.read_tables(os.path.normpath(path), {
+            'wzx3q_virtuemart_categories_ru_ru': dump.add_category,
+            'wzx3q_virtuemart_product_categories': dump.add_product_category,
+            'wzx3q_virtuemart_products_ru_ru': dump.add_product,
+            'wzx3q_virtuemart_products': dump.add_product_main,
+            'wzx3q_virtuemart_product_prices': dump.add_price,
+            'wzx3q_virtuemart_medias': dump.add_media,
+            'wzx3q_virtuemart_product_medias': dump.add_product_media,
+        }, **kwargs)
+        for pid, pairs in dump.product_categories.items():
+            pairs.sort()
+            dump.product_categories[pid] = [cid for _, cid in pairs]
+        for pairs in dump.product_medias.values():
+            pairs.sort()
+        return dump
+
+    def add_category(self, fields):
+        # Структура: virtuemart_category_id, category_name, category_description, ...
         if len(fields) >= 2:
             try:
-                vm_id = int(fields[0])
                 name = fields[1] or ''
                 if name:
-                    cats[vm_id] = name
+                    self.categories[int(fields[0])] = name
             except (ValueError, TypeError):
                 pass
-    return cats
-
 
-def extract_vm_product_categories(sql):
-    """Возвращает dict: vm_product_id -> [vm_cat_id, ...]  отсортировано по ordering"""
-    result = {}
-    # Структура: id, virtuemart_product_id, virtuemart_category_id, ordering
-    for fields in iter_insert_rows(sql, 'wzx3q_virtuemart_product_categories'):
+    def add_product_category(self, fields):
+        # Структура: id, virtuemart_product_id, virtuemart_category_id, ordering
         if len(fields) >= 4:
             try:
                 pid = int(fields[1])
                 cid = int(fields[2])
                 ordering = int(fields[3]) if fields[3] is not None else 0
-                if pid not in result:
-                    result[pid] = []
-                result[pid].append((ordering, cid))
+                self.product_categories.setdefault(pid, []).append((ordering, cid))
             except (ValueError, TypeError):
                 pass
-    for pid in result:
-        result[pid].sort()
-        result[pid] = [cid for _, cid in result[pid]]
-    return result
 
-
-def extract_vm_products(sql):
-    """
-    Парсит wzx3q_virtuemart_products_ru_ru.
-    Структура: virtuemart_product_id, product_s_desc, product_desc, product_name, ...
-    Возвращает dict: vm_product_id -> {name, description}
-    """
-    products = {}
-    for fields in iter_insert_rows(sql, 'wzx3q_virtuemart_products_ru_ru'):
+    def add_product(self, fields):
+        # Структура: virtuemart_product_id, product_s_desc, product_desc, product_name, ...
         if len(fields) >= 4:
             try:
                 vm_id = int(fields[0])
                 short_desc = fields[1] or ''
-                full_desc = fields[2] or ''
-                name = fields[3] or ''
-                name = name.strip()
+                name = (fields[3] or '').strip()
                 if name:
-                    products[vm_id] = {
+                    self.products[vm_id] = {
                         'name': name,
                         'description': short_desc.strip(),
                     }
-            except (ValueError, TypeError):
+            except (ValueError, TypeError, AttributeError):
                 pass
-    return products
 
+    def add_product_main(self, fields):
+        # Структура: virtuemart_product_id, virtuemart_vendor_id, product_parent_id, product_sku, ...
+        if len(fields) >= 4:
+            try:
+                self.products_main[int(fields[0])] = {'sku': str(fields[3] or '').strip()}
+            except (ValueError, TypeError):
+                pass
 
-def extract_vm_products_main(sql):
-    """
-    Парсит wzx3q_virtuemart_products: берём product_sku.
-    Структура: virtuemart_product_id, virtuemart_vendor_id, product_parent_id, product_sku, ...
-    Возвращает dict: vm_product_id -> {sku}
-    """
-    result = {}
-    for fields in iter_insert_rows(sql, 'wzx3q_virtuemart_products'):
+    def add_price(self, fields):
+        # Структура: virtuemart_product_price_id, virtuemart_product_id, virtuemart_shoppergroup_id, product_price, ...
         if len(fields) >= 4:
             try:
-                vm_id = int(fields[0])
-                sku = fields[3] or ''
-                result[vm_id] = {'sku': sku.strip()}
+                pid = int(fields[1])
+                price = float(fields[3] or 0)
+                self.prices.setdefault(pid, price)
             except (ValueError, TypeError):
                 pass
-    return result
 
+    def add_media(self, fields):
+        # Структура: virtuemart_media_id, virtuemart_vendor_id, file_title, file_description,
+        #            file_meta, file_class, file_mimetype, file_type, file_url, file_url_thumb, ...
+        if len(fields) >= 9:
+            try:
+                media_id = int(fields[0])
+                file_type = fields[7] or ''
+                file_url = fields[8] or ''
+                if file_type == 'product' and file_url:
+                    self.medias[media_id] = file_url
+            except (ValueError, TypeError):
+                pass
 
-def extract_vm_prices(sql):
-    """
-    Парсит цены из wzx3q_virtuemart_product_prices.
-    Структура: virtuemart_product_price_id, virtuemart_product_id, virtuemart_shoppergroup_id, product_price, ...
-    Возвращает dict: vm_product_id -> price
-    """
-    prices = {}
-    for fields in iter_insert_rows(sql, 'wzx3q_virtuemart_product_prices'):
+    def add_product_media(self, fields):
+        # Структура: id, virtuemart_product_id, virtuemart_media_id, ordering
         if len(fields) >= 4:
             try:
                 pid = int(fields[1])
-                price_str = fields[3] or '0'
-                price = float(price_str)
-                if pid not in prices:
-                    prices[pid] = price
+                mid = int(fields[2])
+                ordering = int(fields[3]) if fields[3] is not None else 0
+                self.product_medias.setdefault(pid, []).append((ordering, mid))
             except (ValueError, TypeError):
                 pass
-    return prices
 
 
 def load_excel_prices():
@@ -382,87 +270,41 @@ def load_excel_prices():
     return prices
 
 
-def extract_vm_medias(sql):
-    """
-    Структура: virtuemart_media_id, virtuemart_vendor_id, file_title, file_description,
-               file_meta, file_class, file_mimetype, file_type, file_url, file_url_thumb, ...
-    Возвращает dict: vm_media_id -> file_url (только type='product')
-    """
-    medias = {}
-    for fields in iter_insert_rows(sql, 'wzx3q_virtuemart_medias'):
-        if len(fields) >= 9:
-            try:
-                media_id = int(fields[0])
-                file_type = fields[7] or ''
-                file_url = fields[8] or ''
-                if file_type == 'product' and file_url:
-                    medias[media_id] = file_url
-            except (ValueError, TypeError):
-                pass
-    return medias
-
-
-def extract_vm_product_medias(sql):
-    """
-    Структура: id, virtuemart_product_id, virtuemart_media_id, ordering
-    Возвращает dict: vm_product_id -> [(ordering, media_id), ...]  отсортировано
-    """
-    result = {}
-    for fields in iter_insert_rows(sql, 'wzx3q_virtuemart_product_medias'):
-        if len(fields) >= 4:
-            try:
-                pid = int(fields[1])
-                mid = int(fields[2])
-                ordering = int(fields[3]) if fields[3] is not None else 0
-                if pid not in result:
-                    result[pid] = []
-                result[pid].append((ordering, mid))
-            except (ValueError, TypeError):
-                pass
-    for pid in result:
-        result[pid].sort()
-    return result
-
-
 class Command(BaseCommand):
     help = 'Полный реимпорт товаров из VirtueMart с правильными категориями и изображениями'
 
     def add_arguments(self, parser):
         parser.add_argument('--dry-run', action='store_true',
                             help='Только показать что будет сделано, не сохранять')
+        parser.add_argument('--sql', default=SQL_FILE, help='Путь к SQL-дампу (по умолчанию old/buketby_newbd.sql)')
+        parser.add_argument('--prune', action='store_true',
+                            help='Удалить импортированные из VirtueMart товары, артикулов которых нет в дампе')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f'Размер пачки bulk_create (по умолчанию {DEFAULT_BATCH_SIZE})')
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
 
-        self.stdout.write('Загрузка SQL дампа...')
-        sql = read_sql()
-        self.stdout.write(f'  Загружено {len(sql):,} байт')
+        path = os.path.normpath(options['sql'])
+        self.stdout.write(f'Чтение SQL дампа ({os.path.getsize(path):,} байт)...')
+        dump = VmDump.read(path)
+        vm_cats = dump.categories
+        vm_prod_cats = dump.product_categories
+        vm_products_ru = dump.products
+        vm_products_main = dump.products_main
+        vm_prices = dump.prices
+        vm_medias = dump.medias
+        vm_prod_medias = dump.product_medias
 
-        # --- Парсинг ---
-        self.stdout.write('\nПарсинг данных...')
-
-        vm_cats = extract_vm_categories(sql)
         self.stdout.write(f'  VM категорий: {len(vm_cats)}')
-
-        vm_prod_cats = extract_vm_product_categories(sql)
         self.stdout.write(f'  VM привязок товар->категория: {sum(len(v) for v in vm_prod_cats.values())}')
-
-        vm_products_ru = extract_vm_products(sql)
         self.stdout.write(f'  VM товаров (ru): {len(vm_products_ru)}')
-
-        vm_products_main = extract_vm_products_main(sql)
         self.stdout.write(f'  VM товаров (main): {len(vm_products_main)}')
-
-        vm_prices = extract_vm_prices(sql)
         self.stdout.write(f'  VM цен (из SQL): {len(vm_prices)}')
 
         excel_prices = load_excel_prices()
         self.stdout.write(f'  Цен из Excel: {len(excel_prices)}')
-
-        vm_medias = extract_vm_medias(sql)
         self.stdout.write(f'  VM медиафайлов (product): {len(vm_medias)}')
-
-        vm_prod_medias = extract_vm_product_medias(sql)
         self.stdout.write(f'  VM привязок товар->медиа: {len(vm_prod_medias)}')
 
         # --- Строим маппинг VM cat_id -> Django Category по названиям ---
@@ -485,82 +327,118 @@ class Command(BaseCommand):
             for vm_cat_id, vm_cat_name, mapped_name in unmapped_vm_cats[:20]:
                 self.stdout.write(f'    VM {vm_cat_id}: "{vm_cat_name}" -> "{mapped_name}" (не найдена)')
 
+        writer = BulkWriter(batch_size=options['batch_size'], log=self.stdout.write)
+        with transaction.atomic():
+            changesets = self._sync_catalog(writer, dump, excel_prices, vm_to_django_cat, options['prune'])
+            self.stdout.write('\nИзменения (+новые ~изменённые -удалённые):')
+            for changeset in changesets:
+                self.stdout.write(f'  {changeset.summary()}')
+            if dry_run:
+                # Изменения применялись, чтобы посчитать связи новых товаров, — откатываем
+                transaction.set_rollback(True)
         if dry_run:
             self.stdout.write(self.style.WARNING('\n[DRY RUN] Ничего не сохранено.'))
             return
+        writer.finish()
+
+        # --- Итог ---
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write(self.style.SUCCESS('ГОТОВО!'))
+        self.stdout.write(f'  Категорий:    {Category.objects.count()}')
+        self.stdout.write(f'  Товаров:      {Product.objects.count()}')
+        self.stdout.write(f'  Изображений:  {ProductImage.objects.count()}')
+
+        # Статистика по категориям
+        self.stdout.write('\nТоваров по категориям:')
+        from django.db.models import Count
+        top = (Category.objects
+               .annotate(n=Count('products'))
+               .filter(n__gt=0)
+               .order_by('-n')[:15])
+        for cat in top:
+            self.stdout.write(f'  {cat.name}: {cat.n}')
+        self.stdout.write('=' * 60)
 
-        # --- Очистка старых товаров и изображений ---
-        self.stdout.write('\nОчистка старых данных...')
-        old_images = ProductImage.objects.count()
-        old_products = Product.objects.count()
-        ProductImage.objects.all().delete()
-        Product.objects.all().delete()
-        self.stdout.write(f'  Удалено: {old_products} товаров, {old_images} изображений')
-
-        # --- Создание товаров ---
-        self.stdout.write('\nСоздание товаров...')
-        vm_to_django_product = {}
-        created = 0
+    def _sync_catalog(self, writer, dump, excel_prices, vm_to_django_cat, prune):
+        """Свести товары, их категории, фото и магазины с дампом. Возвращает список Changeset."""
+        # --- Товары: ключ — артикул (product_sku, иначе VM<id>) ---
+        self.stdout.write('\nСверка товаров...')
+        desired = {}
+        desired_cats = {}
         skipped = 0
         without_categories = 0
 
-        for vm_id, data in vm_products_ru.items():
+        for vm_id, data in dump.products.items():
             name = data['name'].strip()
             if not name:
                 skipped += 1
                 continue
 
-            main_info = vm_products_main.get(vm_id, {})
-            sku = main_info.get('sku', '') or f'VM{vm_id}'
+            main_info = dump.products_main.get(vm_id, {})
+            sku = (main_info.get('sku', '') or f'VM{vm_id}')[:64]
             # Сначала ищем цену из Excel по артикулу, потом из VM SQL
-            price = excel_prices.get(sku, vm_prices.get(vm_id, 0))
+            price = excel_prices.get(sku, dump.prices.get(vm_id, 0))
 
             # Категории
-            vm_cat_ids = vm_prod_cats.get(vm_id, [])
-            django_cat_list = []
-            for cid in vm_cat_ids:
-                if cid in vm_to_django_cat:
-                    django_cat_list.append(vm_to_django_cat[cid])
-
-            main_cat = django_cat_list[0] if django_cat_list else None
+            django_cat_list = [vm_to_django_cat[cid] for cid in dump.product_categories.get(vm_id, [])
+                               if cid in vm_to_django_cat]
+            if not django_cat_list:
+                without_categories += 1
 
-            product = Product(
+            desired[sku] = Product(
                 title=name[:100],
-                article=sku[:64],
+                article=sku,
                 description=data.get('description', '')[:5000],
                 price=price,
-                category=main_cat,
+                category=django_cat_list[0] if django_cat_list else None,
                 is_published=True,
+                import_source=Product.IMPORT_SOURCE_VM,
             )
-            product.save()
+            desired_cats[sku] = django_cat_list
 
-            if django_cat_list:
-                product.categories.set(django_cat_list)
-            else:
-                without_categories += 1
+        existing, duplicates = products_by_article(Product.IMPORT_SOURCE_VM)
+        if duplicates:
+            raise CommandError(
+                f'Артикулы повторяются у нескольких товаров ({len(duplicates)}): '
+                f'{", ".join(duplicates[:20])} — исправьте их в админке и запустите снова'
+            )
 
-            vm_to_django_product[vm_id] = product
-            created += 1
+        products_cs, products = diff_objects(Product, existing, desired, SYNC_FIELDS)
+        if prune:
+            products_cs.delete = stale_products(existing, desired, Product.IMPORT_SOURCE_VM)
+        fill_product_slugs(products_cs.create)
+        products_cs.apply(writer)
 
-        self.stdout.write(self.style.SUCCESS(f'  Создано товаров: {created}'))
         if skipped:
             self.stdout.write(self.style.WARNING(f'  Пропущено (нет названия): {skipped}'))
         self.stdout.write(f'  Товаров без категорий (как в источнике): {without_categories}')
 
-        # --- Создание изображений ---
-        self.stdout.write('\nСоздание изображений...')
-        img_created = 0
+        categories_cs = diff_links(
+            Product.categories,
+            ((products[sku].pk, cat.pk) for sku, cats in desired_cats.items() for cat in cats),
+            [product.pk for product in products.values()],
+        )
+        categories_cs.apply(writer)
+
+        # --- Фото: ключ — (артикул, путь); лишние удаляются только у товаров, для которых есть фото в дампе ---
+        self.stdout.write('\nСверка изображений...')
+        by_vm_id = {}
+        for vm_id, data in dump.products.items():
+            sku = (dump.products_main.get(vm_id, {}).get('sku', '') or f'VM{vm_id}')[:64]
+            if sku in products:
+                by_vm_id[vm_id] = sku
+        desired_images = {}
         img_missing = 0
 
-        for vm_prod_id, media_list in vm_prod_medias.items():
-            if vm_prod_id not in vm_to_django_product:
+        for vm_prod_id, media_list in dump.product_medias.items():
+            if vm_prod_id not in by_vm_id:
                 continue
-            product = vm_to_django_product[vm_prod_id]
+            sku = by_vm_id[vm_prod_id]
 
             for ordering, media_id in media_list:
-                if media_id not in vm_medias:
+                if media_id not in dump.medias:
                     continue
-                old_url = vm_medias[media_id]
+                old_url = dump.medias[media_id]
                 # Преобразуем путь: images/product/data/1.jpg -> products/1.jpg
                 filename = os.path.basename(old_url)
                 new_path = f'products/{filename}'
@@ -571,40 +449,30 @@ class Command(BaseCommand):
                     img_missing += 1
                     continue
 
-                ProductImage.objects.create(
-                    product=product,
-                    image=new_path,
-                    sort_order=ordering,
-                )
-                img_created += 1
-
-        self.stdout.write(self.style.SUCCESS(f'  Создано изображений: {img_created}'))
+                desired_images.setdefault((sku, new_path), ProductImage(
+                    product=products[sku], image=new_path, sort_order=ordering,
+                ))
+
+        with_images = {products[sku].pk: sku for sku, _ in desired_images}
+        existing_images = {
+            (with_images[image.product_id], image.image.name): image
+            for image in ProductImage.objects.filter(product_id__in=[pk for pk in with_images if pk])
+        }
+        images_cs, _ = diff_objects(ProductImage, existing_images, desired_images, ['sort_order'], prune=True)
+        images_cs.apply(writer)
         if img_missing:
             self.stdout.write(self.style.WARNING(f'  Файлов не найдено: {img_missing}'))
 
-        # --- Назначаем товары во все активные магазины ---
-        active_stores = list(Store.objects.filter(is_active=True))
-        if active_stores:
-            for p in Product.objects.all():
-                p.stores.set(active_stores)
-            self.stdout.write(f'  Назначено магазинов (M2M) всем товарам: {len(active_stores)}')
-        else:
+        # --- Магазины: товары из дампа добавляются во все активные, ручные назначения не трогаем ---
+        active_stores = list(Store.objects.filter(is_active=True).values_list('pk', flat=True))
+        stores_cs = diff_links(
+            Product.stores,
+            ((product.pk, store_pk) for product in products.values() for store_pk in active_stores),
+            [product.pk for product in products.values()],
+        )
+        stores_cs.delete = []
+        stores_cs.apply(writer)
+        if not active_stores:
             self.stdout.write(self.style.WARNING('  Активные магазины не найдены, M2M stores не назначены'))
 
-        # --- Итог ---
-        self.stdout.write('\n' + '=' * 60)
-        self.stdout.write(self.style.SUCCESS('ГОТОВО!'))
-        self.stdout.write(f'  Категорий:    {Category.objects.count()}')
-        self.stdout.write(f'  Товаров:      {Product.objects.count()}')
-        self.stdout.write(f'  Изображений:  {ProductImage.objects.count()}')
-
-        # Статистика по категориям
-        self.stdout.write('\nТоваров по категориям:')
-        from django.db.models import Count
-        top = (Category.objects
-               .annotate(n=Count('products'))
-               .filter(n__gt=0)
-               .order_by('-n')[:15])
-        for cat in top:
-            self.stdout.write(f'  {cat.name}: {cat.n}')
-        self.stdout.write('=' * 60)
+        return [products_cs, categories_cs, images_cs, stores_cs]
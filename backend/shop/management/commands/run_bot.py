@@ -0,0 +1,183 @@
+"""
+Запускает Telegram-бота (python -m bot.main) под присмотром: один экземпляр на машину,
+перезапуск при падении, статус в health-файле.
+
+    python manage.py run_bot              # запустить (для systemd / второго терминала)
+    python manage.py run_bot --status     # жив ли бот (код выхода 0/1)
+
+Единственность — flock на lock-файле (на Windows — msvcrt.locking): второй run_bot
+не запустит ещё одного бота (два бота с одним токеном получают TelegramConflictError).
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+BOT_DIR = Path(__file__).resolve().parents[4] / 'telegram-bot'
+# Процесс, проработавший дольше этого, считается стартовавшим успешно — пауза сбрасывается
+STABLE_AFTER = 60
+RESTART_DELAY_MAX = 60
+
+
+def read_health(path):
+    try:
+        return json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def _try_lock(fh):
+    """Неблокирующий эксклюзивный захват файла; False, если он уже занят."""
+    if fcntl is not None:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+    # msvcrt блокирует байты от текущей позиции — всегда первый байт файла
+    fh.seek(0)
+    try:
+        msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def acquire_lock(path, write_pid=True):
+    """Открыть и захватить lock-файл; None, если он уже занят другим процессом."""
+    fh = open(path, 'a+', encoding='utf-8')
+    if not _try_lock(fh):
+        fh.close()
+        return None
+    if write_pid:
+        fh.seek(0)
+        fh.truncate()
+        fh.write(str(os.getpid()))
+        fh.flush()
+    return fh
+
+
+class Command(BaseCommand):
+    help = 'Запускает Telegram-бота с блокировкой единственного экземпляра и перезапуском'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bot-dir', default=str(BOT_DIR), help='Папка telegram-bot')
+        parser.add_argument('--python', default='', help='Интерпретатор бота (по умолчанию .venv бота)')
+        parser.add_argument('--lock-file', default='', help='По умолчанию <bot-dir>/bot.lock')
+        parser.add_argument('--health-file', default='', help='По умолчанию <bot-dir>/bot.health.json')
+        parser.add_argument('--log-file', default='', help='Вывод бота в файл (по умолчанию — в stdout)')
+        parser.add_argument('--max-restarts', type=int, default=0, help='0 — перезапускать всегда')
+        parser.add_argument('--status', action='store_true', help='Показать состояние и выйти')
+
+    def handle(self, *args, **options):
+        bot_dir = Path(options['bot_dir'])
+        lock_path = options['lock_file'] or bot_dir / 'bot.lock'
+        self.health_path = Path(options['health_file'] or bot_dir / 'bot.health.json')
+
+        if options['status']:
+            return self._status(lock_path)
+
+        if not (bot_dir / 'bot' / 'main.py').exists():
+            raise CommandError(f'Бот не найден: {bot_dir}')
+        lock = acquire_lock(lock_path)
+        if lock is None:
+            raise CommandError(f'Бот уже запущен (lock {lock_path} занят)')
+
+        python = options['python'] or self._default_python(bot_dir)
+        log_fh = open(options['log_file'], 'a', encoding='utf-8') if options['log_file'] else None
+        self.health = {
+            'supervisor_pid': os.getpid(),
+            'bot_pid': None,
+            'status': 'starting',
+            'started_at': time.time(),
+            'restarts': 0,
+            'last_exit_code': None,
+        }
+        self.stopping = False
+        self.proc = None
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        try:
+            self._supervise(python, bot_dir, log_fh, options['max_restarts'])
+        finally:
+            self._write_health(status='stopped', bot_pid=None)
+            if log_fh:
+                log_fh.close()
+            lock.close()
+
+    def _default_python(self, bot_dir):
+        for venv_python in (bot_dir / '.venv' / 'bin' / 'python', bot_dir / '.venv' / 'Scripts' / 'python.exe'):
+            if venv_python.exists():
+                return str(venv_python)
+        return sys.executable
+
+    def _request_stop(self, *_):
+        self.stopping = True
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+
+    def _write_health(self, **changes):
+        self.health.update(changes, updated_at=time.time())
+        tmp = self.health_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.health), encoding='utf-8')
+        tmp.replace(self.health_path)
+
+    def _supervise(self, python, bot_dir, log_fh, max_restarts):
+        delay = 1
+        while not self.stopping:
+            started = time.monotonic()
+            self.proc = subprocess.Popen(
+                [python, '-m', 'bot.main'], cwd=str(bot_dir), stdout=log_fh, stderr=log_fh,
+            )
+            self._write_health(status='running', bot_pid=self.proc.pid)
+            self.stdout.write(f'Бот запущен (pid {self.proc.pid})')
+            try:
+                code = self.proc.wait()
+            except KeyboardInterrupt:
+                self._request_stop()
+                code = self.proc.wait()
+            if self.stopping:
+                try:
+                    self.proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self.proc.kill()
+                break
+
+            restarts = self.health['restarts'] + 1
+            if max_restarts and restarts > max_restarts:
+                self._write_health(status='failed', bot_pid=None, last_exit_code=code)
+                raise CommandError(f'Бот завершился с кодом {code}, лимит перезапусков исчерпан')
+            if time.monotonic() - started > STABLE_AFTER:
+                delay = 1
+            self._write_health(status='restarting', bot_pid=None, last_exit_code=code, restarts=restarts)
+            self.stderr.write(f'Бот завершился с кодом {code}, перезапуск через {delay} с')
+            deadline = time.monotonic() + delay
+            while not self.stopping and time.monotonic() < deadline:
+                time.sleep(0.2)
+            delay = min(delay * 2, RESTART_DELAY_MAX)
+        self.stdout.write(self.style.SUCCESS('Бот остановлен'))
+
+    def _status(self, lock_path):
+        lock = acquire_lock(lock_path, write_pid=False) if Path(lock_path).exists() else None
+        running = lock is None and Path(lock_path).exists()
+        if lock is not None:
+            lock.close()
+        health = read_health(self.health_path) or {}
+        if not running:
+            raise CommandError(f"Бот не запущен (последний статус: {health.get('status', 'нет данных')})")
+        uptime = int(time.time() - health.get('started_at', time.time()))
+        self.stdout.write(self.style.SUCCESS(
+            f"Бот: {health.get('status', 'running')}, pid {health.get('bot_pid')}, "
+            f"перезапусков {health.get('restarts', 0)}, работает {uptime} с"
+        ))
@@ -0,0 +1,103 @@
+"""
+Выполняет фоновые задачи из очереди (shop/jobs.py): обработку загруженных изображений и т.п.
+
+    python manage.py run_worker --workers 2
+    python manage.py run_worker --once      # выполнить готовые задачи и выйти
+
+Выполненные и упавшие задачи старше --keep-days удаляются при запуске и раз в час.
+"""
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from shop import jobs
+
+PURGE_INTERVAL = 60 * 60
+
+
+def _worker_loop(stop, poll_interval, stale_after):
+    # Дочерний процесс: соединения с БД родителя не используем
+    connections.close_all()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    worker_id = jobs.default_worker_id()
+    while not stop.is_set():
+        job = jobs.claim(worker_id, stale_after=stale_after)
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+        jobs.run_job(job)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркер фоновых задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Число процессов')
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и выйти')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Пауза при пустой очереди, сек')
+        parser.add_argument(
+            '--stale-after', type=int, default=jobs.STALE_AFTER,
+            help='Через сколько секунд задача упавшего воркера снова берётся в работу',
+        )
+        parser.add_argument(
+            '--keep-days', type=float, default=jobs.KEEP_FINISHED / 86400,
+            help='Сколько дней хранить выполненные и упавшие задачи',
+        )
+
+    def purge(self, keep_days):
+        deleted = jobs.purge_finished(keep=keep_days * 86400)
+        if deleted:
+            self.stdout.write(f'Удалено завершённых задач: {deleted}')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.purge(options['keep_days'])
+            count = jobs.run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {count}'))
+            return
+
+        workers = max(1, options['workers'])
+        worker_args = (options['poll_interval'], options['stale_after'])
+        ctx = multiprocessing.get_context('fork')
+        stop = ctx.Event()
+
+        def request_stop(*_):
+            stop.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.purge(options['keep_days'])
+        purged_at = time.monotonic()
+        connections.close_all()
+        processes = []
+        for _ in range(workers):
+            process = ctx.Process(target=_worker_loop, args=(stop, *worker_args), daemon=True)
+            process.start()
+            processes.append(process)
+        self.stdout.write(f'Воркеров запущено: {workers}')
+
+        while not stop.is_set():
+            # Упавший процесс перезапускаем, его задача вернётся в очередь через --stale-after
+            for index, process in enumerate(processes):
+                if not process.is_alive():
+                    self.stderr.write(f'Воркер {process.pid} завершился (код {process.exitcode}), перезапуск')
+                    process = ctx.Process(target=_worker_loop, args=(stop, *worker_args), daemon=True)
+                    process.start()
+                    processes[index] = process
+            if time.monotonic() - purged_at >= PURGE_INTERVAL:
+                self.purge(options['keep_days'])
+                purged_at = time.monotonic()
+                # Соединение родителя не должно достаться перезапущенным воркерам
+                connections.close_all()
+            stop.wait(1.0)
+
+        self.stdout.write('Остановка: ждём завершения текущих задач...')
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS('Воркеры остановлены'))
@@ -3,10 +3,10 @@ from __future__ import annotations
 from pathlib import Path
 import csv
 import re
-import shutil
 
 from django.core.management.base import BaseCommand, CommandError
 
+from shop.file_sync import DEFAULT_WORKERS, ERROR, MISSING, FileSync
 from shop.models import Product
 from .import_joomla_catalog import iter_table_rows, int_or_zero, safe_str
 
@@ -57,6 +57,12 @@ class Command(BaseCommand):
             default="legacy_image_sync_report.csv",
             help="CSV report path (relative to backend dir)",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=DEFAULT_WORKERS,
+            help="Parallel file copy threads",
+        )
 
     def handle(self, *args, **options):
         dump_path = Path(options["dump"]).resolve()
@@ -140,10 +146,9 @@ class Command(BaseCommand):
 
         checked = 0
         updated = 0
-        copied = 0
-        missing_file = 0
         unresolved = 0
         report_rows = []
+        matched = []  # (product, reason, file_rel, legacy_pid)
 
         for p in qs:
             checked += 1
@@ -173,21 +178,23 @@ class Command(BaseCommand):
                 continue
 
             file_rel, legacy_pid, legacy_sku, legacy_title = match
-            src = old_root / file_rel
-            dst = static_root / file_rel
+            matched.append((p, reason, file_rel, legacy_pid))
 
-            if not src.exists():
-                missing_file += 1
+        file_sync = FileSync(workers=options["workers"], log=self.stdout.write)
+        copy_report = file_sync.copy(
+            [(old_root / file_rel, static_root / file_rel) for _, _, file_rel, _ in matched],
+            label="Legacy files",
+        )
+
+        for p, reason, file_rel, legacy_pid in matched:
+            copy_status = copy_report.results[str(static_root / file_rel)]
+            if copy_status in (MISSING, ERROR):
                 report_rows.append(
-                    [p.id, p.title, p.article, p.image, legacy_pid, file_rel, "legacy_file_missing"]
+                    [p.id, p.title, p.article, p.image, legacy_pid, file_rel,
+                     "legacy_file_missing" if copy_status == MISSING else "copy_failed"]
                 )
                 continue
 
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            if not dst.exists():
-                shutil.copy2(src, dst)
-                copied += 1
-
             new_url = f"{backend_base_url}/static/legacy-old/{file_rel}"
             if p.image != new_url:
                 p.image = new_url
@@ -220,8 +227,8 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS("Legacy image sync finished"))
         self.stdout.write(f"Checked products: {checked}")
         self.stdout.write(f"Updated products: {updated}")
-        self.stdout.write(f"Copied files: {copied}")
-        self.stdout.write(f"Missing legacy files: {missing_file}")
+        self.stdout.write(f"Missing legacy files: {copy_report.count(MISSING)}")
+        self.stdout.write(copy_report.summary())
         self.stdout.write(f"Unresolved products: {unresolved}")
         self.stdout.write(f"Report: {report_path}")
 
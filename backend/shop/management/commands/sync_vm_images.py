@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
 """
 Sync product images from old VirtueMart data using the vm_combined.txt mapping.
-Copies images to media/products/ and creates ProductImage records.
+Copies images to media/products/ in parallel (files already there with the same
+content are skipped) and brings ProductImage records of mapped products in line
+with it: missing images are added, sort_order is fixed, images this command added
+earlier (products/<article>_*) that are no longer in the mapping are removed.
+Images uploaded on the site are left alone, and so are rows whose source file
+could not be copied this time. Re-running changes nothing.
 """
 import os
-import re
-import shutil
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from shop.bulk_import import DEFAULT_BATCH_SIZE, BulkWriter, diff_objects
+from shop.file_sync import DEFAULT_WORKERS, ERROR, MISSING, FileSync
 from shop.models import Product, ProductImage
 
 
@@ -233,18 +239,16 @@ MEDIA_DEST = "G:/Мой диск/buket/backend/media/products"
 class Command(BaseCommand):
     help = "Sync product images from old VirtueMart data"
 
-    def handle(self, *args, **options):
-        os.makedirs(MEDIA_DEST, exist_ok=True)
-
-        # Clear existing ProductImage records
-        old_pi = ProductImage.objects.count()
-        ProductImage.objects.all().delete()
-        self.stdout.write(f"Cleared {old_pi} existing ProductImage records")
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Print the changeset and roll it back.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per bulk write.")
+        parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel file copy threads.")
 
-        products_updated = 0
-        images_copied = 0
-        product_images_created = 0
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
         errors = []
+        # Only products that have a mapping are synced; others keep their images.
+        planned = []  # (product, sort_order, src, dest, django_path)
 
         for product in Product.objects.all().order_by("id"):
             article = product.article.strip()
@@ -263,45 +267,68 @@ class Command(BaseCommand):
                     errors.append(f"  NO MAPPING: {product.id}|{article}|{product.title}")
                 continue
 
-            # Copy files and create records
-            first_image = True
             for i, rel_path in enumerate(img_paths):
-                src = os.path.join(OLD_BASE, rel_path)
-                if not os.path.exists(src):
-                    errors.append(f"  FILE NOT FOUND: {src} (product {product.id}|{article})")
-                    continue
-
                 fname = os.path.basename(rel_path)
                 # Prefix with article to avoid collisions
                 dest_fname = f"{article}_{fname}"
-                dest = os.path.join(MEDIA_DEST, dest_fname)
+                planned.append((
+                    product, i, os.path.join(OLD_BASE, rel_path),
+                    os.path.join(MEDIA_DEST, dest_fname), f"products/{dest_fname}",
+                ))
+
+        file_sync = FileSync(workers=options["workers"], dry_run=dry_run, log=self.stdout.write)
+        copy_report = file_sync.copy([(src, dest) for _, _, src, dest, _ in planned], label="Image files")
+
+        desired_products = {}
+        desired_images = {}
+        existing_products = {}
+        failed = set()  # (product pk, django_path) whose source could not be copied
+        for product, i, src, dest, django_path in planned:
+            status = copy_report.results[dest]
+            if status == MISSING:
+                errors.append(f"  FILE NOT FOUND: {src} (product {product.id}|{product.article})")
+            elif status == ERROR:
+                errors.append(f"  COPY FAILED: {src}: {copy_report.errors[dest]}")
+            if status in (MISSING, ERROR) and not os.path.exists(dest):
+                failed.add((product.pk, django_path))
+                continue
 
-                if not os.path.exists(dest):
-                    shutil.copy2(src, dest)
-                    images_copied += 1
+            # First image -> uploaded_image (main photo)
+            if product.pk not in desired_products:
+                existing_products[product.pk] = product
+                desired_products[product.pk] = Product(uploaded_image=django_path, image="")
 
-                django_path = f"products/{dest_fname}"
+            # All images -> ProductImage
+            desired_images.setdefault(
+                (product.pk, django_path),
+                ProductImage(product=product, image=django_path, sort_order=i),
+            )
 
-                # First image -> uploaded_image (main photo)
-                if first_image:
-                    product.uploaded_image = django_path
-                    product.image = ""
-                    product.save(update_fields=["uploaded_image", "image"])
-                    products_updated += 1
-                    first_image = False
+        # Only rows this command creates are pruned; site uploads on mapped products stay.
+        prefixes = {product.pk: f"products/{product.article.strip()}_" for product, *_ in planned}
+        existing_images = {
+            (image.product_id, image.image.name): image
+            for image in ProductImage.objects.filter(product_id__in=list(prefixes))
+            if image.image.name.startswith(prefixes[image.product_id])
+        }
+        # A missing source share or an I/O error must not delete the gallery row.
+        for key in failed:
+            if key in existing_images:
+                desired_images.setdefault(key, existing_images[key])
+        products_cs, _ = diff_objects(Product, existing_products, desired_products, ["uploaded_image", "image"])
+        images_cs, _ = diff_objects(ProductImage, existing_images, desired_images, ["sort_order"], prune=True)
 
-                # All images -> ProductImage
-                ProductImage.objects.create(
-                    product=product,
-                    image=django_path,
-                    sort_order=i,
-                )
-                product_images_created += 1
+        writer = BulkWriter(batch_size=options["batch_size"], log=self.stdout.write)
+        if not dry_run:
+            with transaction.atomic():
+                products_cs.apply(writer)
+                images_cs.apply(writer)
+            writer.finish()
 
-        self.stdout.write(f"\n=== RESULTS ===")
-        self.stdout.write(f"Products updated (main image): {products_updated}")
-        self.stdout.write(f"Image files copied: {images_copied}")
-        self.stdout.write(f"ProductImage records created: {product_images_created}")
+        self.stdout.write(f"\n=== {'DRY RUN' if dry_run else 'RESULTS'} ===")
+        self.stdout.write(products_cs.summary())
+        self.stdout.write(images_cs.summary())
+        self.stdout.write(copy_report.summary())
 
         if errors:
             self.stdout.write(f"\nErrors ({len(errors)}):")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0025_ticker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image_url',
+            field=models.CharField(blank=True, default='', editable=False, help_text='uploaded_image → image; пересчитывается при сохранении и командой backfill_primary_image_urls', max_length=300, verbose_name='Основное изображение (готовый URL)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0027_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storemanager',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Изменён'),
+        ),
+    ]
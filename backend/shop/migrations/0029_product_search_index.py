@@ -0,0 +1,49 @@
+# Полнотекстовый индекс товаров (см. shop/search.py): FTS5 на SQLite, tsvector + GIN на PostgreSQL.
+# DDL записан здесь как есть, а не берётся из shop.search: изменения модуля не должны менять
+# уже применённую миграцию.
+
+from django.db import migrations
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE shop_product_search USING fts5("
+    "title, article, terms, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+]
+TABLE_DDL = (
+    "CREATE TABLE shop_product_search (rowid bigint PRIMARY KEY, "
+    "title text NOT NULL DEFAULT '', article text NOT NULL DEFAULT '', "
+    "terms text NOT NULL DEFAULT '', description text NOT NULL DEFAULT '')"
+)
+POSTGRESQL_DDL = [
+    TABLE_DDL,
+    "ALTER TABLE shop_product_search ADD COLUMN document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', article), 'A') || "
+    "setweight(to_tsvector('simple', terms), 'B') || setweight(to_tsvector('simple', description), 'D')"
+    ") STORED",
+    "CREATE INDEX shop_product_search_document ON shop_product_search USING GIN (document)",
+]
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRESQL_DDL}.get(vendor, [TABLE_DDL])
+    for sql in statements:
+        schema_editor.execute(sql)
+    # Заполнение — данные, не схема: то же делает python manage.py rebuild_search_index
+    from shop import search
+
+    search.index_products(product_model=apps.get_model('shop', 'Product'))
+
+
+def drop_index(apps, schema_editor):
+    schema_editor.execute('DROP TABLE IF EXISTS shop_product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0028_storemanager_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 16:04
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_sold_count(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    sold = (
+        OrderItem.objects.filter(product=models.OuterRef('pk'))
+        .values('product')
+        .annotate(total=models.Sum('qty'))
+        .values('total')
+    )
+    Product.objects.update(sold_count=Coalesce(models.Subquery(sold), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0029_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sold_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Сумма количества в позициях заказов (сортировка «Популярные»)', verbose_name='Продано (шт.)'),
+        ),
+        migrations.RunPython(fill_sold_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['id'], name='shop_product_pub_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['price', 'id'], name='shop_product_pub_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['sold_count', 'id'], name='shop_product_pub_sold_idx'),
+        ),
+    ]
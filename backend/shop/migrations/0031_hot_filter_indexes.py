@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-18 16:06
+
+from django.db import migrations, models
+
+
+def dedupe_category_slugs(apps, schema_editor):
+    """Повторяющиеся slug категорий: первая (по id) сохраняет slug, остальные получают -2, -3..."""
+    Category = apps.get_model('shop', 'Category')
+    categories = list(Category.objects.exclude(slug='').order_by('id'))
+    taken = {category.slug for category in categories}
+    seen = set()
+    for category in categories:
+        if category.slug not in seen:
+            seen.add(category.slug)
+            continue
+        counter = 2
+        while f'{category.slug}-{counter}' in taken:
+            counter += 1
+        category.slug = f'{category.slug}-{counter}'
+        taken.add(category.slug)
+        category.save(update_fields=['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0030_product_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='herobanner',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['sort_order', '-created_at'], name='shop_banner_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_online_showcase', True)), fields=['showcase_sort_order', '-id'], name='shop_product_showcase_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['article'], name='shop_product_article_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['sort_order', '-created_at'], name='shop_review_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='store',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['sort_order', 'name'], name='shop_store_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticker',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['sort_order'], name='shop_ticker_active_idx'),
+        ),
+        migrations.RunPython(dedupe_category_slugs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='category',
+            constraint=models.UniqueConstraint(condition=models.Q(('slug', ''), _negated=True), fields=('slug',), name='shop_category_slug_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0031_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='import_source',
+            field=models.CharField(blank=True, choices=[('', 'Добавлен на сайте'), ('vm', 'VirtueMart (reimport_vm)'), ('jshopping', 'JShopping (import_jshopping_nov)')], db_index=True, default='', help_text='Команды импорта удаляют (--prune) только товары своего источника', max_length=16, verbose_name='Импортирован из'),
+        ),
+    ]
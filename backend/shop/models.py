@@ -1,8 +1,23 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from urllib.parse import urlsplit
 import uuid
 
 
+def normalize_public_url(raw_url):
+    """Абсолютный URL своего сайта → путь (работает на любом домене/порту)."""
+    if not raw_url:
+        return ''
+    if raw_url.startswith('/'):
+        return raw_url
+    parsed = urlsplit(raw_url)
+    if parsed.scheme and parsed.netloc and parsed.path:
+        return parsed.path
+    return raw_url
+
+
 class Store(models.Model):
     subdomain = models.CharField(
         max_length=50,
@@ -31,6 +46,11 @@ class Store(models.Model):
         verbose_name = 'Магазин'
         verbose_name_plural = 'Магазины'
         ordering = ('sort_order', 'name')
+        indexes = [
+            models.Index(
+                fields=['sort_order', 'name'], condition=models.Q(is_active=True), name='shop_store_active_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -90,6 +110,8 @@ class StoreManager(models.Model):
     stores = models.ManyToManyField('Store', related_name='managers', verbose_name='Магазины')
     is_active = models.BooleanField(default=True, verbose_name='Активен')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
+    # Обновляется и при смене магазинов (signals.py) — из него считается managers_version
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменён')
 
     class Meta:
         verbose_name = 'Менеджер магазина'
@@ -98,6 +120,20 @@ class StoreManager(models.Model):
     def __str__(self):
         return f'{self.full_name} ({self.telegram_id})'
 
+    @classmethod
+    def version(cls):
+        """Версия данных менеджеров для кэша бота: меняется при любом изменении,
+        удалении менеджера или его магазинов."""
+        stats = cls.objects.aggregate(count=models.Count('id'), changed=models.Max('updated_at'))
+        changed = stats['changed'].timestamp() if stats['changed'] else 0
+        return f"{stats['count']}:{changed:.6f}"
+
+    @classmethod
+    def touch(cls, queryset=None):
+        """Сдвинуть updated_at (и managers_version) без save() — для изменений магазинов."""
+        queryset = cls.objects.all() if queryset is None else queryset
+        queryset.update(updated_at=timezone.now())
+
 
 class Product(models.Model):
     SHOWCASE_CHANNEL_DELIVERY = 'delivery'
@@ -108,6 +144,13 @@ class Product(models.Model):
         (SHOWCASE_CHANNEL_PICKUP, 'Самовывоз'),
         (SHOWCASE_CHANNEL_BOTH, 'И доставка, и самовывоз'),
     ]
+    IMPORT_SOURCE_VM = 'vm'
+    IMPORT_SOURCE_JSHOPPING = 'jshopping'
+    IMPORT_SOURCE_CHOICES = [
+        ('', 'Добавлен на сайте'),
+        (IMPORT_SOURCE_VM, 'VirtueMart (reimport_vm)'),
+        (IMPORT_SOURCE_JSHOPPING, 'JShopping (import_jshopping_nov)'),
+    ]
 
     title = models.CharField(max_length=100, verbose_name='Название')
     article = models.CharField(max_length=64, blank=True, default="", verbose_name='Артикул')
@@ -158,13 +201,93 @@ class Product(models.Model):
         related_name='created_products',
         verbose_name='Добавил менеджер',
     )
+    import_source = models.CharField(
+        max_length=16,
+        choices=IMPORT_SOURCE_CHOICES,
+        blank=True,
+        default='',
+        db_index=True,
+        verbose_name='Импортирован из',
+        help_text='Команды импорта удаляют (--prune) только товары своего источника',
+    )
+    primary_image_url = models.CharField(
+        max_length=300,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Основное изображение (готовый URL)',
+        help_text='uploaded_image → image; пересчитывается при сохранении и командой backfill_primary_image_urls',
+    )
+    sold_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Продано (шт.)',
+        help_text='Сумма количества в позициях заказов (сортировка «Популярные»)',
+    )
 
     def __str__(self):
         return self.title
 
+    def resolve_primary_image_url(self):
+        if self.uploaded_image:
+            return self.uploaded_image.url
+        if self.image:
+            return normalize_public_url(self.image)
+        return ''
+
+    @property
+    def hover_image_url(self):
+        if self.image:
+            return normalize_public_url(self.image)
+        return self.primary_image_url
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'image', 'uploaded_image'} & set(update_fields):
+            if self.uploaded_image and not self.uploaded_image._committed:
+                # То же, что FileField.pre_save, но до записи строки: storage может переименовать
+                # файл, а верный URL нужен уже обработчикам post_save (поиск, подсказки, кэш)
+                self.uploaded_image.save(self.uploaded_image.name, self.uploaded_image.file, save=False)
+            self.primary_image_url = self.resolve_primary_image_url()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'primary_image_url'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def update_sold_counts(cls, pks=None):
+        """Пересчитать sold_count по позициям заказов (pks=None — у всех товаров)."""
+        sold = (
+            OrderItem.objects.filter(product=models.OuterRef('pk'))
+            .values('product')
+            .annotate(total=models.Sum('qty'))
+            .values('total')
+        )
+        queryset = cls.objects.all() if pks is None else cls.objects.filter(pk__in=pks)
+        queryset.update(sold_count=Coalesce(models.Subquery(sold), 0))
+
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
+        indexes = [
+            # Листинги каталога и API: опубликованные товары по новизне, цене и популярности.
+            # Частичные (WHERE is_published): фильтр is_published=True Django пишет как
+            # WHERE "is_published", и составной индекс с ведущим is_published SQLite не берёт.
+            models.Index(fields=['id'], condition=models.Q(is_published=True), name='shop_product_pub_id_idx'),
+            models.Index(
+                fields=['price', 'id'], condition=models.Q(is_published=True), name='shop_product_pub_price_idx',
+            ),
+            models.Index(
+                fields=['sold_count', 'id'], condition=models.Q(is_published=True), name='shop_product_pub_sold_idx',
+            ),
+            # Онлайн-витрина (главная и API ?online_showcase=1)
+            models.Index(
+                fields=['showcase_sort_order', '-id'],
+                condition=models.Q(is_online_showcase=True),
+                name='shop_product_showcase_idx',
+            ),
+            # Поиск товара по артикулу в импортах
+            models.Index(fields=['article'], name='shop_product_article_idx'),
+        ]
 
 
 class ProductImage(models.Model):
@@ -264,6 +387,10 @@ class Category(models.Model):
         verbose_name_plural = 'Категории'
         ordering = ('sort_order', 'name')
         unique_together = ('name', 'parent')
+        constraints = [
+            # Slug — адрес /store/category/<slug>/; пустой slug (ещё не сгенерирован) может повторяться
+            models.UniqueConstraint(fields=['slug'], condition=~models.Q(slug=''), name='shop_category_slug_uniq'),
+        ]
 
 
 class Review(models.Model):
@@ -293,6 +420,11 @@ class Review(models.Model):
 
     class Meta:
         ordering = ('sort_order', '-created_at')
+        indexes = [
+            models.Index(
+                fields=['sort_order', '-created_at'], condition=models.Q(is_published=True), name='shop_review_pub_idx',
+            ),
+        ]
         verbose_name = 'Отзыв'
         verbose_name_plural = 'Отзывы'
 
@@ -340,6 +472,11 @@ class HeroBanner(models.Model):
 
     class Meta:
         ordering = ('sort_order', '-created_at')
+        indexes = [
+            models.Index(
+                fields=['sort_order', '-created_at'], condition=models.Q(is_active=True), name='shop_banner_active_idx',
+            ),
+        ]
         verbose_name = 'Hero-баннер'
         verbose_name_plural = 'Hero-баннеры'
 
@@ -368,6 +505,9 @@ class Ticker(models.Model):
 
     class Meta:
         ordering = ('sort_order',)
+        indexes = [
+            models.Index(fields=['sort_order'], condition=models.Q(is_active=True), name='shop_ticker_active_idx'),
+        ]
         verbose_name = 'Бегущая строка'
         verbose_name_plural = 'Бегущая строка'
 
@@ -399,3 +539,43 @@ class ShowcaseItem(models.Model):
 
     def __str__(self):
         return f'{self.store.name} — {self.product.title}'
+
+
+class Job(models.Model):
+    """Фоновая задача (обработка изображений и т.п.), выполняется командой run_worker."""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=64, verbose_name='Тип задачи')
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Параметры')
+    dedupe_key = models.CharField(
+        max_length=255, blank=True, default='', db_index=True,
+        verbose_name='Ключ дедупликации',
+        help_text='Пока задача с этим ключом ждёт в очереди, новая не ставится',
+    )
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name='Макс. попыток')
+    run_after = models.DateTimeField(default=timezone.now, verbose_name='Не раньше')
+    locked_by = models.CharField(max_length=100, blank=True, default='', verbose_name='Воркер')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Взята в работу')
+    last_error = models.TextField(blank=True, default='', verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлена')
+
+    class Meta:
+        ordering = ('run_after', 'id')
+        indexes = [models.Index(fields=['status', 'run_after'], name='shop_job_queue_idx')]
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
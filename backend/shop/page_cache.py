@@ -0,0 +1,121 @@
+"""
+Кэш отрендеренных публичных страниц каталога.
+
+Страница кэшируется по хосту (поддомен магазина) + пути с query string и
+привязывается к группам зависимостей ("home", "catalog", "product:<slug>" ...).
+Каждая группа имеет версию в кэше; версия входит в ключ страницы, поэтому
+инвалидация группы (см. shop/signals.py) — это один incr, после которого все
+зависящие от неё страницы перестают находиться, а остальные остаются в кэше.
+Изменения моделей сбрасывают группы после коммита (invalidate_on_commit).
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+
+CACHE_ALIAS = 'pages'
+
+# Группа, от которой зависят все страницы (шапка/подвал: бегущая строка и т.п.)
+SITE_GROUP = 'site'
+
+HITS_KEY = 'page_cache:stats:hits'
+MISSES_KEY = 'page_cache:stats:misses'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version_key(group):
+    return f'page_cache:group:{group}'
+
+
+def _incr(key):
+    cache = _cache()
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключ успели вытеснить между add и incr
+        cache.set(key, 1, None)
+
+
+def _page_key(request, groups):
+    cache = _cache()
+    version_keys = [_version_key(group) for group in groups]
+    versions = cache.get_many(version_keys)
+    versions_part = '.'.join(str(versions.get(key, 0)) for key in version_keys)
+    raw = f'{request.get_host()}|{request.get_full_path()}'
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f'page_cache:page:{digest}:{versions_part}'
+
+
+def invalidate(*groups):
+    """Сбросить страницы, зависящие от перечисленных групп."""
+    for group in set(groups):
+        _incr(_version_key(group))
+
+
+def invalidate_on_commit(*groups):
+    """invalidate() после коммита текущей транзакции (без транзакции — сразу). Сброс до
+    коммита не помогает: запрос между ним и коммитом закэширует старую страницу
+    уже под новой версией группы."""
+    transaction.on_commit(lambda: invalidate(*groups))
+
+
+def cache_stats():
+    values = _cache().get_many([HITS_KEY, MISSES_KEY])
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else 0.0,
+    }
+
+
+def reset_stats():
+    _cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def cached_page(groups_fn):
+    """Декоратор view: кэширует HTML ответа для анонимных GET/HEAD запросов.
+
+    groups_fn(*view_args, **view_kwargs) -> список групп, от которых зависит
+    страница (SITE_GROUP добавляется всегда)."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            user = getattr(request, 'user', None)
+            if (
+                not getattr(settings, 'PAGE_CACHE_ENABLED', True)
+                or request.method not in ('GET', 'HEAD')
+                # Страницы сотрудников и менеджеров (CSRF-токен, панели) не должны уйти анонимам
+                or (user is not None and user.is_authenticated)
+            ):
+                return view(request, *args, **kwargs)
+
+            groups = [SITE_GROUP, *groups_fn(*args, **kwargs)]
+            key = _page_key(request, groups)
+            cached = _cache().get(key)
+            if cached is not None:
+                _incr(HITS_KEY)
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+                response['X-Page-Cache'] = 'hit'
+                return response
+
+            _incr(MISSES_KEY)
+            response = view(request, *args, **kwargs)
+            # Редиректы, 404 и ответы с cookies не кэшируем
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                _cache().set(key, (response.content, response['Content-Type']))
+            response['X-Page-Cache'] = 'miss'
+            return response
+        return wrapper
+    return decorator
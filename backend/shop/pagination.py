@@ -0,0 +1,57 @@
+"""
+Пагинация API.
+
+Курсорная (стабильный порядок, без глубоких OFFSET-сканов) — у viewset'ов
+с pagination_class = StableCursorPagination (товары, отзывы, категории, заказы);
+глобально не включается, чтобы не менять порядок и формат ответа остальных.
+Админские инструменты могут явно запросить limit/offset через ?pagination=offset.
+"""
+
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+def _view_ordering(view, default):
+    get_ordering = getattr(view, 'get_pagination_ordering', None)
+    if get_ordering is not None:
+        return tuple(get_ordering())
+    return tuple(getattr(view, 'pagination_ordering', default))
+
+
+class StableCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-id',)
+
+    def get_ordering(self, request, queryset, view):
+        return _view_ordering(view, self.ordering)
+
+
+class AdminOffsetPagination(LimitOffsetPagination):
+    default_limit = 50
+    max_limit = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = queryset.order_by(*_view_ordering(view, StableCursorPagination.ordering))
+        return super().paginate_queryset(queryset, request, view)
+
+
+class OffsetPaginationOptInMixin:
+    """?pagination=offset переключает viewset на limit/offset — только для staff."""
+
+    offset_pagination_class = AdminOffsetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            request = getattr(self, 'request', None)
+            wants_offset = (
+                request is not None
+                and request.query_params.get('pagination') == 'offset'
+                and request.user.is_staff
+            )
+            if wants_offset:
+                self._paginator = self.offset_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
@@ -0,0 +1,291 @@
+"""
+Полнотекстовый поиск товаров: название, артикул, описание, категории и цветы (FlowerTag).
+
+Индекс — таблица shop_product_search в той же БД (миграция 0029): на SQLite это
+виртуальная таблица FTS5, на PostgreSQL — обычная таблица с tsvector и GIN-индексом.
+В индекс пишутся не исходные тексты, а основы слов (стеммер Snowball для русского),
+поэтому «розы», «розами» и «роз» находят друг друга. Запрос латиницей ищется ещё
+и в транслитерации («pion» -> «пион») и в русской раскладке («hjps» -> «розы»).
+
+Индекс обновляется сигналами (shop/signals.py) в той же транзакции, что и товар;
+после пакетных импортов без сигналов — BulkWriter.finish() или
+python manage.py rebuild_search_index.
+"""
+
+import re
+from functools import lru_cache
+
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Prefetch, Value, When
+
+TABLE = 'shop_product_search'
+COLUMNS = ('title', 'article', 'terms', 'description')
+# Вес совпадения по колонкам (bm25 на SQLite; на PostgreSQL — setweight A/A/B/D)
+WEIGHTS = (10.0, 8.0, 4.0, 1.0)
+# Сколько лучших совпадений возвращает search_ids()
+SEARCH_LIMIT = 500
+INDEX_BATCH_SIZE = 500
+
+# Слова короче не стеммятся: в запросе это обычно начало слова («роз», «пио»)
+MIN_STEM_LENGTH = 4
+STOP_WORDS = frozenset('а в во для до и из или к ко на не о об от по с со у'.split())
+
+_WORD_RE = re.compile(r'\w+')
+_CYRILLIC_RE = re.compile(r'[а-я]')
+_LATIN_RE = re.compile(r'[a-z]')
+
+# --- Стеммер Snowball (русский), https://snowballstem.org/algorithms/russian/stemmer.html ---
+
+_VOWELS = 'аеиоуыэюя'
+_RV_RE = re.compile(rf'^(.*?[{_VOWELS}])(.*)$')
+_PERFECTIVE_GERUND_RE = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE_RE = re.compile(r'(с[яь])$')
+_ADJECTIVE_RE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+)
+_PARTICIPLE_RE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB_RE = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN_RE = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_DERIVATIONAL_RE = re.compile(rf'.*[^{_VOWELS}]+[{_VOWELS}].*ость?$')
+_DER_RE = re.compile(r'ость?$')
+_SUPERLATIVE_RE = re.compile(r'(ейше|ейш)$')
+
+
+@lru_cache(maxsize=50_000)
+def stem(word):
+    """Основа русского слова (слово уже в нижнем регистре, ё заменена на е)."""
+    m = _RV_RE.match(word)
+    if not m:
+        return word
+    head, rv = m.groups()
+    temp = _PERFECTIVE_GERUND_RE.sub('', rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE_RE.sub('', rv, 1)
+        temp = _ADJECTIVE_RE.sub('', rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE_RE.sub('', temp, 1)
+        else:
+            temp = _VERB_RE.sub('', rv, 1)
+            rv = _NOUN_RE.sub('', rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    if _DERIVATIONAL_RE.match(rv):
+        rv = _DER_RE.sub('', rv, 1)
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = _SUPERLATIVE_RE.sub('', rv, 1)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return head + rv
+
+
+# --- Транслитерация и раскладка ---
+
+_TRANSLIT = [
+    ('shch', 'щ'), ('sch', 'щ'), ('zh', 'ж'), ('kh', 'х'), ('ts', 'ц'), ('ch', 'ч'), ('sh', 'ш'),
+    ('yu', 'ю'), ('ya', 'я'), ('yo', 'е'), ('ju', 'ю'), ('ja', 'я'), ('jo', 'е'),
+    ('a', 'а'), ('b', 'б'), ('c', 'к'), ('d', 'д'), ('e', 'е'), ('f', 'ф'), ('g', 'г'), ('h', 'х'),
+    ('i', 'и'), ('j', 'й'), ('k', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'), ('o', 'о'), ('p', 'п'),
+    ('q', 'к'), ('r', 'р'), ('s', 'с'), ('t', 'т'), ('u', 'у'), ('v', 'в'), ('w', 'в'), ('x', 'кс'),
+    ('y', 'ы'), ('z', 'з'),
+]
+_TRANSLIT_RE = re.compile('|'.join(latin for latin, _ in _TRANSLIT))
+_TRANSLIT_MAP = dict(_TRANSLIT)
+_LAYOUT = str.maketrans(
+    "qwertyuiop[]asdfghjkl;'zxcvbnm,.`",
+    'йцукенгшщзхъфывапролджэячсмитьбюе',
+)
+
+
+def transliterate(text):
+    """Латиница -> кириллица: «buket roz» -> «букет роз»."""
+    return _TRANSLIT_RE.sub(lambda m: _TRANSLIT_MAP[m.group(0)], text)
+
+
+def fix_layout(text):
+    """Текст, набранный в английской раскладке вместо русской: «,ertn» -> «букет»."""
+    return text.translate(_LAYOUT)
+
+
+# --- Нормализация ---
+
+def normalize(text):
+    return (text or '').lower().replace('ё', 'е')
+
+
+def has_latin(text):
+    return bool(_LATIN_RE.search(text))
+
+
+def _term(token):
+    if len(token) >= MIN_STEM_LENGTH and _CYRILLIC_RE.search(token):
+        return stem(token)
+    return token
+
+
+def terms(text):
+    """Основы слов текста (так он хранится в индексе)."""
+    return [_term(token) for token in _WORD_RE.findall(normalize(text))]
+
+
+def _article_terms(article):
+    tokens = terms(article)
+    digits = ''.join(ch for ch in article if ch.isdigit())
+    # «0012» ищется и как «12»
+    if digits and digits.lstrip('0') and digits.lstrip('0') not in tokens:
+        tokens.append(digits.lstrip('0'))
+    return tokens
+
+
+def _query_term(token):
+    """(основа, искать по началу): полное русское слово ищется по точной основе,
+    короткое («роз», «пио»), латиница и цифры — как начало слова."""
+    term = _term(token)
+    return term, term == token
+
+
+def query_variants(query):
+    """Варианты запроса (списки (основа, по началу)): как есть, транслитерация
+    и русская раскладка для латиницы."""
+    raw = normalize(query)
+    variants = [raw]
+    if has_latin(raw):
+        variants += [transliterate(raw), fix_layout(raw)]
+    result = []
+    for variant in variants:
+        words = [_query_term(token) for token in _WORD_RE.findall(variant) if token not in STOP_WORDS]
+        if words and words not in result:
+            result.append(words)
+    return result
+
+
+# --- Запись индекса ---
+
+def _row(product):
+    names = []
+    for category in product.categories.all():
+        names.append(category.name)
+    if product.category is not None:
+        names.append(product.category.name)
+    names.extend(tag.name for tag in product.flower_tags.all())
+    return (
+        product.pk,
+        ' '.join(terms(product.title)),
+        ' '.join(_article_terms(product.article or '')),
+        ' '.join(terms(' '.join(dict.fromkeys(names)))),
+        ' '.join(terms(product.description)),
+    )
+
+
+def _write(cursor, rows):
+    placeholders = ', '.join(['%s'] * (len(COLUMNS) + 1))
+    cursor.executemany(
+        f'INSERT INTO {TABLE} (rowid, {", ".join(COLUMNS)}) VALUES ({placeholders})', rows,
+    )
+
+
+def _delete(cursor, pks):
+    for start in range(0, len(pks), INDEX_BATCH_SIZE):
+        batch = pks[start:start + INDEX_BATCH_SIZE]
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({", ".join(["%s"] * len(batch))})', batch)
+
+
+def index_products(pks=None, product_model=None):
+    """Переиндексировать товары pks (None — весь каталог с нуля).
+
+    product_model — для вызова из миграции (историческая модель); по умолчанию shop.Product.
+    """
+    if product_model is None:
+        from .models import Product as product_model
+    category_model = product_model._meta.get_field('category').related_model
+    queryset = product_model.objects.order_by('pk').select_related('category').prefetch_related(
+        Prefetch('categories', queryset=category_model.objects.only('name')), 'flower_tags',
+    ).only('pk', 'title', 'article', 'description', 'category__name')
+    # Одна транзакция: на SQLite вставка без неё коммитит каждую строку FTS5
+    with transaction.atomic(), connection.cursor() as cursor:
+        if pks is None:
+            cursor.execute(f'DELETE FROM {TABLE}')
+        else:
+            pks = sorted(set(pks))
+            _delete(cursor, pks)
+            queryset = queryset.filter(pk__in=pks)
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:INDEX_BATCH_SIZE])
+            if not batch:
+                break
+            _write(cursor, [_row(product) for product in batch])
+            last_pk = batch[-1].pk
+        if pks is None and connection.vendor == 'sqlite':
+            # Слить сегменты FTS5 после полной перестройки — иначе запросы медленнее в разы
+            cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+
+
+def remove_products(pks):
+    with connection.cursor() as cursor:
+        _delete(cursor, sorted(set(pks)))
+
+
+# --- Поиск ---
+
+def _sqlite_query(variants):
+    # Слова в кавычках, "..."* — по началу; варианты запроса через OR
+    return ' OR '.join(
+        '(' + ' AND '.join(f'"{word}"' + ('*' if prefix else '') for word, prefix in words) + ')'
+        for words in variants
+    )
+
+
+def _postgres_query(variants):
+    return ' | '.join(
+        '(' + ' & '.join(word + (':*' if prefix else '') for word, prefix in words) + ')'
+        for words in variants
+    )
+
+
+def search_ids(query, limit=SEARCH_LIMIT):
+    """id товаров по запросу, лучшие совпадения первыми."""
+    variants = query_variants(query)
+    if not variants:
+        return []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            weights = ', '.join(str(weight) for weight in WEIGHTS)
+            cursor.execute(
+                f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s '
+                f'ORDER BY bm25({TABLE}, {weights}) LIMIT %s',
+                [_sqlite_query(variants), limit],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"SELECT rowid FROM {TABLE} WHERE document @@ to_tsquery('simple', %s) "
+                f"ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC, rowid DESC LIMIT %s",
+                [_postgres_query(variants)] * 2 + [limit],
+            )
+        else:
+            # Без полнотекстового индекса: подстрока основы в любой колонке
+            document = " || ' ' || ".join(COLUMNS)
+            where = ' OR '.join(
+                '(' + ' AND '.join([f'{document} LIKE %s'] * len(words)) + ')' for words in variants
+            )
+            params = [f'%{word}%' for words in variants for word, _ in words]
+            cursor.execute(f'SELECT rowid FROM {TABLE} WHERE {where} ORDER BY rowid DESC LIMIT %s', params + [limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ranked(queryset, ids):
+    """queryset, ограниченный ids, с аннотацией search_rank (0 — лучшее совпадение)."""
+    return queryset.filter(pk__in=ids).annotate(search_rank=Case(
+        *[When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)],
+        default=Value(len(ids)),
+        output_field=IntegerField(),
+    ))
+
@@ -1,5 +1,10 @@
+import re
+
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.utils.text import slugify
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
@@ -48,6 +53,39 @@ class StoreManagerSerializer(serializers.ModelSerializer):
         fields = ['telegram_id', 'telegram_username', 'full_name', 'is_active', 'stores']
 
 
+def _bot_manager_for_store(telegram_id, store):
+    """Активный менеджер с доступом к магазину — одним запросом; иначе ValidationError."""
+    manager = (
+        StoreManager.objects.filter(telegram_id=telegram_id, is_active=True)
+        .annotate(has_store=Exists(StoreManager.stores.through.objects.filter(
+            storemanager_id=OuterRef('pk'), store_id=store.id,
+        )))
+        .first()
+    )
+    if not manager:
+        raise serializers.ValidationError({'telegram_id': 'Пользователь не авторизован.'})
+    if not manager.has_store:
+        raise serializers.ValidationError({'store_id': 'Нет доступа к выбранному магазину.'})
+    return manager
+
+
+def unique_product_slugs(base_slug, count):
+    """count свободных slug вида base, base-1, base-2... — одним запросом."""
+    pattern = re.compile(rf'{re.escape(base_slug)}(-\d+)?')
+    taken = {
+        slug for slug in Product.objects.filter(slug__startswith=base_slug).values_list('slug', flat=True)
+        if pattern.fullmatch(slug)
+    }
+    slugs = []
+    counter = 0
+    while len(slugs) < count:
+        slug = f'{base_slug}-{counter}' if counter else base_slug
+        if slug not in taken:
+            slugs.append(slug)
+        counter += 1
+    return slugs
+
+
 class BotProductCreateSerializer(serializers.ModelSerializer):
     telegram_id = serializers.IntegerField(write_only=True)
     store_id = serializers.PrimaryKeyRelatedField(queryset=Store.objects.filter(is_active=True), write_only=True)
@@ -57,15 +95,7 @@ class BotProductCreateSerializer(serializers.ModelSerializer):
         fields = ['telegram_id', 'store_id', 'uploaded_image', 'price', 'title', 'description']
 
     def validate(self, attrs):
-        telegram_id = attrs.get('telegram_id')
-        store = attrs.get('store_id')
-        manager = StoreManager.objects.filter(telegram_id=telegram_id, is_active=True).first()
-        if not manager:
-            raise serializers.ValidationError({'telegram_id': 'Пользователь не авторизован.'})
-        if not manager.stores.filter(id=store.id, is_active=True).exists():
-            raise serializers.ValidationError({'store_id': 'Нет доступа к выбранному магазину.'})
-
-        attrs['_manager'] = manager
+        attrs['_manager'] = _bot_manager_for_store(attrs.get('telegram_id'), attrs.get('store_id'))
         return attrs
 
     def create(self, validated_data):
@@ -81,12 +111,7 @@ class BotProductCreateSerializer(serializers.ModelSerializer):
 
         # Генерируем уникальный slug из названия
         base_slug = slugify(validated_data['title'], allow_unicode=False) or 'buket'
-        slug = base_slug
-        counter = 1
-        while Product.objects.filter(slug=slug).exists():
-            slug = f"{base_slug}-{counter}"
-            counter += 1
-        validated_data['slug'] = slug
+        validated_data['slug'] = unique_product_slugs(base_slug, 1)[0]
 
         product = Product.objects.create(**validated_data)
         product.stores.set([store])
@@ -94,6 +119,72 @@ class BotProductCreateSerializer(serializers.ModelSerializer):
         ShowcaseItem.objects.get_or_create(store=store, product=product)
         return product
 
+
+class BotProductBulkCreateSerializer(serializers.Serializer):
+    """Альбом из бота: по товару на каждое фото, общие цена/название/магазин."""
+    MAX_IMAGES = 10  # больше в одном альбоме Telegram не бывает
+
+    telegram_id = serializers.IntegerField(write_only=True)
+    store_id = serializers.PrimaryKeyRelatedField(queryset=Store.objects.filter(is_active=True), write_only=True)
+    uploaded_images = serializers.ListField(
+        child=serializers.ImageField(), min_length=1, max_length=MAX_IMAGES, write_only=True,
+    )
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    title = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    description = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        attrs['_manager'] = _bot_manager_for_store(attrs.get('telegram_id'), attrs.get('store_id'))
+        return attrs
+
+    def create(self, validated_data):
+        """Товары, связи с магазином и ShowcaseItem — пачками в одной транзакции.
+        bulk_create не шлёт сигналов и не вызывает Product.save():
+        primary_image_url — здесь же, кэш страниц, поиск, подсказки и фасеты —
+        в BotProductBulkCreateView (bulk_import.after_bulk_write).
+        Файлы сохраняются до записи строк; при откате они удаляются."""
+        store = validated_data['store_id']
+        manager = validated_data['_manager']
+        title = validated_data.get('title') or 'Букет'
+        images = validated_data['uploaded_images']
+        base_slug = slugify(title, allow_unicode=False) or 'buket'
+
+        products = []
+        try:
+            with transaction.atomic():
+                for slug, image in zip(unique_product_slugs(base_slug, len(images)), images):
+                    product = Product(
+                        title=title,
+                        slug=slug,
+                        price=validated_data.get('price'),
+                        description=validated_data.get('description', ''),
+                        created_by=manager,
+                        is_online_showcase=True,
+                        is_published=True,
+                    )
+                    # Файл сохраняем заранее: его URL нужен для primary_image_url
+                    product.uploaded_image.save(image.name, image, save=False)
+                    products.append(product)
+                    product.primary_image_url = product.resolve_primary_image_url()
+                Product.objects.bulk_create(products)
+                Product.stores.through.objects.bulk_create([
+                    Product.stores.through(product_id=product.id, store_id=store.id) for product in products
+                ])
+                ShowcaseItem.objects.bulk_create([ShowcaseItem(store=store, product=product) for product in products])
+        except BaseException:
+            # Строки откатились — без этого файлы остались бы в media без товаров
+            delete_uploaded_images(products)
+            raise
+        return products
+
+
+def delete_uploaded_images(products):
+    """Удалить из storage уже сохранённые uploaded_image товаров, чьи строки откатились."""
+    for product in products:
+        if product.uploaded_image:
+            product.uploaded_image.delete(save=False)
+
+
 class DiscountSerializer(serializers.ModelSerializer):
     class Meta:
         model = Discount
@@ -120,6 +211,38 @@ class OrderSerializer(serializers.ModelSerializer):
         return order
 
 
+CATEGORY_TREE_CACHE_KEY = 'shop:category_tree'
+# Конечный срок: с locmem-кэшем сброс из signals.py виден только своему процессу
+CATEGORY_TREE_TIMEOUT = 5 * 60
+
+
+def category_children_tree():
+    """{parent_id: [вложенные dict дочерних категорий]} для всего дерева.
+    Строится одним запросом и живёт в кэше до изменения Category (см. signals.py),
+    но не дольше CATEGORY_TREE_TIMEOUT."""
+    tree = cache.get(CATEGORY_TREE_CACHE_KEY)
+    if tree is not None:
+        return tree
+
+    rows = Category.objects.order_by('sort_order', 'name').values('id', 'name', 'parent_id', 'sort_order')
+    nodes = {}
+    tree = {}
+    for row in rows:
+        nodes[row['id']] = {
+            'id': row['id'],
+            'name': row['name'],
+            'parent': row['parent_id'],
+            'sort_order': row['sort_order'],
+            'children': [],
+        }
+    for node in nodes.values():
+        tree.setdefault(node['parent'], []).append(node)
+    for node_id, node in nodes.items():
+        node['children'] = tree.get(node_id, [])
+    cache.set(CATEGORY_TREE_CACHE_KEY, tree, CATEGORY_TREE_TIMEOUT)
+    return tree
+
+
 class CategorySerializer(serializers.ModelSerializer):
     children = serializers.SerializerMethodField()
 
@@ -128,10 +251,7 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'parent', 'sort_order', 'children']
 
     def get_children(self, obj):
-        children = obj.children.all()
-        if children.exists():
-            return CategorySerializer(children, many=True).data
-        return []
+        return category_children_tree().get(obj.id, [])
 
 
 class ReviewSerializer(serializers.ModelSerializer):
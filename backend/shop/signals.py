@@ -0,0 +1,216 @@
+"""
+Инвалидация кэшей при изменении моделей: публичные страницы (shop/page_cache.py),
+дерево категорий API (serializers.category_children_tree) и кэш менеджеров в боте
+(StoreManager.version). Здесь же обновляются поисковый индекс товаров (shop/search.py),
+индекс подсказок (shop/suggest.py) и маски фасетов каталога (shop/facets.py).
+"""
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import facets, page_cache, search, suggest
+from .models import (
+    Category, FlowerTag, HeroBanner, OrderItem, Product, Review, ShowcaseItem, Store, StoreManager, StorePhone,
+    StorePhoto, Ticker,
+)
+from .serializers import CATEGORY_TREE_CACHE_KEY
+
+# Какие группы страниц зависят от модели (группы страниц — см. декораторы в views.py)
+MODEL_GROUPS = {
+    Product: ('home', 'catalog', 'categories'),
+    Category: ('home', 'catalog', 'categories', 'products'),
+    FlowerTag: ('catalog', 'products'),
+    ShowcaseItem: ('home',),
+    HeroBanner: ('home',),
+    Review: ('home',),
+    Store: ('home', 'contacts', 'products'),
+    StorePhone: ('contacts',),
+    StorePhoto: ('contacts',),
+    Ticker: (page_cache.SITE_GROUP,),
+}
+
+M2M_SENDERS = (
+    Product.categories.through,
+    Product.flower_tags.through,
+    Product.stores.through,
+)
+
+
+def _product_groups(product):
+    groups = list(MODEL_GROUPS[Product])
+    if product.slug:
+        groups.append(f'product:{product.slug}')
+    return groups
+
+
+def invalidate_instance(instance):
+    """Сбросить страницы, зависящие от объекта (также вызывается из фоновых задач)."""
+    sender = type(instance)
+    if sender is Product:
+        page_cache.invalidate_on_commit(*_product_groups(instance))
+    elif sender in MODEL_GROUPS:
+        page_cache.invalidate_on_commit(*MODEL_GROUPS[sender])
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_on_change(sender, instance, **kwargs):
+    if sender not in MODEL_GROUPS or kwargs.get('raw'):
+        return
+    invalidate_instance(instance)
+
+
+@receiver(m2m_changed)
+def invalidate_on_m2m_change(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if sender not in M2M_SENDERS or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        page_cache.invalidate_on_commit(*_product_groups(instance))
+        return
+    # Изменение со стороны категории/тега/магазина: затронуты товары из pk_set
+    groups = list(MODEL_GROUPS[Product])
+    if pk_set:
+        slugs = Product.objects.filter(pk__in=pk_set).exclude(slug='').values_list('slug', flat=True)
+        groups.extend(f'product:{slug}' for slug in slugs)
+    else:
+        groups.append('products')
+    page_cache.invalidate_on_commit(*groups)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, **kwargs):
+    # После коммита: иначе параллельный запрос успеет закэшировать старое дерево на весь TTL
+    transaction.on_commit(lambda: cache.delete(CATEGORY_TREE_CACHE_KEY))
+
+
+@receiver(m2m_changed, sender=StoreManager.stores.through)
+def touch_managers_on_stores_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        StoreManager.touch(StoreManager.objects.filter(pk=instance.pk))
+    elif pk_set:
+        StoreManager.touch(StoreManager.objects.filter(pk__in=pk_set))
+    else:
+        StoreManager.touch(StoreManager.objects.filter(stores=instance))
+
+
+@receiver(post_save, sender=Store)
+@receiver(pre_delete, sender=Store)
+def touch_managers_on_store_change(sender, instance, **kwargs):
+    # Название/активность магазина входят в профиль менеджера, который кэширует бот
+    if kwargs.get('raw'):
+        return
+    StoreManager.touch(StoreManager.objects.filter(stores=instance))
+
+
+# --- Поисковый индекс: товар, его категории и цветы ---
+
+SEARCH_M2M_SENDERS = (Product.categories.through, Product.flower_tags.through)
+
+
+def _related_product_ids(instance):
+    if isinstance(instance, Category):
+        return set(instance.products.values_list('pk', flat=True)) | set(
+            instance.main_products.values_list('pk', flat=True)
+        )
+    return set(instance.products.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+@receiver(m2m_changed)
+def reindex_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if sender not in SEARCH_M2M_SENDERS:
+        return
+    if action == 'pre_clear' and reverse:
+        # После clear() со стороны категории/тега pk_set пуст — запоминаем товары заранее
+        instance._search_product_ids = _related_product_ids(instance)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        search.index_products([instance.pk])
+    elif action == 'post_clear':
+        search.index_products(getattr(instance, '_search_product_ids', ()))
+    else:
+        search.index_products(pk_set)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=FlowerTag)
+def reindex_on_name_change(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        search.index_products(_related_product_ids(instance))
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=FlowerTag)
+def remember_products_before_delete(sender, instance, **kwargs):
+    # Связи удаляются каскадом без m2m_changed
+    instance._search_product_ids = _related_product_ids(instance)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=FlowerTag)
+def reindex_after_delete(sender, instance, **kwargs):
+    search.index_products(getattr(instance, '_search_product_ids', ()))
+
+
+# --- Подсказки поиска: индекс в памяти, меняется только после коммита ---
+
+SUGGEST_ENTRIES = {
+    Product: (suggest.PRODUCT, suggest.product_entry),
+    Category: (suggest.CATEGORY, suggest.category_entry),
+    FlowerTag: (suggest.FLOWER, suggest.flower_entry),
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def update_suggestions(sender, instance, **kwargs):
+    if sender not in SUGGEST_ENTRIES or kwargs.get('raw'):
+        return
+    kind, make_entry = SUGGEST_ENTRIES[sender]
+    entry = make_entry(instance) if kwargs.get('signal') is post_save else None
+    pk = instance.pk
+    transaction.on_commit(lambda: suggest.apply(kind, pk, entry))
+
+
+# --- Фасеты каталога: маски перестраиваются при первом запросе после коммита ---
+
+FACET_MODELS = (Product, Category, FlowerTag, Store)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_facets(sender, **kwargs):
+    if sender in FACET_MODELS and not kwargs.get('raw'):
+        transaction.on_commit(facets.invalidate)
+
+
+@receiver(m2m_changed)
+def invalidate_facets_on_m2m_change(sender, action, **kwargs):
+    if sender in M2M_SENDERS and action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(facets.invalidate)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def update_sold_count(sender, instance, raw=False, **kwargs):
+    # sold_count — порядок «Популярные» в API и в масках фасетов
+    if raw:
+        return
+    Product.update_sold_counts([instance.product_id])
+    transaction.on_commit(facets.invalidate)
@@ -0,0 +1,252 @@
+"""
+Подсказки при наборе в поиске: товары, категории и цветы (FlowerTag) по началу слов
+(«пио» -> «Пионы», «Букет из пионов»; латиница — в транслитерации и русской раскладке).
+
+Индекс живёт в памяти процесса и при запросе БД не трогает: отсортированный массив
+(слово, запись) — bisect по началу слова, затем top-k по популярности (товар — сколько
+штук заказано, категория и цветок — сколько в них опубликованных товаров).
+
+Строится при старте процесса (wsgi.py, в фоне) или при первом запросе. Изменения
+моделей применяются сигналами точечно после коммита (shop/signals.py). Каждое изменение
+сдвигает версию в кэше: процесс, который видит чужую версию, перестраивает свой индекс
+целиком; популярность пересчитывается так же, но не чаще раза в REBUILD_INTERVAL.
+"""
+
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+
+from . import search
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+# Если слово запроса — начало слов у стольких записей, перебор идёт по популярности
+DENSE_RANGE = 1000
+# Полная перестройка (популярность) не чаще, чем раз в столько секунд
+REBUILD_INTERVAL = 10 * 60
+VERSION_KEY = 'suggest:version'
+
+PRODUCT = 'product'
+CATEGORY = 'category'
+FLOWER = 'flower'
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def _words(text):
+    return _WORD_RE.findall(search.normalize(text))
+
+
+class Entry:
+    __slots__ = ('kind', 'pk', 'title', 'url', 'popularity', 'words')
+
+    def __init__(self, kind, pk, title, url, popularity=0):
+        self.kind = kind
+        self.pk = pk
+        self.title = title
+        self.url = url
+        self.popularity = popularity
+        self.words = tuple(dict.fromkeys(_words(title)))
+
+    @property
+    def key(self):
+        return self.kind, self.pk
+
+    def as_dict(self):
+        return {'type': self.kind, 'id': self.pk, 'title': self.title, 'url': self.url}
+
+
+def product_entry(product, popularity=0):
+    if not product.is_published or not product.slug:
+        return None
+    return Entry(PRODUCT, product.pk, product.title, f'/store/{product.slug}/', popularity)
+
+
+def category_entry(category, popularity=0):
+    if not category.slug:
+        return None
+    return Entry(CATEGORY, category.pk, category.name, f'/store/category/{category.slug}/', popularity)
+
+
+def flower_entry(tag, popularity=0):
+    if not tag.slug:
+        return None
+    return Entry(FLOWER, tag.pk, tag.name, f'/store/flower/{tag.slug}/', popularity)
+
+
+class PrefixIndex:
+    """Записи и отсортированный массив (слово, kind, pk) по всем словам их названий."""
+
+    def __init__(self, entries=()):
+        self.entries = {entry.key: entry for entry in entries}
+        self.keys = sorted((word, *entry.key) for entry in self.entries.values() for word in entry.words)
+        self.lock = threading.Lock()
+        self.built_at = time.monotonic()
+        self._ranked_cache = sorted(self.entries.values(), key=_rank, reverse=True)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _unindex(self, entry):
+        for word in entry.words:
+            i = bisect.bisect_left(self.keys, (word, *entry.key))
+            if i < len(self.keys) and self.keys[i] == (word, *entry.key):
+                del self.keys[i]
+
+    def put(self, entry):
+        """Добавить или заменить запись; популярность старой записи сохраняется."""
+        with self.lock:
+            old = self.entries.get(entry.key)
+            if old is not None:
+                entry.popularity = old.popularity
+                self._unindex(old)
+            self.entries[entry.key] = entry
+            for word in entry.words:
+                bisect.insort(self.keys, (word, *entry.key))
+            self._ranked_cache = None
+
+    def remove(self, kind, pk):
+        with self.lock:
+            old = self.entries.pop((kind, pk), None)
+            if old is not None:
+                self._unindex(old)
+                self._ranked_cache = None
+
+    def _ranked(self):
+        """Записи по убыванию популярности (пересортировка только после изменений)."""
+        ranked = self._ranked_cache
+        if ranked is None:
+            with self.lock:
+                ranked = self._ranked_cache = sorted(self.entries.values(), key=_rank, reverse=True)
+        return ranked
+
+    def _range(self, prefix):
+        return (
+            bisect.bisect_left(self.keys, (prefix,)),
+            bisect.bisect_left(self.keys, (prefix + '\U0010ffff',)),
+        )
+
+    def lookup(self, query, limit=DEFAULT_LIMIT, kinds=None):
+        """Записи, у которых каждое слово запроса — начало какого-то слова названия."""
+        raw = search.normalize(query)
+        variants = [raw]
+        if search.has_latin(raw):
+            variants += [search.transliterate(raw), search.fix_layout(raw)]
+        matched = {}
+        for variant in variants:
+            tokens = _words(variant)
+            if not tokens:
+                continue
+            # Перебор по самому редкому слову запроса (самому узкому диапазону в keys)
+            lo, hi = min((self._range(token) for token in tokens), key=lambda bounds: bounds[1] - bounds[0])
+            if hi - lo > DENSE_RANGE:
+                # Начало слова есть у многих записей («б», «ро»): идём от популярных,
+                # первые limit совпадений и есть ответ
+                candidates, found = self._ranked(), 0
+            else:
+                candidates, found = {self.entries.get(key[1:]) for key in self.keys[lo:hi]}, None
+            for entry in candidates:
+                if entry is None or (kinds and entry.kind not in kinds):
+                    continue
+                if all(any(word.startswith(token) for word in entry.words) for token in tokens):
+                    matched[entry.key] = entry
+                    if found is not None:
+                        found += 1
+                        if found >= limit:
+                            break
+        return heapq.nlargest(limit, matched.values(), key=_rank)
+
+
+def _rank(entry):
+    return entry.popularity, -len(entry.title)
+
+
+def build_index():
+    """Все записи из БД с популярностью (несколько агрегирующих запросов)."""
+    from .models import Category, FlowerTag, OrderItem, Product
+
+    ordered = dict(
+        OrderItem.objects.values_list('product_id').annotate(total=Sum('qty')).values_list('product_id', 'total')
+    )
+    products = Product.objects.filter(is_published=True).exclude(slug='').only('pk', 'title', 'slug', 'is_published')
+    entries = [product_entry(product, ordered.get(product.pk) or 0) for product in products]
+    published = Q(products__is_published=True)
+    categories = Category.objects.exclude(slug='').annotate(
+        popularity=Count('products', filter=published, distinct=True),
+    )
+    entries.extend(category_entry(category, category.popularity) for category in categories)
+    tags = FlowerTag.objects.exclude(slug='').annotate(popularity=Count('products', filter=published))
+    entries.extend(flower_entry(tag, tag.popularity) for tag in tags)
+    return PrefixIndex(entry for entry in entries if entry is not None)
+
+
+_index = None
+_version = None
+_build_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс процесса; перестраивается, если другой процесс менял данные или он устарел."""
+    global _index, _version
+    version = cache.get(VERSION_KEY, 0)
+    index = _index
+    if index is not None and version == _version and time.monotonic() - index.built_at < REBUILD_INTERVAL:
+        return index
+    with _build_lock:
+        if _index is index:
+            _index = build_index()
+            _version = version
+        return _index
+
+
+def warm_up():
+    """Построить индекс в фоновом потоке (при старте процесса)."""
+    def build():
+        try:
+            get_index()
+        except Exception:
+            log.exception('Не удалось построить индекс подсказок')
+
+    threading.Thread(target=build, name='suggest-warm-up', daemon=True).start()
+
+
+def _bump_version():
+    global _version
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+        version = 1
+    # Своё изменение уже применено — свой индекс не перестраиваем
+    if _version is not None and version == _version + 1:
+        _version = version
+
+
+def invalidate():
+    """Перестроить индексы всех процессов при следующем запросе (после пакетного импорта)."""
+    global _index
+    _index = None
+    _bump_version()
+
+
+def apply(kind, pk, entry):
+    """Применить изменение записи (entry None — удалить) к индексу процесса."""
+    if _index is not None:
+        if entry is None:
+            _index.remove(kind, pk)
+        else:
+            _index.put(entry)
+    _bump_version()
+
+
+def lookup(query, limit=DEFAULT_LIMIT, kinds=None):
+    return [entry.as_dict() for entry in get_index().lookup(query, limit, kinds)]
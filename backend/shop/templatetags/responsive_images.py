@@ -0,0 +1,18 @@
+from django import template
+
+from shop import thumbnails
+
+register = template.Library()
+
+
+@register.filter
+def srcset(value, fmt='webp'):
+    """{{ photo.image|srcset:"webp" }} — srcset превью для FieldFile или /media/-URL."""
+    return thumbnails.srcset(value, fmt)
+
+
+@register.filter
+def rendition(value, spec):
+    """{{ banner.mobile_image|rendition:"1280 webp" }} — URL превью не шире заданной ширины."""
+    width, _, fmt = str(spec).partition(' ')
+    return thumbnails.rendition_url(value, int(width), fmt or 'webp')
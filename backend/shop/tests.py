@@ -0,0 +1,1331 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.contrib.admin.sites import site as admin_site
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import post_save
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from . import facets, file_sync, jobs, legacy_sql, page_cache, search, suggest, thumbnails, views
+from .models import (
+    Category, FlowerTag, HeroBanner, Job, Order, OrderItem, Product, ProductImage, Review, ShowcaseItem, Store,
+    StoreManager, Ticker,
+)
+from .serializers import CATEGORY_TREE_CACHE_KEY
+
+
+class HomePageQueriesTests(TestCase):
+    def setUp(self):
+        caches[page_cache.CACHE_ALIAS].clear()
+
+    def _add_store_with_showcase(self, index, items=10):
+        # Кэш страниц сбрасывается после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            store = Store.objects.create(subdomain=f'shop{index}', name=f'Магазин {index}', sort_order=index)
+            for n in range(items):
+                product = Product.objects.create(title=f'Букет {index}-{n}', slug=f'buket-{index}-{n}', price=10 + n)
+                ShowcaseItem.objects.create(store=store, product=product, sort_order=n)
+        return store
+
+    def _count_home_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx), response
+
+    def test_showcase_query_count_does_not_grow_with_stores(self):
+        Store.objects.all().delete()
+        self._add_store_with_showcase(1)
+        baseline, _ = self._count_home_queries()
+
+        for index in range(2, 6):
+            self._add_store_with_showcase(index)
+        with_more_stores, response = self._count_home_queries()
+
+        self.assertEqual(baseline, with_more_stores)
+        showcases = response.context['store_showcases']
+        self.assertEqual(len(showcases), 5)
+        self.assertTrue(all(len(ss['cards']) == 8 for ss in showcases))
+
+    def test_showcase_keeps_sort_order_and_skips_unpublished(self):
+        Store.objects.all().delete()
+        store = self._add_store_with_showcase(1, items=3)
+        hidden = ShowcaseItem.objects.get(store=store, sort_order=0).product
+        hidden.is_published = False
+        hidden.save()
+
+        _, response = self._count_home_queries()
+        titles = [card['title'] for card in response.context['store_showcases'][0]['cards']]
+        self.assertEqual(titles, ['Букет 1-1', 'Букет 1-2'])
+
+    def test_category_cards_use_two_latest_published_products(self):
+        # Файлов нет, превью не будет — карточки на оригиналах; настоящий MEDIA не трогаем
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        category = Category.objects.create(name='Розы', slug='rozy')
+        products = [
+            Product.objects.create(title=f'Розы {n}', slug=f'rozy-{n}', image=f'/media/rozy-{n}.jpg')
+            for n in range(5)
+        ]
+        products[-1].is_published = False
+        products[-1].save()
+        for product in products:
+            product.categories.add(category)
+
+        _, response = self._count_home_queries()
+        card = next(c for c in response.context['category_cards'] if c['id'] == category.id)
+        self.assertEqual(card['image'], '/media/rozy-3.jpg')
+        self.assertEqual(card['hover_image'], '/media/rozy-2.jpg')
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        caches[page_cache.CACHE_ALIAS].clear()
+        self.product = Product.objects.create(title='Пионы', slug='piony', price=50)
+        self.tag = FlowerTag.objects.create(name='Пион', slug='pion')
+
+    def test_second_request_is_served_from_cache_without_queries(self):
+        self.assertEqual(self.client.get('/store/piony/')['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get('/store/piony/')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Пионы')
+        self.assertEqual(page_cache.cache_stats()['hits'], 1)
+
+    def test_product_change_invalidates_only_dependent_pages(self):
+        other = Product.objects.create(title='Розы', slug='rozy', price=40)
+        for url in ('/store/piony/', '/store/rozy/', '/kontakty/', '/store/'):
+            self.client.get(url)
+
+        self.product.price = 55
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.product.save()
+            # До коммита страница ещё старая — и закэшированная не сбрасывается
+            self.assertEqual(self.client.get('/store/piony/')['X-Page-Cache'], 'hit')
+        self.assertTrue(callbacks)
+
+        self.assertEqual(self.client.get('/store/piony/')['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get('/store/').get('X-Page-Cache'), 'miss')
+        self.assertEqual(self.client.get(f'/store/{other.slug}/')['X-Page-Cache'], 'hit')
+        self.assertEqual(self.client.get('/kontakty/')['X-Page-Cache'], 'hit')
+
+    def test_m2m_and_ticker_changes_invalidate(self):
+        self.client.get('/store/piony/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.flower_tags.add(self.tag)
+        response = self.client.get('/store/piony/')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Пион')
+
+        self.client.get('/kontakty/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticker.objects.create(text='Скидки')
+        self.assertEqual(self.client.get('/kontakty/')['X-Page-Cache'], 'miss')
+
+    def test_queryset_updates_invalidate_home(self):
+        admin_user = User.objects.create_superuser('root', password='x')
+        staff = Client()
+        staff.force_login(admin_user)
+        review = Review.objects.create(author='Анна', text='Спасибо', rating=5)
+
+        self.client.get('/')
+        self.assertEqual(self.client.get('/')['X-Page-Cache'], 'hit')
+        with self.captureOnCommitCallbacks(execute=True):
+            admin_site._registry[Review].publish_reviews(None, Review.objects.filter(pk=review.pk))
+        self.assertEqual(self.client.get('/')['X-Page-Cache'], 'miss')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            staff.post('/dashboard/api/showcase/order/', {'items': [{'id': self.product.id, 'sort': 3}]},
+                       content_type='application/json')
+        self.assertEqual(self.client.get('/')['X-Page-Cache'], 'miss')
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.get('/store/piony/')
+        self.assertEqual(self.client.get('/store/piony/')['X-Page-Cache'], 'hit')
+        self.client.force_login(User.objects.create_user('manager', password='x', is_staff=True))
+        self.assertNotIn('X-Page-Cache', self.client.get('/store/piony/'))
+        self.client.logout()
+
+        caches[page_cache.CACHE_ALIAS].clear()
+        self.client.force_login(User.objects.get(username='manager'))
+        self.client.get('/store/piony/')
+        self.client.logout()
+        self.assertEqual(self.client.get('/store/piony/')['X-Page-Cache'], 'miss')
+
+
+class CatalogPaginationTests(TestCase):
+    def setUp(self):
+        caches[page_cache.CACHE_ALIAS].clear()
+        facets.invalidate()
+        self.tag = FlowerTag.objects.create(name='Роза', slug='roza')
+        self.products = []
+        for n in range(60):
+            product = Product.objects.create(title=f'Букет {n}', slug=f'buket-{n}', price=10)
+            if n % 2:
+                product.flower_tags.add(self.tag)
+            self.products.append(product)
+
+    def test_store_page_renders_first_page_with_cursor(self):
+        response = self.client.get('/store/')
+        products = response.context['products']
+        self.assertEqual(len(products), views.CATALOG_PAGE_SIZE)
+        self.assertEqual(products[0]['id'], self.products[-1].id)
+        self.assertEqual(response.context['next_cursor'], products[-1]['id'])
+
+        response = self.client.get(f"/store/?after={response.context['next_cursor']}")
+        self.assertEqual(len(response.context['products']), 60 - views.CATALOG_PAGE_SIZE)
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_more_endpoint_continues_filtered_listing(self):
+        response = self.client.get('/store/more/', {'flower': 'roza', 'after': self.products[20].id})
+        data = response.json()
+        expected = [p.id for n, p in enumerate(self.products[:20]) if n % 2][::-1]
+        self.assertEqual([item['id'] for item in data['items']], expected)
+        self.assertIsNone(data['next_cursor'])
+        self.assertIn('/store/buket-19/', data['html'])
+
+
+class ApiPaginationTests(TestCase):
+    def setUp(self):
+        for n in range(5):
+            Product.objects.create(title=f'Букет {n}', slug=f'api-buket-{n}', price=10)
+
+    def test_products_are_cursor_paginated(self):
+        response = self.client.get('/api/products/', {'page_size': 2})
+        data = response.json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertIn('cursor=', data['next'])
+        seen = [item['id'] for item in data['results']]
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            seen.extend(item['id'] for item in data['results'])
+        self.assertEqual(seen, sorted(Product.objects.values_list('id', flat=True), reverse=True))
+
+    def test_offset_mode_is_staff_only(self):
+        response = self.client.get('/api/products/', {'pagination': 'offset', 'limit': 2, 'offset': 2})
+        self.assertNotIn('count', response.json())
+
+        staff = User.objects.create_user('admin', password='x', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+        response = client.get('/api/products/', {'pagination': 'offset', 'limit': 2, 'offset': 2})
+        self.assertEqual(response.json()['count'], 5)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_other_viewsets_keep_plain_list_in_meta_ordering(self):
+        FlowerTag.objects.create(name='Тюльпан', slug='tyulpan', sort_order=2)
+        FlowerTag.objects.create(name='Роза', slug='roza', sort_order=1)
+        data = self.client.get('/api/flower-tags/').json()
+        self.assertEqual([item['name'] for item in data], ['Роза', 'Тюльпан'])
+
+
+class CategoryTreeApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Category.objects.create(name='Букеты', slug='bukety', sort_order=1)
+        self.child = Category.objects.create(name='Розы', slug='rozy', parent=self.root)
+        Category.objects.create(name='Красные', slug='krasnye', parent=self.child)
+
+    def test_tree_is_nested_and_served_in_constant_queries(self):
+        data = self.client.get('/api/categories/').json()['results']
+        root = next(item for item in data if item['id'] == self.root.id)
+        self.assertEqual(root['children'][0]['name'], 'Розы')
+        self.assertEqual(root['children'][0]['parent'], self.root.id)
+        self.assertEqual(root['children'][0]['children'][0]['name'], 'Красные')
+        self.assertEqual(root['children'][0]['children'][0]['children'], [])
+
+        with self.assertNumQueries(1):
+            self.client.get('/api/categories/')
+
+    def test_category_change_rebuilds_tree(self):
+        self.client.get('/api/categories/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Пионы', slug='piony', parent=self.root)
+            # До коммита в кэше остаётся прежнее дерево
+            self.assertIn(CATEGORY_TREE_CACHE_KEY, cache)
+        self.assertNotIn(CATEGORY_TREE_CACHE_KEY, cache)
+        data = self.client.get('/api/categories/').json()['results']
+        root = next(item for item in data if item['id'] == self.root.id)
+        self.assertEqual([c['name'] for c in root['children']], ['Пионы', 'Розы'])
+
+
+class PrimaryImageUrlTests(TestCase):
+    def test_primary_image_url_is_resolved_on_save(self):
+        product = Product.objects.create(title='Тюльпаны', slug='tyulpany', image='https://buket.by/media/t.jpg')
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image_url, '/media/t.jpg')
+
+        product.image = ''
+        product.save(update_fields=['image'])
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image_url, '')
+
+    def test_post_save_receivers_see_renamed_upload_url(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        seen = []
+
+        def receiver(sender, instance, **kwargs):
+            seen.append(Product.objects.filter(pk=instance.pk).values_list('primary_image_url', flat=True)[0])
+
+        post_save.connect(receiver, sender=Product)
+        self.addCleanup(post_save.disconnect, receiver, sender=Product)
+        with override_settings(MEDIA_ROOT=media_root, JOBS_ENABLED=True):
+            default_storage.save('products/photo.jpg', _jpeg_upload())
+            product = Product.objects.create(title='Пионы', slug='piony')
+            product.uploaded_image = _jpeg_upload()
+            with CaptureQueriesContext(connection) as ctx:
+                product.save()
+
+        self.assertNotEqual(product.uploaded_image.name, 'products/photo.jpg')
+        self.assertEqual(seen[-1], f'/media/{product.uploaded_image.name}')
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "shop_product"')]
+        self.assertEqual(len(updates), 1)
+
+    def test_backfill_command_fills_stale_rows(self):
+        product = Product.objects.create(title='Лилии', slug='lilii')
+        Product.objects.filter(pk=product.pk).update(image='/media/l.jpg')
+
+        call_command('backfill_primary_image_urls', stdout=StringIO())
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image_url, '/media/l.jpg')
+
+
+def _jpeg_upload(name='photo.jpg', size=(1600, 1200)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 30, 60)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches[page_cache.CACHE_ALIAS].clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, JOBS_ENABLED=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_renditions_are_generated_next_to_original(self):
+        product = Product.objects.create(title='Гортензии', slug='gortenzii', uploaded_image=_jpeg_upload())
+        srcsets = thumbnails.srcsets_for([product.primary_image_url])
+        name = product.uploaded_image.name
+
+        self.assertEqual(set(srcsets[name]), {'webp', 'jpeg'})
+        self.assertIn('320w', srcsets[name]['webp'])
+        self.assertIn('1280w', srcsets[name]['jpeg'])
+        for width in thumbnails.WIDTHS:
+            self.assertTrue(default_storage.exists(thumbnails.rendition_name(name, width, 'webp')))
+        with default_storage.open(thumbnails.rendition_name(name, 640, 'jpeg')) as fh:
+            self.assertEqual(Image.open(fh).size, (640, 480))
+
+    def test_store_page_exposes_srcset(self):
+        Product.objects.create(title='Гортензии', slug='gortenzii', uploaded_image=_jpeg_upload())
+        response = self.client.get('/store/')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '.640w.webp 640w')
+
+    def test_hero_uses_renditions(self):
+        banner = HeroBanner.objects.create(name='Весна', title='Весна', is_active=True,
+                                           desktop_image=_jpeg_upload('hero.jpg'))
+        response = self.client.get('/')
+        name = banner.desktop_image.name
+        self.assertContains(response, f"--hero-desktop:url('/media/{thumbnails.rendition_name(name, 1280, 'webp')}')")
+        self.assertNotContains(response, f"url('/media/{name}')")
+
+    def test_small_and_broken_images(self):
+        small = default_storage.save('products/small.jpg', _jpeg_upload(size=(200, 100)))
+        self.assertEqual(thumbnails.srcset(small, 'jpeg'), '/media/products/small.200w.jpg 200w')
+        broken = default_storage.save('products/broken.jpg', SimpleUploadedFile('broken.jpg', b'not an image'))
+        with self.assertLogs('shop.thumbnails', 'WARNING'):
+            self.assertEqual(thumbnails.srcset(broken), '')
+        self.assertEqual(thumbnails.srcset('https://example.com/a.jpg'), '')
+
+
+@override_settings(TELEGRAM_BOT_SECRET='test-secret', JOBS_ENABLED=True)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches[page_cache.CACHE_ALIAS].clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_dedupe_claim_and_retry(self):
+        calls = []
+
+        @jobs.handler('test_flaky')
+        def flaky(value):
+            calls.append(value)
+            if len(calls) == 1:
+                raise RuntimeError('boom')
+
+        self.addCleanup(jobs.HANDLERS.pop, 'test_flaky')
+        first = jobs.enqueue('test_flaky', dedupe_key='k', value=1)
+        self.assertEqual(jobs.enqueue('test_flaky', dedupe_key='k', value=2), first)
+
+        job = jobs.claim('w1')
+        self.assertEqual(job.status, Job.STATUS_RUNNING)
+        self.assertIsNone(jobs.claim('w2'))
+        with self.assertLogs('shop.jobs', 'WARNING'):
+            self.assertFalse(jobs.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_PENDING, 1))
+        self.assertIn('boom', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_after=job.created_at)
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertEqual(calls, [1, 1])
+
+    def test_bot_upload_is_processed_in_background(self):
+        store = Store.objects.create(name='Центр', subdomain='center')
+        manager = StoreManager.objects.create(telegram_id=42, full_name='Менеджер')
+        manager.stores.add(store)
+        upload = BytesIO()
+        Image.new('RGB', (3000, 1500), (200, 40, 90)).save(upload, 'JPEG', exif=Image.Exif())
+        upload.seek(0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/v1/products/from-bot/',
+                {'telegram_id': 42, 'store_id': store.id, 'price': '50', 'title': 'Пионы',
+                 'uploaded_image': SimpleUploadedFile('big.jpg', upload.read(), content_type='image/jpeg')},
+                HTTP_X_BOT_TOKEN='test-secret',
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        product = Product.objects.get()
+        name = product.uploaded_image.name
+        self.assertFalse(default_storage.exists(thumbnails.rendition_name(name, 320, 'webp')))
+        job = Job.objects.get()
+        self.assertEqual(job.payload, {'model': 'shop.Product', 'pk': product.pk, 'field': 'uploaded_image'})
+
+        call_command('run_worker', once=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        with default_storage.open(name) as fh:
+            self.assertEqual(Image.open(fh).size, (thumbnails.MAX_ORIGINAL_SIDE, 1280))
+        self.assertIn('1280w', thumbnails.srcset(name))
+
+    def test_optimize_original_replaces_in_place_once(self):
+        upload = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90°
+        Image.new('RGB', (300, 200), (200, 40, 90)).save(upload, 'JPEG', exif=exif)
+        name = default_storage.save('products/rotated.jpg', ContentFile(upload.getvalue()))
+
+        self.assertTrue(thumbnails.optimize_original(name))
+        with default_storage.open(name) as fh:
+            image = Image.open(fh)
+            self.assertEqual((image.size, dict(image.getexif())), ((200, 300), {}))
+        self.assertEqual(default_storage.listdir('products')[1], ['rotated.jpg'])
+
+        with mock.patch.object(default_storage, 'save') as save:
+            self.assertFalse(thumbnails.optimize_original(name))
+        save.assert_not_called()
+
+    @override_settings(JOBS_ENABLED=False)
+    def test_upload_is_processed_inline_without_queue(self):
+        product = Product.objects.create(title='Пионы', slug='piony')
+        product.uploaded_image = default_storage.save('products/big.jpg', _jpeg_upload(size=(3000, 1500)))
+        product.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue_image_processing(product, 'uploaded_image')
+        self.assertFalse(Job.objects.exists())
+        self.assertIn('1280w', thumbnails.srcset(product.uploaded_image.name))
+
+    def test_lazy_renditions_are_queued(self):
+        name = default_storage.save('products/old.jpg', _jpeg_upload(size=(800, 600)))
+        self.assertEqual(thumbnails.srcset(name), '')
+        self.assertEqual(thumbnails.srcset(name), '')
+        self.assertEqual(Job.objects.filter(kind='generate_renditions').count(), 1)
+        jobs.run_pending()
+        self.assertIn('640w', thumbnails.srcset(name))
+        # Кэш воркера сайту не виден (locmem): srcset читается из storage, новой задачи нет
+        cache.clear()
+        self.assertIn('640w', thumbnails.srcset(name))
+        self.assertEqual(Job.objects.filter(kind='generate_renditions').count(), 1)
+
+    def test_failed_lazy_renditions_are_not_requeued(self):
+        name = default_storage.save('products/broken.jpg', SimpleUploadedFile('broken.jpg', b'not an image'))
+        self.assertEqual(thumbnails.srcset(name), '')
+        with self.assertLogs('shop', 'WARNING'):
+            for _ in range(3):
+                Job.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+                jobs.run_pending()
+        self.assertEqual(Job.objects.get().status, Job.STATUS_FAILED)
+        cache.clear()
+        self.assertEqual(thumbnails.srcset(name), '')
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_worker_purges_finished_jobs(self):
+        old = timezone.now() - timedelta(days=8)
+        done = jobs.enqueue('generate_renditions', name='a.jpg')
+        failed = jobs.enqueue('generate_renditions', name='b.jpg')
+        pending = jobs.enqueue('generate_renditions', name='c.jpg', delay=3600)
+        recent = jobs.enqueue('generate_renditions', name='d.jpg')
+        Job.objects.filter(pk=done.pk).update(status=Job.STATUS_DONE, updated_at=old)
+        Job.objects.filter(pk=failed.pk).update(status=Job.STATUS_FAILED, updated_at=old)
+        Job.objects.filter(pk=pending.pk).update(updated_at=old)
+        Job.objects.filter(pk=recent.pk).update(status=Job.STATUS_DONE)
+
+        call_command('run_worker', once=True, stdout=StringIO())
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {pending.pk, recent.pk})
+
+
+@override_settings(TELEGRAM_BOT_SECRET='test-secret')
+class ManagersVersionTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name='Центр', subdomain='center')
+        self.manager = StoreManager.objects.create(telegram_id=42, full_name='Менеджер')
+        self.manager.stores.add(self.store)
+
+    def _version(self):
+        response = self.client.get('/api/v1/auth/managers-version/', HTTP_X_BOT_TOKEN='test-secret')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['managers_version']
+
+    def test_auth_returns_version_and_it_changes_with_managers(self):
+        response = self.client.post(
+            '/api/v1/auth/bot-token/', {'telegram_id': 42}, content_type='application/json',
+            HTTP_X_BOT_TOKEN='test-secret',
+        )
+        self.assertEqual(response.status_code, 200)
+        version = response.json()['managers_version']
+        self.assertEqual(version, self._version())
+
+        other = Store.objects.create(name='Север', subdomain='north')
+        self.manager.stores.add(other)
+        after_m2m = self._version()
+        self.assertNotEqual(after_m2m, version)
+
+        other.is_active = False
+        other.save()
+        after_store = self._version()
+        self.assertNotEqual(after_store, after_m2m)
+
+        self.manager.is_active = False
+        self.manager.save()
+        self.assertNotEqual(self._version(), after_store)
+
+    def test_bot_create_checks_manager_and_store_in_one_query(self):
+        from .serializers import BotProductCreateSerializer
+
+        serializer = BotProductCreateSerializer(data={
+            'telegram_id': 42, 'store_id': self.store.id, 'price': '10', 'title': 'Розы',
+        })
+        with self.assertNumQueries(2):  # store_id + менеджер с доступом
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        other = Store.objects.create(name='Север', subdomain='north')
+        serializer = BotProductCreateSerializer(data={
+            'telegram_id': 42, 'store_id': other.id, 'price': '10', 'title': 'Розы',
+        })
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('store_id', serializer.errors)
+
+
+@override_settings(TELEGRAM_BOT_SECRET='test-secret', JOBS_ENABLED=True)
+class BotBulkCreateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches[page_cache.CACHE_ALIAS].clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.store = Store.objects.create(name='Центр', subdomain='center')
+        manager = StoreManager.objects.create(telegram_id=42, full_name='Менеджер')
+        manager.stores.add(self.store)
+
+    def test_album_creates_products_in_bulk(self):
+        Product.objects.create(title='Букет', slug='buket')
+        Product.objects.create(title='Букет', slug='buket-2')
+        facets.invalidate()
+        self.client.get('/store/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/v1/products/from-bot/bulk/',
+                {'telegram_id': 42, 'store_id': self.store.id, 'price': '60', 'title': 'Пионы',
+                 'uploaded_images': [_jpeg_upload(f'p{index}.jpg', (400, 300)) for index in range(3)]},
+                HTTP_X_BOT_TOKEN='test-secret',
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        ids = response.json()['ids']
+        # Сигналов не было: каталог, поиск и подсказки обновлены после коммита
+        listed = [item['id'] for item in self.client.get('/store/').context['products']]
+        self.assertEqual(listed[:3], sorted(ids, reverse=True))
+        self.assertEqual(sorted(search.search_ids('пионы')), ids)
+        self.assertEqual(len(suggest.lookup('пион')), 3)
+        products = Product.objects.filter(id__in=response.json()['ids']).order_by('id')
+        self.assertEqual([p.slug for p in products], ['buket-1', 'buket-3', 'buket-4'])
+        for product in products:
+            self.assertEqual(product.article, f'center-{product.id}')
+            self.assertEqual(product.primary_image_url, product.uploaded_image.url)
+            self.assertTrue(product.image.endswith(product.uploaded_image.url))
+            self.assertEqual(list(product.stores.all()), [self.store])
+        self.assertEqual(ShowcaseItem.objects.filter(store=self.store).count(), 3)
+        self.assertEqual(Job.objects.filter(kind='process_image').count(), 3)
+
+    def _post_album(self):
+        return self.client.post(
+            '/api/v1/products/from-bot/bulk/',
+            {'telegram_id': 42, 'store_id': self.store.id, 'price': '60', 'title': 'Пионы',
+             'uploaded_images': [_jpeg_upload(f'p{index}.jpg', (400, 300)) for index in range(2)]},
+            HTTP_X_BOT_TOKEN='test-secret',
+        )
+
+    def test_album_rollback_removes_saved_files(self):
+        failures = [
+            # Внутри serializer.create() и уже после него, во view
+            mock.patch.object(ShowcaseItem.objects, 'bulk_create', side_effect=IntegrityError('boom')),
+            mock.patch.object(jobs, 'enqueue_image_processing', side_effect=RuntimeError('boom')),
+        ]
+        for failure in failures:
+            with self.subTest(failure.attribute), failure, self.assertRaises(Exception):
+                self._post_album()
+            self.assertFalse(Product.objects.exists())
+            self.assertEqual(default_storage.listdir('products')[1], [])
+
+    def test_album_rejects_foreign_store(self):
+        other = Store.objects.create(name='Север', subdomain='north')
+        response = self.client.post(
+            '/api/v1/products/from-bot/bulk/',
+            {'telegram_id': 42, 'store_id': other.id, 'uploaded_images': [_jpeg_upload()]},
+            HTTP_X_BOT_TOKEN='test-secret',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.exists())
+
+
+class RunBotCommandTests(TestCase):
+    def test_single_instance_lock_and_status(self):
+        from .management.commands.run_bot import acquire_lock
+
+        bot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, bot_dir, ignore_errors=True)
+        with open(f'{bot_dir}/bot.lock', 'w'):
+            pass
+        with self.assertRaisesMessage(CommandError, 'не запущен'):
+            call_command('run_bot', bot_dir=bot_dir, status=True, stdout=StringIO())
+
+        lock = acquire_lock(f'{bot_dir}/bot.lock')
+        self.addCleanup(lock.close)
+        self.assertIsNone(acquire_lock(f'{bot_dir}/bot.lock'))
+        out = StringIO()
+        call_command('run_bot', bot_dir=bot_dir, status=True, stdout=out)
+        self.assertIn('Бот:', out.getvalue())
+
+    def test_lock_falls_back_to_msvcrt_without_fcntl(self):
+        from .management.commands import run_bot
+
+        bot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, bot_dir, ignore_errors=True)
+        msvcrt = mock.Mock(LK_NBLCK=2, locking=mock.Mock(side_effect=[None, OSError('locked')]))
+        with mock.patch.object(run_bot, 'fcntl', None), mock.patch.object(run_bot, 'msvcrt', msvcrt, create=True):
+            lock = run_bot.acquire_lock(f'{bot_dir}/bot.lock')
+            self.addCleanup(lock.close)
+            self.assertIsNone(run_bot.acquire_lock(f'{bot_dir}/bot.lock'))
+        msvcrt.locking.assert_called_with(mock.ANY, 2, 1)
+        with open(f'{bot_dir}/bot.lock', encoding='utf-8') as fh:
+            self.assertEqual(fh.read(), str(os.getpid()))
+
+
+LEGACY_DUMP = """-- phpMyAdmin SQL Dump
+/*!40101 SET NAMES utf8mb4 */;
+CREATE TABLE `wzx3q_jshopping_attr` (
+  `attr_id` int(11) NOT NULL,
+  `name_ru-RU` varchar(255) NOT NULL
+) ENGINE=InnoDB;
+INSERT INTO `wzx3q_jshopping_users` VALUES (1, 'x;y(''z'), (2, 'a\\'b;');
+INSERT INTO `wzx3q_jshopping_attr` (`attr_id`, `name_ru-RU`) VALUES
+(1, 'Роза; (красная)'),
+(2, 'Эустома \\"лизиантус\\"\\nбелая'),
+(3, NULL);
+INSERT INTO `wzx3q_jshopping_products_attr2` VALUES (10, 7, 1, 0, '+', 1.50000, -2),(11, 7, 2, 0, '+', 0.00000, 1);
+"""
+
+
+class LegacySqlTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.path = f'{tmp}/dump.sql'
+        with open(self.path, 'w', encoding='utf-8') as fh:
+            fh.write(LEGACY_DUMP)
+
+    def test_single_pass_typed_rows_across_chunk_boundaries(self):
+        tables = ['wzx3q_jshopping_attr', 'wzx3q_jshopping_products_attr2']
+        expected = [
+            ('wzx3q_jshopping_attr', (1, 'Роза; (красная)')),
+            ('wzx3q_jshopping_attr', (2, 'Эустома "лизиантус"\nбелая')),
+            ('wzx3q_jshopping_attr', (3, None)),
+            ('wzx3q_jshopping_products_attr2', (10, 7, 1, 0, '+', Decimal('1.50000'), -2)),
+            ('wzx3q_jshopping_products_attr2', (11, 7, 2, 0, '+', Decimal('0.00000'), 1)),
+        ]
+        # Маленькие куски режут строки, экранирование и заголовки INSERT в любых местах
+        with mock.patch.object(legacy_sql, 'LOOKAHEAD', 128):
+            for chunk_size in (1, 3, 7, 64, legacy_sql.CHUNK_SIZE):
+                with self.subTest(chunk_size=chunk_size):
+                    reader = legacy_sql.DumpReader(self.path, tables, chunk_size=chunk_size)
+                    self.assertEqual(list(reader), expected)
+                    self.assertEqual(reader.columns['wzx3q_jshopping_attr'], ['attr_id', 'name_ru-RU'])
+
+        skipped = [row for table, row in legacy_sql.iter_rows(self.path) if table == 'wzx3q_jshopping_users']
+        self.assertEqual(skipped, [(1, "x;y('z"), (2, "a'b;")])
+        self.assertEqual(
+            list(legacy_sql.iter_dicts(self.path, 'wzx3q_jshopping_attr'))[0],
+            {'attr_id': 1, 'name_ru-RU': 'Роза; (красная)'},
+        )
+
+    def test_truncated_dump_raises(self):
+        with open(self.path, 'a', encoding='utf-8') as fh:
+            fh.write("INSERT INTO `wzx3q_jshopping_attr` VALUES (4, 'обрыв")
+        with self.assertRaises(legacy_sql.DumpError):
+            list(legacy_sql.iter_rows(self.path, ['wzx3q_jshopping_attr']))
+
+    def test_import_old_slugs_reads_dump_once(self):
+        with open(self.path, 'a', encoding='utf-8') as fh:
+            fh.write(
+                "INSERT INTO `wzx3q_jshopping_products` (`product_id`, `product_ean`, `alias_ru-RU`) "
+                "VALUES (7, 'A-100', 'buket-roz'), (8, 'A-200', NULL);\n"
+            )
+        product = Product.objects.create(title='Букет', slug='buket', article='A-100', price=10)
+
+        with mock.patch('builtins.open', wraps=open) as opened:
+            call_command('import_old_slugs', sql=self.path, stdout=StringIO())
+        self.assertEqual([c.args[0] for c in opened.call_args_list].count(self.path), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.slug, 'buket-roz')
+
+    def test_migrate_old_data_reads_dump_once(self):
+        with open(self.path, 'w', encoding='utf-8') as fh:
+            fh.write(
+                "INSERT INTO `wzx3q_virtuemart_product_medias` VALUES (1, 5, 9, 2);\n"
+                "INSERT INTO `wzx3q_virtuemart_categories_ru_ru` VALUES (1, 'Букеты', ''), (2, 'Розы', '');\n"
+                "INSERT INTO `wzx3q_virtuemart_category_categories` VALUES (2, 1);\n"
+                "INSERT INTO `wzx3q_virtuemart_products_ru_ru` VALUES (5, 'Букет роз', '', 'Описание');\n"
+                "INSERT INTO `wzx3q_virtuemart_products` VALUES (5, 1, 0, 'VM-5');\n"
+                "INSERT INTO `wzx3q_virtuemart_product_categories` VALUES (1, 5, 2, 0);\n"
+                "INSERT INTO `wzx3q_virtuemart_medias` VALUES "
+                "(9, 0, 'a.jpg', '', '', '', 'image/jpeg', 'product', 'images/product/data/a.jpg');\n"
+            )
+
+        with mock.patch('builtins.open', wraps=open) as opened:
+            call_command('migrate_old_data', sql_file=self.path, stdout=StringIO())
+        self.assertEqual([c.args[0] for c in opened.call_args_list].count(self.path), 1)
+        product = Product.objects.get(article='VM-5')
+        self.assertEqual((product.title, product.description), ('Букет роз', 'Описание'))
+        self.assertEqual([c.name for c in product.categories.all()], ['Розы'])
+        self.assertEqual(Category.objects.get(name='Розы').parent.name, 'Букеты')
+        self.assertEqual([(i.image.name, i.sort_order) for i in product.images.all()], [('products/a.jpg', 2)])
+
+    def test_import_jshopping_nov_reads_dump_once(self):
+        with open(self.path, 'w', encoding='utf-8') as fh:
+            fh.write(
+                "INSERT INTO `wzx3q_jshopping_products_to_categories` (`product_id`, `category_id`, `product_ordering`) "
+                "VALUES (7, 3, 1), (7, 2, 0);\n"
+                "INSERT INTO `wzx3q_jshopping_categories` "
+                "(`category_id`, `category_parent_id`, `category_publish`, `ordering`, `name_ru-RU`) "
+                "VALUES (3, 2, 1, 0, 'Розы'), (2, 0, 1, 0, 'Букеты'), (4, 0, 0, 0, 'Скрытая');\n"
+                "INSERT INTO `wzx3q_jshopping_products` "
+                "(`product_id`, `product_publish`, `product_ean`, `product_price`, `name_ru-RU`, `image`) "
+                "VALUES (7, 1, 'A-7', 55.00, 'Букет  роз', ''), (8, 0, 'A-8', 10.00, 'Снят', '');\n"
+            )
+        old_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, old_root, ignore_errors=True)
+
+        with mock.patch('builtins.open', wraps=open) as opened, override_settings(MEDIA_ROOT=old_root):
+            call_command('import_jshopping_nov', dump=self.path, old_root=old_root, stdout=StringIO())
+        self.assertEqual([str(c.args[0]) for c in opened.call_args_list].count(self.path), 1)
+        product = Product.objects.get()
+        self.assertEqual((product.article, product.title, product.price), ('A-7', 'Букет роз', Decimal('55.00')))
+        self.assertEqual(product.category.name, 'Букеты')
+        self.assertEqual(sorted(c.name for c in product.categories.all()), ['Букеты', 'Розы'])
+        self.assertFalse(Category.objects.filter(name='Скрытая').exists())
+
+
+class BulkImportTests(TestCase):
+    def _write_vm_dump(self, count):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        path = f'{tmp}/vm.sql'
+        ids = range(1, count + 1)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write("INSERT INTO `wzx3q_virtuemart_categories_ru_ru` VALUES (1, 'Розы', '');\n")
+            fh.write('INSERT INTO `wzx3q_virtuemart_products_ru_ru` VALUES '
+                     + ','.join(f"({i}, 'Описание', '', 'Букет {i}')" for i in ids) + ';\n')
+            fh.write('INSERT INTO `wzx3q_virtuemart_products` VALUES '
+                     + ','.join(f"({i}, 1, 0, 'VM-{i}')" for i in ids) + ';\n')
+            fh.write('INSERT INTO `wzx3q_virtuemart_product_prices` VALUES '
+                     + ','.join(f'({i}, {i}, 0, {i}.50000)' for i in ids) + ';\n')
+            fh.write('INSERT INTO `wzx3q_virtuemart_product_categories` VALUES '
+                     + ','.join(f'({i}, {i}, 1, 0)' for i in ids) + ';\n')
+        return path
+
+    def _reimport_queries(self, count):
+        path = self._write_vm_dump(count)
+        Product.objects.all().delete()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('reimport_vm', sql=path, stdout=StringIO())
+        return len(ctx)
+
+    def test_reimport_vm_writes_in_batches(self):
+        category = Category.objects.create(name='Розы')
+        store = Store.objects.create(subdomain='centr', name='Центр', is_active=True)
+
+        few = self._reimport_queries(3)
+        many = self._reimport_queries(40)
+        self.assertEqual(few, many)
+
+        self.assertEqual(Product.objects.count(), 40)
+        product = Product.objects.get(article='VM-7')
+        self.assertEqual((product.title, product.slug), ('Букет 7', 'vm-7'))
+        self.assertEqual(product.price, Decimal('7.50'))
+        self.assertEqual(product.category, category)
+        self.assertEqual(list(product.categories.all()), [category])
+        self.assertEqual(set(product.stores.all()), set(Store.objects.filter(is_active=True)))
+        self.assertIn(store, product.stores.all())
+        slugs = list(Product.objects.values_list('slug', flat=True))
+        self.assertNotIn('', slugs)
+        self.assertEqual(len(set(slugs)), len(slugs))
+
+    def test_reimport_vm_is_incremental(self):
+        Category.objects.create(name='Розы')
+        path = self._write_vm_dump(5)
+        call_command('reimport_vm', sql=path, stdout=StringIO())
+        product = Product.objects.get(article='VM-2')
+        store = Store.objects.filter(is_active=True).first()
+        ShowcaseItem.objects.create(store=store, product=product)
+        pks = set(Product.objects.values_list('pk', flat=True))
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('reimport_vm', sql=path, stdout=out)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))])
+        self.assertIn('+0 ~0 -0', out.getvalue())
+        self.assertEqual(set(Product.objects.values_list('pk', flat=True)), pks)
+
+        with open(path, encoding='utf-8') as fh:
+            dump = fh.read().replace('(2, 2, 0, 2.50000)', '(2, 2, 0, 9.00000)')
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(dump)
+        out = StringIO()
+        call_command('reimport_vm', sql=path, dry_run=True, stdout=out)
+        self.assertIn('~1 -0 (price: 1)', out.getvalue())
+        self.assertEqual(Product.objects.get(pk=product.pk).price, Decimal('2.50'))
+
+        call_command('reimport_vm', sql=path, stdout=StringIO())
+        product.refresh_from_db()
+        self.assertEqual(product.price, Decimal('9.00'))
+        self.assertEqual(set(Product.objects.values_list('pk', flat=True)), pks)
+        self.assertTrue(ShowcaseItem.objects.filter(product=product).exists())
+
+    def test_reimport_vm_prunes_only_its_products(self):
+        Category.objects.create(name='Розы')
+        manual = Product.objects.create(title='Старый', slug='staryi', article='VM-3')
+        call_command('reimport_vm', sql=self._write_vm_dump(5), stdout=StringIO())
+        manual.refresh_from_db()
+        self.assertEqual(manual.import_source, Product.IMPORT_SOURCE_VM)
+
+        manager = StoreManager.objects.create(telegram_id=42, full_name='Менеджер')
+        kept = [
+            Product.objects.create(title='Из бота', slug='iz-bota', article='B-1', created_by=manager),
+            Product.objects.create(title='С сайта', slug='s-saita', article='S-1'),
+            Product.objects.create(title='JShopping', slug='js', article='A-1',
+                                   import_source=Product.IMPORT_SOURCE_JSHOPPING),
+        ]
+        out = StringIO()
+        call_command('reimport_vm', sql=self._write_vm_dump(3), prune=True, stdout=out)
+        self.assertIn('+0 ~0 -2', out.getvalue())
+        self.assertEqual(
+            set(Product.objects.values_list('article', flat=True)),
+            {'VM-1', 'VM-2', 'VM-3'} | {product.article for product in kept},
+        )
+
+    def test_reimport_vm_fails_on_duplicate_articles(self):
+        Product.objects.create(title='Букет', slug='buket', article='VM-1')
+        Product.objects.create(title='Букет', slug='buket-2', article='VM-1')
+        with self.assertRaisesMessage(CommandError, 'VM-1'):
+            call_command('reimport_vm', sql=self._write_vm_dump(2), stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 2)
+
+
+class SyncVmImagesTests(TestCase):
+    def test_failed_sources_and_site_uploads_are_kept(self):
+        from .management.commands import sync_vm_images
+
+        old_base, media = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, old_base, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        os.makedirs(f'{old_base}/images/product/data')
+        Image.new('RGB', (10, 10)).save(f'{old_base}/images/product/data/32.jpg')
+        product = Product.objects.create(title='Букет', slug='buket', article='0032')
+        # 32_1.jpg (первое фото) в источнике пропал, в media его тоже нет
+        ProductImage.objects.create(product=product, image='products/0032_32_1.jpg', sort_order=0)
+        ProductImage.objects.create(product=product, image='products/0032_old.jpg', sort_order=5)
+        ProductImage.objects.create(product=product, image='products/manager.jpg', sort_order=9)
+
+        with mock.patch.object(sync_vm_images, 'OLD_BASE', old_base), \
+                mock.patch.object(sync_vm_images, 'MEDIA_DEST', media):
+            out = StringIO()
+            call_command('sync_vm_images', stdout=out)
+        self.assertIn('FILE NOT FOUND', out.getvalue())
+        self.assertEqual(
+            sorted(product.images.values_list('image', 'sort_order')),
+            [('products/0032_32.jpg', 1), ('products/0032_32_1.jpg', 0), ('products/manager.jpg', 9)],
+        )
+        self.assertTrue(os.path.exists(f'{media}/0032_32.jpg'))
+
+
+class FileSyncTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def _file(self, name, data):
+        path = f'{self.tmp}/{name}'
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        return path
+
+    def test_copy_skips_identical_and_replaces_changed(self):
+        same = self._file('same.jpg', b'same')
+        changed = self._file('changed.jpg', b'new')
+        fresh = self._file('fresh.jpg', b'fresh')
+        self._file('out-same.jpg', b'same')
+        self._file('out-changed.jpg', b'old')
+        tasks = [
+            (same, f'{self.tmp}/out-same.jpg'),
+            (changed, f'{self.tmp}/out-changed.jpg'),
+            (fresh, f'{self.tmp}/sub/out-fresh.jpg'),
+            (f'{self.tmp}/nope.jpg', f'{self.tmp}/out-nope.jpg'),
+            (same, f'{self.tmp}/sub/out-fresh.jpg'),
+        ]
+
+        dry = file_sync.FileSync(workers=3, dry_run=True).copy(tasks)
+        self.assertEqual(dry.count(file_sync.COPIED), 1)
+        self.assertFalse(Path(self.tmp, 'sub').exists())
+
+        report = file_sync.FileSync(workers=3).copy(tasks)
+        self.assertEqual(report.results, {
+            f'{self.tmp}/out-same.jpg': file_sync.IDENTICAL,
+            f'{self.tmp}/out-changed.jpg': file_sync.REPLACED,
+            f'{self.tmp}/sub/out-fresh.jpg': file_sync.COPIED,
+            f'{self.tmp}/out-nope.jpg': file_sync.MISSING,
+        })
+        with open(f'{self.tmp}/sub/out-fresh.jpg', 'rb') as fh:
+            self.assertEqual(fh.read(), b'fresh')
+        self.assertEqual(report.bytes, len(b'new') + len(b'fresh'))
+        self.assertIn('copied: 1', report.summary())
+
+        again = file_sync.FileSync(workers=3).copy(tasks)
+        self.assertEqual(again.count(file_sync.IDENTICAL), 3)
+
+    def test_check_images_reports_missing_files(self):
+        product = Product.objects.create(title='Букет', price=10, slug='buket-check')
+        self._file('present.jpg', b'x')
+        ProductImage.objects.create(product=product, image='present.jpg')
+        ProductImage.objects.create(product=product, image='products/missing.jpg')
+
+        out = StringIO()
+        with override_settings(MEDIA_ROOT=self.tmp):
+            call_command('check_images', workers=2, stdout=out)
+        self.assertIn('Существующих файлов: 1', out.getvalue())
+        self.assertIn('Отсутствующих файлов: 1', out.getvalue())
+        self.assertIn('[MISSING] products/missing.jpg', out.getvalue())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.roses = Category.objects.create(name='Розы')
+        self.peony = FlowerTag.objects.create(name='Пион', slug='pion')
+        self.red = Product.objects.create(
+            title='Букет из 25 красных роз', slug='krasnye-rozy', article='0012', price=100,
+            description='Классика для свидания',
+        )
+        self.mix = Product.objects.create(title='Нежность', slug='nezhnost', price=80, description='Розовые пионы')
+        self.mix.flower_tags.add(self.peony)
+        self.box = Product.objects.create(title='Шляпная коробка', slug='korobka', price=90, category=self.roses)
+
+    def _ids(self, query):
+        return search.search_ids(query)
+
+    def test_stemmer(self):
+        self.assertEqual(search.stem('розы'), 'роз')
+        self.assertEqual(search.stem('розами'), 'роз')
+        self.assertEqual(search.stem('пионами'), 'пион')
+        self.assertEqual(search.stem('красных'), 'красн')
+
+    def test_search_matches_word_forms_categories_and_tags(self):
+        self.assertEqual(self._ids('красная роза'), [self.red.pk])
+        self.assertIn(self.box.pk, self._ids('розы'))
+        self.assertEqual(self._ids('пионы'), [self.mix.pk])
+        self.assertEqual(self._ids('пио'), [self.mix.pk])
+        self.assertEqual(self._ids('12'), [self.red.pk])
+        self.assertEqual(self._ids('букет из роз'), [self.red.pk])
+        self.assertEqual(self._ids('нет такого'), [])
+        self.assertEqual(self._ids(' "*( '), [])
+
+    def test_latin_query_is_transliterated_and_layout_fixed(self):
+        self.assertEqual(self._ids('pion'), [self.mix.pk])
+        self.assertEqual(self._ids('ikzgyfz'), [self.box.pk])
+        self.assertEqual(self._ids('rjhj,rf'), [self.box.pk])
+
+    def test_index_follows_model_changes(self):
+        self.peony.name = 'Гортензия'
+        self.peony.save()
+        self.assertEqual(self._ids('гортензии'), [self.mix.pk])
+        self.mix.flower_tags.clear()
+        self.assertEqual(self._ids('гортензия'), [])
+
+        self.roses.delete()
+        self.assertNotIn(self.box.pk, self._ids('розы'))
+        self.red.title = 'Тюльпаны'
+        self.red.save()
+        self.assertEqual(self._ids('тюльпан'), [self.red.pk])
+        self.red.delete()
+        self.assertEqual(self._ids('тюльпан'), [])
+
+    def test_bulk_rebuild(self):
+        Product.objects.bulk_create([Product(title=f'Лилии {n}', slug=f'lilii-{n}', price=5) for n in range(3)])
+        self.assertEqual(self._ids('лилии'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self._ids('лилии')), 3)
+
+    def test_store_search_page(self):
+        Product.objects.create(title='Розы скрытые', slug='hidden-rozy', price=1, is_published=False)
+        response = self.client.get('/store/search/', {'q': 'розы'})
+        self.assertEqual(response.status_code, 200)
+        slugs = [item['slug'] for item in response.context['products']]
+        self.assertEqual(sorted(slugs), ['korobka', 'krasnye-rozy'])
+        self.assertContains(response, 'value="розы"')
+
+    def test_api_q_orders_by_relevance_with_cursor(self):
+        Product.objects.create(title='Розы', slug='rozy', price=1)
+        data = self.client.get('/api/products/', {'q': 'розы', 'page_size': 1}).json()
+        seen = [item['slug'] for item in data['results']]
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            seen.extend(item['slug'] for item in data['results'])
+        self.assertEqual(seen[0], 'rozy')
+        self.assertEqual(sorted(seen), ['korobka', 'krasnye-rozy', 'rozy'])
+
+
+class SuggestTests(TestCase):
+    def setUp(self):
+        suggest._index = None
+        self.addCleanup(setattr, suggest, '_index', None)
+        self.peonies = Category.objects.create(name='Пионы', slug='piony')
+        self.tag = FlowerTag.objects.create(name='Пион', slug='pion')
+        self.popular = Product.objects.create(title='Букет из пионов', slug='buket-pionov', price=10)
+        self.rare = Product.objects.create(title='Пионовидные розы', slug='pionovidnye', price=10)
+        Product.objects.create(title='Пион скрытый', slug='skrytyi', price=10, is_published=False)
+        self.popular.categories.add(self.peonies)
+        order = Order.objects.create(user=User.objects.create_user('buyer'))
+        OrderItem.objects.create(order=order, product=self.popular, qty=3)
+        OrderItem.objects.create(order=order, product=self.rare, qty=1)
+
+    def _titles(self, query, **params):
+        response = self.client.get('/api/suggest/', {'q': query, **params})
+        return [item['title'] for item in response.json()['results']]
+
+    def test_prefix_lookup_by_popularity(self):
+        self.assertEqual(self._titles('пио'), ['Букет из пионов', 'Пионы', 'Пионовидные розы', 'Пион'])
+        self.assertEqual(self._titles('пио', type='product'), ['Букет из пионов', 'Пионовидные розы'])
+        self.assertEqual(self._titles('пио роз'), ['Пионовидные розы'])
+        self.assertEqual(self._titles('pio', limit=1), ['Букет из пионов'])
+        self.assertEqual(self._titles('gbjys'), ['Пионы'])
+        self.assertEqual(self._titles(''), [])
+
+    def test_lookup_does_not_query_database(self):
+        suggest.get_index()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self._titles('пион')), 4)
+
+    def test_index_updates_incrementally(self):
+        suggest.get_index()
+        with mock.patch.object(suggest, 'build_index', side_effect=AssertionError('full rebuild')):
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.create(title='Пионы и ирисы', slug='piony-irisy', price=5)
+            self.assertIn('Пионы и ирисы', self._titles('ири'))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.popular.is_published = False
+                self.popular.save()
+                self.peonies.name = 'Пионы садовые'
+                self.peonies.save()
+            titles = self._titles('пио')
+            self.assertNotIn('Букет из пионов', titles)
+            self.assertEqual(titles[0], 'Пионы садовые')
+
+    def test_bulk_import_invalidates_index(self):
+        suggest.get_index()
+        suggest.invalidate()
+        Product.objects.bulk_create([Product(title='Ирисы', slug='irisy', price=1)])
+        self.assertEqual(self._titles('ирис'), ['Ирисы'])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        caches[page_cache.CACHE_ALIAS].clear()
+        facets.invalidate()
+        self.rose = FlowerTag.objects.create(name='Роза', slug='roza')
+        self.peony = FlowerTag.objects.create(name='Пион', slug='pion')
+        self.center = Store.objects.create(name='Центр', subdomain='center')
+        self.south = Store.objects.create(name='Юг', subdomain='south')
+        self.bouquets = Category.objects.create(name='Букеты', slug='bukety')
+        self.mono = Category.objects.create(name='Монобукеты', slug='mono', parent=self.bouquets)
+        self.gifts = Category.objects.create(name='Подарки', slug='podarki')
+
+        def make(slug, price, tags=(), stores=(), category=None, extra=(), **fields):
+            product = Product.objects.create(title=slug, slug=slug, price=price, category=category, **fields)
+            product.flower_tags.add(*tags)
+            product.stores.add(*stores)
+            product.categories.add(*extra)
+            return product
+
+        self.roses = make('rozy', 40, [self.rose], [self.center], self.mono,
+                          is_online_showcase=True, showcase_channel='pickup')
+        self.mixed = make('miks', 120, [self.rose, self.peony], [self.center, self.south], self.bouquets,
+                          is_online_showcase=True, showcase_channel='both')
+        self.peonies = make('piony', 80, [self.peony], [self.south], extra=[self.bouquets])
+        self.gift = make('podarok', 300, stores=[self.center], category=self.gifts)
+        make('skryt', 50, [self.rose], [self.center], self.bouquets, is_published=False)
+
+    def _ids(self, url, params=None):
+        return [item['id'] for item in self.client.get(url, params or {}).context['products']]
+
+    def test_counts_exclude_own_facet_and_intersect_others(self):
+        index = facets.get_index()
+        counts = index.counts(facets.Selection(flower=['roza'], store=[str(self.center.pk)]))
+        # Выбор в фасете «цветы» не сужает его собственные счётчики, магазин — сужает
+        self.assertEqual(counts['flower'], {'roza': 2, 'pion': 1})
+        self.assertEqual(counts['store'][str(self.center.pk)], 2)
+        self.assertEqual(counts['store'][str(self.south.pk)], 1)
+        self.assertEqual(counts['price']['0-50'], 1)
+        self.assertEqual(counts['price']['100-150'], 1)
+        self.assertEqual(counts['channel'], {'delivery': 1, 'pickup': 2})
+
+        category_counts = index.category_counts(facets.Selection(), {self.bouquets.pk: [self.mono.pk]})
+        self.assertEqual(category_counts, {self.bouquets.pk: 3})
+
+    def test_catalog_filters_by_several_facets_without_count_queries(self):
+        facets.get_index()
+        url = '/store/category/bukety/'
+        with CaptureQueriesContext(connection) as queries:
+            ids = self._ids(url, {'flower': ['roza', 'pion'], 'price': ['0-50', '50-100']})
+        self.assertEqual(ids, [self.peonies.id, self.roses.id])
+        sql = ' '.join(query['sql'] for query in queries.captured_queries).upper()
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+        self.assertEqual(self._ids(url, {'flower': 'roza', 'channel': 'delivery'}), [self.mixed.id])
+        self.assertEqual(self._ids(url, {'store': self.south.pk, 'flower': 'unknown'}),
+                         [self.peonies.id, self.mixed.id])
+        # Старая ссылка «категория + цветок» и ЧПУ цветка
+        self.assertEqual(self._ids(url, {'flower_tag_slug': 'pion'}), [self.peonies.id, self.mixed.id])
+        self.assertEqual(self._ids('/store/flower/roza/', {'store': self.center.pk}), [self.mixed.id, self.roses.id])
+
+    def test_facet_links_toggle_values(self):
+        response = self.client.get('/store/category/bukety/', {'flower': 'roza'})
+        groups = {group['key']: group for group in response.context['facet_groups']}
+        options = {option['value']: option for option in groups['flower']['options']}
+        self.assertTrue(options['roza']['selected'])
+        self.assertEqual(options['roza']['url'], '/store/category/bukety/')
+        self.assertEqual(options['pion']['url'], '/store/category/bukety/?flower=roza&flower=pion')
+        self.assertNotIn('250-', {option['value'] for option in groups['price']['options']})
+        self.assertEqual(response.context['all_categories_url'], '/store/flower/roza/')
+
+    def test_more_endpoint_keeps_facets(self):
+        with mock.patch.object(views, 'CATALOG_PAGE_SIZE', 1):
+            response = self.client.get('/store/category/bukety/', {'flower': 'roza'})
+        self.assertEqual(response.context['more_url'], '/store/more/?category=bukety&flower=roza')
+        data = self.client.get('/store/more/', {'category': 'bukety', 'flower': 'roza',
+                                                'after': response.context['next_cursor']}).json()
+        self.assertEqual([item['id'] for item in data['items']], [self.roses.id])
+
+    def test_index_rebuilds_after_commit(self):
+        facets.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gift.flower_tags.add(self.rose)
+        self.assertEqual(facets.get_index().counts(facets.Selection())['flower']['roza'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.roses.is_published = False
+            self.roses.save()
+        self.assertEqual(facets.get_index().counts(facets.Selection())['flower']['roza'], 2)
+
+    def test_index_expires_without_shared_version(self):
+        # Другой воркер с locmem-кэшем: версия здесь не сдвинулась, но маски не старше MAX_AGE
+        index = facets.get_index()
+        Product.objects.filter(pk=self.roses.pk).update(is_published=False)
+        self.assertIs(facets.get_index(), index)
+        expired = facets._built_at + facets.MAX_AGE
+        with mock.patch.object(facets.time, 'monotonic', return_value=expired):
+            self.assertEqual(facets.get_index().counts(facets.Selection())['flower']['roza'], 1)
+
+
+class QueryPlanAssertions:
+    """EXPLAIN QUERY PLAN (SQLite) для SELECT-запросов, выполненных при запросе страницы."""
+
+    def assertNoFullScans(self, url, params=None, tables=('shop_product',)):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200, url)
+        for query in queries.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                details = [row[-1] for row in cursor.fetchall()]
+            # «SCAN t» без «USING ... INDEX» — чтение всей таблицы
+            scans = [
+                detail for detail in details
+                if detail.startswith('SCAN ') and 'INDEX' not in detail and detail.split()[1] in tables
+            ]
+            self.assertEqual(scans, [], f"{url}: {query['sql']}")
+        return response
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN — синтаксис SQLite')
+class CatalogSortTests(QueryPlanAssertions, TestCase):
+    def setUp(self):
+        caches[page_cache.CACHE_ALIAS].clear()
+        facets.invalidate()
+        self.category = Category.objects.create(name='Букеты', slug='bukety')
+        self.products = {}
+        for slug, price, sold in (('a', 30, 1), ('b', 10, 5), ('c', None, 0), ('d', 20, 0), ('e', 50, 2)):
+            product = Product.objects.create(title=slug, slug=slug, price=price, category=self.category)
+            self.products[slug] = product
+        Product.objects.create(title='hidden', slug='hidden', price=5, is_published=False)
+        order = Order.objects.create(user=User.objects.create_user('buyer'))
+        with self.captureOnCommitCallbacks(execute=True):
+            for slug, product in self.products.items():
+                qty = {'a': 1, 'b': 5, 'e': 2}.get(slug)
+                if qty:
+                    OrderItem.objects.create(order=order, product=product, qty=qty)
+
+    def _slugs(self, url, params=None):
+        return [item['slug'] for item in self.client.get(url, params or {}).context['products']]
+
+    def _api_slugs(self, params):
+        return [item['slug'] for item in self.client.get('/api/products/', params).json()['results']]
+
+    def test_sold_count_follows_order_items(self):
+        self.products['b'].refresh_from_db()
+        self.assertEqual(self.products['b'].sold_count, 5)
+        OrderItem.objects.filter(product=self.products['b']).delete()
+        self.products['b'].refresh_from_db()
+        self.assertEqual(self.products['b'].sold_count, 0)
+
+    def test_store_sorting_and_price_bounds(self):
+        self.assertEqual(self._slugs('/store/'), ['e', 'd', 'c', 'b', 'a'])
+        self.assertEqual(self._slugs('/store/', {'sort': 'price'}), ['b', 'd', 'a', 'e', 'c'])
+        self.assertEqual(self._slugs('/store/', {'sort': '-price'}), ['e', 'a', 'd', 'b', 'c'])
+        self.assertEqual(self._slugs('/store/category/bukety/', {'sort': 'popular'}), ['b', 'e', 'a', 'd', 'c'])
+        self.assertEqual(self._slugs('/store/', {'min_price': '15', 'max_price': '30', 'sort': 'price'}), ['d', 'a'])
+        self.assertEqual(self._slugs('/store/', {'min_price': 'abc', 'max_price': '20'}), ['d', 'b'])
+
+    def test_sorted_listing_pages_by_cursor(self):
+        with mock.patch.object(views, 'CATALOG_PAGE_SIZE', 2):
+            response = self.client.get('/store/category/bukety/', {'sort': '-price'})
+            self.assertEqual([item['slug'] for item in response.context['products']], ['e', 'a'])
+            self.assertEqual(response.context['more_url'], '/store/more/?category=bukety&sort=-price')
+            seen = []
+            cursor = response.context['next_cursor']
+            while cursor:
+                data = self.client.get('/store/more/', {'category': 'bukety', 'sort': '-price', 'after': cursor}).json()
+                seen += [item['slug'] for item in data['items']]
+                cursor = data['next_cursor']
+        self.assertEqual(seen, ['d', 'b', 'c'])
+
+    def test_api_sorting_and_price_bounds(self):
+        self.assertEqual(self._api_slugs({'sort': 'price'}), ['b', 'd', 'a', 'e'])
+        self.assertEqual(self._api_slugs({'sort': '-price', 'max_price': '30'}), ['a', 'd', 'b'])
+        self.assertEqual(self._api_slugs({'sort': 'popular', 'min_price': '20'}), ['e', 'a', 'd'])
+        self.assertEqual(self._api_slugs({'sort': 'price', 'page_size': 2}), ['b', 'd'])
+
+    def test_listing_query_plans_avoid_full_scans(self):
+        facets.get_index()
+        for params in ({}, {'sort': 'price', 'min_price': '15'}, {'sort': '-price', 'max_price': '40'},
+                       {'sort': 'popular'}):
+            self.assertNoFullScans('/api/products/', params)
+            self.assertNoFullScans('/store/category/bukety/', params)
+            self.assertNoFullScans('/store/more/', {'category': 'bukety', **params})
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN — синтаксис SQLite')
+class PublicQueryPlanTests(QueryPlanAssertions, TestCase):
+    """Публичные страницы и API из shop/views.py не читают горячие таблицы целиком."""
+
+    TABLES = ('shop_product', 'shop_category', 'shop_review', 'shop_herobanner', 'shop_store', 'shop_ticker')
+
+    def setUp(self):
+        caches[page_cache.CACHE_ALIAS].clear()
+        facets.invalidate()
+        self.store = Store.objects.create(subdomain='center', name='Центр')
+        Store.objects.create(subdomain='old', name='Закрыт', is_active=False)
+        self.parent = Category.objects.create(name='Букеты', slug='bukety')
+        self.child = Category.objects.create(name='Розы', slug='rozy', parent=self.parent)
+        self.tag = FlowerTag.objects.create(name='Роза', slug='roza')
+        for n in range(5):
+            product = Product.objects.create(
+                title=f'Букет {n}', slug=f'buket-{n}', article=f'A{n}', price=10 + n, category=self.child,
+                is_online_showcase=bool(n % 2), is_published=n != 4,
+            )
+            product.flower_tags.add(self.tag)
+            product.stores.add(self.store)
+        Review.objects.create(author='Анна', text='Спасибо', is_published=True)
+        Review.objects.create(author='Олег', text='Скрыт', is_published=False)
+        HeroBanner.objects.create(name='Весна', title='Весна', is_active=True)
+        Ticker.objects.create(text='Доставка', is_active=True)
+        facets.get_index()
+
+    def test_public_pages(self):
+        for url in ('/', '/store/', '/store/category/bukety/', '/store/category/rozy/', '/store/flower/roza/',
+                    '/store/more/?category=bukety', '/store/buket-1/', '/reviews/', '/kontakty/'):
+            self.assertNoFullScans(url, tables=self.TABLES)
+
+    def test_public_api(self):
+        for url, params in (('/api/products/', {}), ('/api/products/', {'online_showcase': '1'}),
+                            ('/api/reviews/', {}), ('/api/stores/', {}), ('/api/hero-banners/current/', {})):
+            self.assertNoFullScans(url, params, tables=self.TABLES)
+
+    def test_lookups_by_indexed_columns(self):
+        queries = (
+            Product.objects.filter(article='A1'),
+            Category.objects.filter(slug='rozy'),
+            Product.objects.filter(is_online_showcase=True).order_by('showcase_sort_order', '-id'),
+        )
+        for queryset in queries:
+            plan = queryset.explain()
+            self.assertIn('INDEX', plan, str(queryset.query))
+
+    def test_category_slug_is_unique(self):
+        Category.objects.create(name='Без slug 1')
+        Category.objects.create(name='Без slug 2')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Category.objects.create(name='Другие розы', slug='rozy')
@@ -0,0 +1,260 @@
+"""
+Адаптивные превью (renditions) загруженных изображений.
+
+Для файла из MEDIA (например products/abc.jpg) рядом кладутся уменьшенные копии
+фиксированной ширины в WebP и JPEG: products/abc.320w.webp, products/abc.320w.jpg ...
+Генерируются фоновой задачей (shop/jobs.py) после загрузки или при первом показе,
+либо заранее командой generate_thumbnails. Готовые srcset-строки записываются рядом
+(products/abc.srcset.json) и кэшируются, чтобы при рендере карточек не ходить в storage.
+Файл в storage нужен процессам сайта, которые не видят кэш воркера (locmem).
+"""
+
+import json
+import logging
+import os
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+log = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 1280)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+CACHE_PREFIX = 'thumbnails:srcset:'
+# Битые/отсутствующие файлы не пытаемся пережимать на каждом запросе
+FAILED_TTL = 60 * 60
+# Пока фоновая задача создаёт превью, страницы отдают оригинал
+PENDING_TTL = 60
+
+
+def media_name(value):
+    """FieldFile, имя файла или /media/-URL → имя файла в default_storage
+    ('' для внешних URL и static)."""
+    value = str(getattr(value, 'name', value) or '')
+    media_url = settings.MEDIA_URL
+    if value.startswith(media_url):
+        return value[len(media_url):]
+    if value.startswith(('http://', 'https://', '/')):
+        return ''
+    return value
+
+
+def rendition_name(name, width, fmt):
+    root, _ext = posixpath.splitext(name)
+    return f'{root}.{width}w.{EXTENSIONS[fmt]}'
+
+
+def manifest_name(name):
+    root, _ext = posixpath.splitext(name)
+    return f'{root}.srcset.json'
+
+
+def _cache_key(name):
+    return f'{CACHE_PREFIX}{name}'
+
+
+def _open_source(name):
+    from PIL import Image, ImageOps
+
+    with default_storage.open(name, 'rb') as fh:
+        image = Image.open(fh)
+        image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def _encode(image, fmt):
+    pil_format, options = FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        from PIL import Image
+
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[-1])
+        image = background
+    elif fmt == 'webp' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def generate_renditions(name, overwrite=False):
+    """Создать превью для файла; вернуть {'webp': srcset, 'jpeg': srcset} ({} при ошибке)."""
+    from PIL import Image
+
+    try:
+        source = _open_source(name)
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        log.warning('Cannot open image %s for thumbnails: %s', name, exc)
+        cache.set(_cache_key(name), {}, FAILED_TTL)
+        return {}
+
+    widths = sorted({min(width, source.width) for width in WIDTHS})
+    srcsets = {fmt: [] for fmt in FORMATS}
+    for width in widths:
+        height = max(1, round(source.height * width / source.width))
+        resized = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+        for fmt in FORMATS:
+            target = rendition_name(name, width, fmt)
+            if overwrite and default_storage.exists(target):
+                default_storage.delete(target)
+            if not default_storage.exists(target):
+                saved = default_storage.save(target, ContentFile(_encode(resized, fmt)))
+                if saved != target:
+                    log.warning('Storage renamed rendition %s -> %s', target, saved)
+                    target = saved
+            srcsets[fmt].append(f'{default_storage.url(target)} {width}w')
+
+    result = {fmt: ', '.join(entries) for fmt, entries in srcsets.items()}
+    _save_manifest(name, result)
+    cache.set(_cache_key(name), result, None)
+    return result
+
+
+def _save_manifest(name, srcsets):
+    target = manifest_name(name)
+    if default_storage.exists(target):
+        default_storage.delete(target)
+    saved = default_storage.save(target, ContentFile(json.dumps(srcsets).encode()))
+    if saved != target:
+        log.warning('Storage renamed srcset manifest %s -> %s', target, saved)
+
+
+def _load_manifest(name):
+    """srcset из файла рядом с оригиналом или None, если превью ещё не созданы."""
+    try:
+        with default_storage.open(manifest_name(name), 'rb') as fh:
+            return json.loads(fh.read())
+    except (OSError, ValueError):
+        return None
+
+
+# Оригиналы больше этого по длинной стороне уменьшаются при обработке загрузки
+MAX_ORIGINAL_SIDE = 2560
+ORIGINAL_FORMATS = {'JPEG': 'jpeg', 'WEBP': 'webp'}
+
+
+def optimize_original(name):
+    """Обработка загруженного оригинала: поворот по EXIF, удаление EXIF/GPS,
+    уменьшение до MAX_ORIGINAL_SIDE и перекодирование. Имя файла не меняется.
+    Уже обработанный файл (без EXIF и не больше MAX_ORIGINAL_SIDE) не трогается."""
+    from PIL import Image, ImageOps
+
+    try:
+        with default_storage.open(name, 'rb') as fh:
+            image = Image.open(fh)
+            image.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        log.warning('Cannot open image %s for optimization: %s', name, exc)
+        return False
+
+    fmt = ORIGINAL_FORMATS.get(image.format)
+    if fmt is None:
+        # PNG/GIF и прочее оставляем как есть: перекодирование в JPEG сменило бы расширение
+        return False
+    if max(image.size) <= MAX_ORIGINAL_SIDE and not image.getexif():
+        # Повторная задача или файл уже без метаданных: перекодирование только теряло бы качество
+        return False
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > MAX_ORIGINAL_SIDE:
+        image.thumbnail((MAX_ORIGINAL_SIDE, MAX_ORIGINAL_SIDE), Image.LANCZOS)
+    _replace(name, _encode(image, fmt))
+    return True
+
+
+def _replace(name, content):
+    """Записать content вместо файла name. Сначала во временный файл рядом, затем подмена:
+    если запись упадёт, оригинал останется на месте."""
+    base, ext = posixpath.splitext(name)
+    temp = default_storage.save(f'{base}.optimizing{ext}', ContentFile(content))
+    try:
+        source, target = default_storage.path(temp), default_storage.path(name)
+    except NotImplementedError:
+        # Хранилище без локальных путей (S3 и т.п.): перезапись из уже сохранённой копии
+        default_storage.delete(name)
+        with default_storage.open(temp, 'rb') as fh:
+            saved = default_storage.save(name, fh)
+        default_storage.delete(temp)
+        if saved != name:
+            log.warning('Storage renamed optimized original %s -> %s', name, saved)
+    else:
+        os.replace(source, target)
+
+
+def delete_renditions(name):
+    for width in WIDTHS:
+        for fmt in FORMATS:
+            target = rendition_name(name, width, fmt)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+    if default_storage.exists(manifest_name(name)):
+        default_storage.delete(manifest_name(name))
+    cache.delete(_cache_key(name))
+
+
+def _generate_lazily(name):
+    """Превью ещё нет: с очередью задач — ставим задачу и пока отдаём оригинал,
+    без неё — создаём прямо сейчас."""
+    if not getattr(settings, 'JOBS_ENABLED', False):
+        return generate_renditions(name)
+    from . import jobs
+
+    dedupe_key = f'renditions:{name}'
+    if jobs.failed_recently(dedupe_key, FAILED_TTL):
+        cache.set(_cache_key(name), {}, FAILED_TTL)
+        return {}
+    jobs.enqueue('generate_renditions', dedupe_key=dedupe_key, name=name)
+    cache.set(_cache_key(name), {}, PENDING_TTL)
+    return {}
+
+
+def srcsets_for(values):
+    """Пакетно: {name: {'webp': srcset, 'jpeg': srcset}} для FieldFile/URL из MEDIA.
+    Недостающие превью создаются лениво при первом обращении."""
+    return _srcsets_for_names({media_name(value) for value in values} - {''})
+
+
+def _srcsets_for_names(names):
+    if not names:
+        return {}
+    cached = cache.get_many([_cache_key(name) for name in names])
+    result = {}
+    for name in names:
+        srcsets = cached.get(_cache_key(name))
+        if srcsets is None:
+            # Превью мог создать воркер — его кэш этому процессу не виден
+            srcsets = _load_manifest(name)
+            if srcsets is not None:
+                cache.set(_cache_key(name), srcsets, None)
+            else:
+                srcsets = _generate_lazily(name)
+        if srcsets:
+            result[name] = srcsets
+    return result
+
+
+def srcset(value, fmt='webp'):
+    """srcset одной картинки ('' если превью нет)."""
+    name = media_name(value)
+    if not name:
+        return ''
+    return _srcsets_for_names({name}).get(name, {}).get(fmt, '')
+
+
+def rendition_url(value, width, fmt='webp'):
+    """URL самого крупного превью не шире width ('' если превью нет)."""
+    best = ''
+    for entry in filter(None, srcset(value, fmt).split(', ')):
+        url, entry_width = entry.rsplit(' ', 1)
+        if not best or int(entry_width[:-1]) <= width:
+            best = url
+    return best
@@ -3,8 +3,8 @@ from django.views.generic import RedirectView
 from rest_framework.routers import DefaultRouter
 from .views import (ProductViewSet, OrderViewSet, DiscountViewSet, CategoryViewSet, ReviewViewSet, ReviewSubmitView, RegisterView
                     , api_root, UserProfileViewSet, HeroBannerViewSet, hero_banner_current, StoreViewSet, FlowerTagViewSet,
-                    BotProductCreateView, BotAuthView, home_page, store_page, product_page, product_page_by_id,
-                    store_page_category, store_page_flower, old_product_redirect,
+                    BotProductCreateView, BotProductBulkCreateView, BotAuthView, BotManagersVersionView, home_page, store_page, product_page, product_page_by_id,
+                    store_page_category, store_page_flower, store_page_more, store_search, suggest_api, old_product_redirect,
                     categories_page, reviews_page, site_page,
                     cart_page, cart_add, cart_update, cart_remove, cart_count, cart_checkout, cart_drawer,
                     contacts_page,
@@ -37,6 +37,10 @@ urlpatterns = [
     # ЧПУ фильтры каталога (до <slug:slug> чтобы не конфликтовали)
     path('store/category/<slug:slug>/', store_page_category, name='web_store_category'),
     path('store/flower/<slug:slug>/', store_page_flower, name='web_store_flower'),
+    # Следующая порция каталога для бесконечной прокрутки (JSON + HTML-фрагмент)
+    path('store/more/', store_page_more, name='web_store_more'),
+    # Полнотекстовый поиск по каталогу (?q=)
+    path('store/search/', store_search, name='web_store_search'),
     # Карточка товара по slug
     path('store/<slug:slug>/', product_page, name='web_product'),
     # 301 редирект: старый числовой URL
@@ -86,11 +90,14 @@ urlpatterns = [
     path('dashboard/api/review/<int:review_id>/delete/', dash_api_review_delete, name='dash_api_review_delete'),
 
     path('api/', api_root, name='api-root'),
+    path('api/suggest/', suggest_api, name='suggest'),
     path('api/reviews/submit/', ReviewSubmitView.as_view(), name='review-submit'),
     path('api/hero-banners/current/', hero_banner_current, name='hero-banner-current'),
     path('api/', include(router.urls)),
     path('api/v1/products/from-bot/', BotProductCreateView.as_view(), name='bot-product-create'),
+    path('api/v1/products/from-bot/bulk/', BotProductBulkCreateView.as_view(), name='bot-product-bulk-create'),
     path('api/v1/auth/bot-token/', BotAuthView.as_view(), name='bot-auth'),
+    path('api/v1/auth/managers-version/', BotManagersVersionView.as_view(), name='bot-managers-version'),
     path('api/profile/', UserProfileViewSet.as_view(), name='user_profile'),
     path('register/', RegisterView.as_view(), name='auth_register'),
 ]
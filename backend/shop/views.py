@@ -1,6 +1,8 @@
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.db.models import Prefetch, Q
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.generics import RetrieveUpdateAPIView, CreateAPIView
 from rest_framework.response import Response
@@ -12,17 +14,22 @@ from rest_framework.views import APIView
 from django.utils import timezone
 from django.utils.text import slugify
 from django.shortcuts import get_object_or_404, render, redirect
+from django.template.loader import render_to_string
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
-from urllib.parse import quote, urlsplit
+from urllib.parse import parse_qsl, quote, urlencode
 import json
 from datetime import date
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .models import Product, Discount, Order, Category, Review, HeroBanner, Store, StoreManager, FlowerTag, ShowcaseItem, Ticker
 from .serializers import (ProductSerializer, DiscountSerializer, OrderSerializer, CategorySerializer
 , TokenObtainPairSerializer, RegisterSerializer, UserSerializer, ReviewSerializer, PublicReviewCreateSerializer,
-HeroBannerSerializer, StoreSerializer, StoreManagerSerializer, BotProductCreateSerializer, FlowerTagSerializer)
+HeroBannerSerializer, StoreSerializer, StoreManagerSerializer, BotProductCreateSerializer, BotProductBulkCreateSerializer,
+FlowerTagSerializer, delete_uploaded_images)
+from .page_cache import cached_page
+from .pagination import OffsetPaginationOptInMixin, StableCursorPagination
+from . import bulk_import, facets, jobs, page_cache, search, signals, suggest, thumbnails
 
 
 class BotTokenPermission(IsAuthenticatedOrReadOnly):
@@ -32,23 +39,10 @@ class BotTokenPermission(IsAuthenticatedOrReadOnly):
         return bool(token and expected and token == expected)
 
 
+@cached_page(lambda: ['home'])
 def home_page(request):
-    def normalize_public_url(raw_url):
-        if not raw_url:
-            return ""
-        if raw_url.startswith("/"):
-            return raw_url
-        parsed = urlsplit(raw_url)
-        if parsed.scheme and parsed.netloc and parsed.path:
-            return parsed.path
-        return raw_url
-
     def product_image_url(product):
-        if product.uploaded_image:
-            return product.uploaded_image.url
-        if product.image:
-            return normalize_public_url(product.image)
-        return "/static/legacy-old/image/no_image.jpg"
+        return product.primary_image_url or "/static/legacy-old/image/no_image.jpg"
 
     today = timezone.localdate()
     hero_banners = HeroBanner.objects.filter(is_active=True).order_by("sort_order", "-created_at")
@@ -59,33 +53,9 @@ def home_page(request):
         if starts_ok and ends_ok:
             active_banners.append(banner)
 
-    # Витрины по магазинам через ShowcaseItem
-    active_stores = Store.objects.filter(is_active=True).order_by("sort_order", "name")
-    store_showcases = []
-    for store in active_stores:
-        items_qs = list(
-            ShowcaseItem.objects.filter(store=store, product__is_published=True)
-            .select_related('product')
-            .order_by("sort_order", "-id")[:8]
-        )
-        if not items_qs:
-            continue
-        cards = [
-            {
-                "id": item.product.id,
-                "slug": item.product.slug,
-                "title": item.product.title.replace("/", " ").replace("\\", " ").strip(),
-                "price": item.product.price,
-                "image": product_image_url(item.product),
-                "hover_image": normalize_public_url(item.product.image) if item.product.image else product_image_url(item.product),
-                "href": f"/store/{item.product.slug}/" if item.product.slug else f"/store/{item.product.id}/",
-            }
-            for item in items_qs
-        ]
-        store_showcases.append({
-            "store": store,
-            "cards": cards,
-        })
+    # Витрины по магазинам через ShowcaseItem (один запрос на все магазины)
+    active_stores = list(Store.objects.filter(is_active=True).order_by("sort_order", "name"))
+    showcase_items = _top_showcase_items(active_stores, limit=8)
 
     # Единая витрина (fallback) — все магазины вместе, если нет разбивки
     showcase_products = list(
@@ -95,16 +65,42 @@ def home_page(request):
         .order_by("showcase_sort_order", "-id")[:24]
     )
 
-    categories = Category.objects.filter(parent__isnull=True).prefetch_related(
-        Prefetch(
-            "products",
-            queryset=Product.objects.filter(is_published=True).order_by("-id"),
-        )
-    ).order_by("sort_order", "name")
+    categories = list(Category.objects.filter(parent__isnull=True).order_by("sort_order", "name"))
+    category_covers = _category_cover_products(categories, limit=2)
+
+    # Адаптивные превью для всех карточек страницы — одним пакетом
+    srcsets = _image_srcsets(
+        [item.product for items in showcase_items.values() for item in items]
+        + showcase_products
+        + [products[0] for products in category_covers.values() if products]
+    )
+
+    def product_card(product):
+        return {
+            "id": product.id,
+            "slug": product.slug,
+            "title": product.title.replace("/", " ").replace("\\", " ").strip(),
+            "price": product.price,
+            "image": product_image_url(product),
+            "hover_image": product.hover_image_url or product_image_url(product),
+            "srcset_webp": srcsets[product.id].get("webp", ""),
+            "srcset_jpeg": srcsets[product.id].get("jpeg", ""),
+            "href": f"/store/{product.slug}/" if product.slug else f"/store/{product.id}/",
+        }
+
+    store_showcases = []
+    for store in active_stores:
+        items_qs = showcase_items.get(store.id, [])
+        if not items_qs:
+            continue
+        store_showcases.append({
+            "store": store,
+            "cards": [product_card(item.product) for item in items_qs],
+        })
 
     category_cards = []
     for category in categories:
-        products = list(category.products.all())
+        products = category_covers.get(category.id, [])
         if not products:
             continue
         primary = products[0]
@@ -116,22 +112,13 @@ def home_page(request):
                 "slug": category.slug,
                 "image": product_image_url(primary),
                 "hover_image": product_image_url(secondary),
+                "srcset_webp": srcsets[primary.id].get("webp", ""),
+                "srcset_jpeg": srcsets[primary.id].get("jpeg", ""),
                 "href": f"/store/category/{category.slug}/" if category.slug else f"/store/?category={quote(category.name)}",
             }
         )
 
-    showcase_cards = [
-        {
-            "id": p.id,
-            "slug": p.slug,
-            "title": p.title.replace("/", " ").replace("\\", " ").strip(),
-            "price": p.price,
-            "image": product_image_url(p),
-            "hover_image": normalize_public_url(p.image) if p.image else product_image_url(p),
-            "href": f"/store/{p.slug}/" if p.slug else f"/store/{p.id}/",
-        }
-        for p in showcase_products
-    ]
+    showcase_cards = [product_card(p) for p in showcase_products]
 
     reviews = Review.objects.filter(is_published=True).order_by("sort_order", "-created_at")[:6]
     stores = Store.objects.filter(is_active=True).order_by("name")
@@ -149,17 +136,180 @@ def home_page(request):
     )
 
 
-def store_page(request):
-    def normalize_public_url(raw_url):
-        if not raw_url:
-            return ""
-        if raw_url.startswith("/"):
-            return raw_url
-        parsed = urlsplit(raw_url)
-        if parsed.scheme and parsed.netloc and parsed.path:
-            return parsed.path
-        return raw_url
+def _top_n_per_group(queryset, group_field, order_by, limit):
+    """Первые `limit` строк queryset в каждой группе `group_field` одним запросом:
+    {group_value: [obj, ...]}. Ранжирование через ROW_NUMBER() OVER (PARTITION BY ...);
+    если БД не умеет оконные функции (старый SQLite) — режем в Python."""
+    if connection.features.supports_over_clause:
+        queryset = queryset.annotate(
+            group_rank=Window(RowNumber(), partition_by=[F(group_field)], order_by=order_by)
+        ).filter(group_rank__lte=limit)
+    grouped = {}
+    for obj in queryset.order_by(group_field, *order_by):
+        bucket = grouped.setdefault(getattr(obj, group_field), [])
+        if len(bucket) < limit:
+            bucket.append(obj)
+    return grouped
+
+
+def _top_showcase_items(stores, limit=8):
+    """Топ-N товаров витрины каждого магазина: {store_id: [ShowcaseItem, ...]}."""
+    store_ids = [store.id for store in stores]
+    if not store_ids:
+        return {}
+    items_qs = ShowcaseItem.objects.filter(
+        store_id__in=store_ids, product__is_published=True
+    ).select_related('product')
+    return _top_n_per_group(items_qs, 'store_id', [F('sort_order').asc(), F('id').desc()], limit)
+
+
+def _category_cover_products(categories, limit=2):
+    """Обложки категорий — последние `limit` опубликованных товаров каждой категории:
+    {category_id: [Product, ...]}. Не грузит весь каталог категории ради двух карточек."""
+    category_ids = [category.id for category in categories]
+    if not category_ids:
+        return {}
+    links_qs = Product.categories.through.objects.filter(
+        category_id__in=category_ids, product__is_published=True
+    ).select_related('product')
+    grouped = _top_n_per_group(links_qs, 'category_id', [F('product_id').desc()], limit)
+    return {category_id: [link.product for link in links] for category_id, links in grouped.items()}
+
+
+CATALOG_PAGE_SIZE = 48
+PRODUCT_IMAGE_PLACEHOLDER = "/static/hero/today-desktop.svg"
+
+
+def _product_image_url(product):
+    return product.primary_image_url or PRODUCT_IMAGE_PLACEHOLDER
+
+
+def _category_ids(cat):
+    """Категория вместе с дочерними (None — весь каталог)."""
+    if cat is None:
+        return None
+    return [cat.id] + list(cat.children.values_list("id", flat=True))
+
+
+def _catalog_page(request, index, cat, selection):
+    """Keyset-пагинация (?after=): id страницы берутся из масок фасетов в порядке
+    selection.sort, из БД читается только сама страница.
+    Возвращает (товары страницы, курсор следующей страницы или None)."""
+    mask = index.match(selection, _category_ids(cat))
+    ids, next_cursor = index.page(mask, selection.sort, request.GET.get("after"), CATALOG_PAGE_SIZE)
+    by_id = Product.objects.filter(is_published=True).in_bulk(ids)
+    return [by_id[pk] for pk in ids if pk in by_id], next_cursor
+
+
+def _catalog_url(cat, selection):
+    """Адрес каталога для категории и выбранных фасетов; один цветок без других
+    фильтров — ЧПУ /store/flower/<slug>/."""
+    flowers = selection[facets.FLOWER]
+    if cat is None and len(flowers) == 1 and not selection.without(facets.FLOWER):
+        path, query = f"/store/flower/{flowers[0]}/", urlencode(selection.query(skip=[facets.FLOWER]))
+    else:
+        path = f"/store/category/{cat.slug}/" if cat is not None else "/store/"
+        query = urlencode(selection.query())
+    return f"{path}?{query}" if query else path
+
+
+FACET_TITLES = {
+    facets.FLOWER: "Букеты по цветам",
+    facets.PRICE: "Цена",
+    facets.STORE: "Магазин",
+    facets.CHANNEL: "Витрина",
+}
+
+
+def _facet_context(index, cat, selection, categories):
+    """Дропдауны фасетов со счётчиками и ссылками, сортировка и форма «цена от/до»
+    (без запросов к БД: всё из масок).
+    Категориям из categories (и их детям) проставляются facet_count и facet_url."""
+    counts = index.counts(selection, _category_ids(cat))
+    groups = []
+    for facet in facets.FACETS:
+        labels = index.labels[facet]
+        options = [
+            {
+                "value": value,
+                "label": labels[value],
+                "count": counts[facet][value],
+                "selected": value in selection[facet],
+                "url": _catalog_url(cat, selection.toggle(facet, value)),
+            }
+            for value in index.masks[facet]
+            if counts[facet][value] or value in selection[facet]
+        ]
+        groups.append({
+            "key": facet,
+            "title": FACET_TITLES[facet],
+            "label": ", ".join(labels[value] for value in selection[facet]),
+            "options": options,
+            "clear_url": _catalog_url(cat, selection.without(facet)) if selection[facet] else "",
+            "wide": facet == facets.FLOWER,
+        })
+
+    tree = {}
+    for c in categories:
+        children = list(c.children.all())
+        tree[c.id] = [ch.id for ch in children]
+        tree.update((ch.id, []) for ch in children)
+    category_counts = index.category_counts(selection, tree)
+    for c in categories:
+        for item in [c, *c.children.all()]:
+            item.facet_count = category_counts[item.id]
+            item.facet_url = _catalog_url(item, selection)
+
+    # Форма «цена от/до» отправляется на адрес каталога со всеми параметрами, кроме границ цены
+    price_action, _, price_query = _catalog_url(cat, selection.replace(min_price=None, max_price=None)).partition("?")
+    sorts = [
+        {
+            "label": label,
+            "selected": value == selection.sort,
+            "url": _catalog_url(cat, selection.replace(sort=value)),
+        }
+        for value, label in facets.SORTS
+    ]
+    return {
+        "facet_groups": groups,
+        "has_facets": bool(selection),
+        "all_categories_url": _catalog_url(None, selection),
+        "sort_options": sorts,
+        "sort_label": dict(facets.SORTS)[selection.sort],
+        "min_price": selection.min_price,
+        "max_price": selection.max_price,
+        "price_form_action": price_action,
+        "price_form_params": parse_qsl(price_query),
+    }
 
+
+def _catalog_context(request, cat=None, flowers=()):
+    """Страница каталога с фасетами + ссылки на следующую порцию (обычная и для бесконечной прокрутки)."""
+    index = facets.get_index()
+    selection = facets.Selection.from_query(request.GET, index, flowers)
+    categories = Category.objects.filter(parent__isnull=True).prefetch_related("children").order_by("sort_order", "name")
+    page, next_cursor = _catalog_page(request, index, cat, selection)
+    context = {
+        "products": _build_product_list(page),
+        "next_cursor": next_cursor,
+        "next_page_url": "",
+        "more_url": "",
+        "categories": categories,
+        "selected_category": cat.name if cat is not None else "",
+        "selected_category_slug": cat.slug if cat is not None else "",
+        **_facet_context(index, cat, selection, categories),
+    }
+    if next_cursor:
+        params = request.GET.copy()
+        params["after"] = next_cursor
+        context["next_page_url"] = f"{request.path}?{params.urlencode()}"
+        more_params = ([("category", cat.slug)] if cat is not None else []) + selection.query()
+        context["more_url"] = f"/store/more/?{urlencode(more_params)}" if more_params else "/store/more/"
+    return context
+
+
+@cached_page(lambda: ['catalog'])
+def store_page(request):
     # 301 редиректы с query-param URLs на ЧПУ
     category_name = (request.GET.get("category") or "").strip()
     flower_tag_name = (request.GET.get("flower_tag") or "").strip()
@@ -177,142 +327,107 @@ def store_page(request):
         if tag and tag.slug:
             return redirect(f'/store/flower/{tag.slug}/', permanent=True)
 
-    categories = Category.objects.filter(parent__isnull=True).prefetch_related("children").order_by("sort_order", "name")
-    flower_tags = FlowerTag.objects.order_by("sort_order", "name")
-    products_qs = Product.objects.filter(is_published=True).select_related("category").prefetch_related("stores", "categories").order_by("-id")
-    products = _build_product_list(products_qs, normalize_public_url)
+    return render(request, "shop/store.html", _catalog_context(request))
 
-    return render(request, "shop/store.html", {
-        "products": products,
-        "categories": categories,
-        "selected_category": "",
-        "selected_category_slug": "",
-        "flower_tags": flower_tags,
-        "selected_flower_tag": "",
-        "selected_flower_slug": "",
-    })
+
+def _image_srcsets(products):
+    """srcset превью (WebP/JPEG) для основного изображения товаров: {product_id: {...}}."""
+    by_name = thumbnails.srcsets_for(p.primary_image_url for p in products)
+    return {p.id: by_name.get(thumbnails.media_name(p.primary_image_url), {}) for p in products}
 
 
-def _build_product_list(products_qs, normalize_fn):
+def _build_product_list(products_qs):
+    products_qs = list(products_qs)
+    srcsets = _image_srcsets(products_qs)
     products = []
     for p in products_qs:
-        if p.uploaded_image:
-            image_url = p.uploaded_image.url
-        elif p.image:
-            image_url = normalize_fn(p.image)
-        else:
-            image_url = "/static/hero/today-desktop.svg"
         products.append({
             "id": p.id,
             "slug": p.slug,
             "title": p.title.replace("/", " ").replace("\\", " ").strip(),
             "price": p.price,
-            "image_url": image_url,
+            "image_url": _product_image_url(p),
+            "srcset_webp": srcsets[p.id].get("webp", ""),
+            "srcset_jpeg": srcsets[p.id].get("jpeg", ""),
         })
     return products
 
 
+@cached_page(lambda slug: ['catalog'])
 def store_page_category(request, slug):
-    def normalize_public_url(raw_url):
-        if not raw_url:
-            return ""
-        if raw_url.startswith("/"):
-            return raw_url
-        parsed = urlsplit(raw_url)
-        if parsed.scheme and parsed.netloc and parsed.path:
-            return parsed.path
-        return raw_url
-
     cat = get_object_or_404(Category, slug=slug)
-    # Собираем ID: сама категория + все дочерние
-    child_ids = list(cat.children.values_list("id", flat=True))
-    cat_ids = [cat.id] + child_ids
-
-    products_qs = Product.objects.filter(is_published=True)\
-        .select_related("category").prefetch_related("stores", "categories")\
-        .filter(Q(category__id__in=cat_ids) | Q(categories__id__in=cat_ids))\
-        .distinct().order_by("-id")
-
-    # Дополнительный фильтр по цветку (комбинированный)
-    flower_slug = (request.GET.get("flower_tag_slug") or "").strip()
-    selected_flower_tag = ""
-    selected_flower_slug = ""
-    if flower_slug:
-        tag = FlowerTag.objects.filter(slug=flower_slug).first()
-        if tag:
-            products_qs = products_qs.filter(flower_tags=tag).distinct()
-            selected_flower_tag = tag.name
-            selected_flower_slug = tag.slug
+    # Старые ссылки «категория + цветок» (?flower_tag_slug=) — тот же фасет, что ?flower=
+    flowers = [request.GET.get("flower_tag_slug", "").strip()]
+    return render(request, "shop/store.html", _catalog_context(request, cat=cat, flowers=flowers))
 
-    categories = Category.objects.filter(parent__isnull=True).prefetch_related("children").order_by("sort_order", "name")
-    flower_tags = FlowerTag.objects.order_by("sort_order", "name")
-    products = _build_product_list(products_qs, normalize_public_url)
 
-    return render(request, "shop/store.html", {
-        "products": products,
-        "categories": categories,
-        "selected_category": cat.name,
-        "selected_category_slug": slug,
-        "flower_tags": flower_tags,
-        "selected_flower_tag": selected_flower_tag,
-        "selected_flower_slug": selected_flower_slug,
-    })
+@cached_page(lambda slug: ['catalog'])
+def store_page_flower(request, slug):
+    tag = get_object_or_404(FlowerTag, slug=slug)
+    return render(request, "shop/store.html", _catalog_context(request, flowers=[tag.slug]))
 
 
-def store_page_flower(request, slug):
-    def normalize_public_url(raw_url):
-        if not raw_url:
-            return ""
-        if raw_url.startswith("/"):
-            return raw_url
-        parsed = urlsplit(raw_url)
-        if parsed.scheme and parsed.netloc and parsed.path:
-            return parsed.path
-        return raw_url
+SEARCH_PAGE_SIZE = CATALOG_PAGE_SIZE * 2
 
-    tag = get_object_or_404(FlowerTag, slug=slug)
-    products_qs = Product.objects.filter(is_published=True)\
-        .select_related("category").prefetch_related("stores", "categories")\
-        .filter(flower_tags=tag).distinct().order_by("-id")
 
-    categories = Category.objects.filter(parent__isnull=True).prefetch_related("children").order_by("sort_order", "name")
-    flower_tags = FlowerTag.objects.order_by("sort_order", "name")
-    products = _build_product_list(products_qs, normalize_public_url)
+def store_search(request):
+    """Поиск по каталогу /store/search/?q=... — лучшие совпадения одной страницей.
+    Кэш страниц не используется: запросы произвольные, а поиск идёт по индексу."""
+    query = (request.GET.get("q") or "").strip()[:100]
+    products = []
+    if query:
+        ids = search.search_ids(query, limit=SEARCH_PAGE_SIZE)
+        found = search.ranked(Product.objects.filter(is_published=True), ids).order_by("search_rank")
+        products = _build_product_list(found)
 
+    categories = Category.objects.filter(parent__isnull=True).prefetch_related("children").order_by("sort_order", "name")
     return render(request, "shop/store.html", {
         "products": products,
+        "next_cursor": None,
+        "next_page_url": "",
+        "more_url": "",
+        "search_query": query,
         "categories": categories,
         "selected_category": "",
         "selected_category_slug": "",
-        "flower_tags": flower_tags,
-        "selected_flower_tag": tag.name,
-        "selected_flower_slug": slug,
+        **_facet_context(facets.get_index(), None, facets.Selection(), categories),
     })
 
 
+def suggest_api(request):
+    """Подсказки при наборе: /api/suggest/?q=пио[&limit=8][&type=product,category,flower].
+    Отвечает из индекса в памяти (shop/suggest.py), без запросов к БД."""
+    query = (request.GET.get("q") or "").strip()[:100]
+    try:
+        limit = min(max(int(request.GET.get("limit") or suggest.DEFAULT_LIMIT), 1), suggest.MAX_LIMIT)
+    except ValueError:
+        limit = suggest.DEFAULT_LIMIT
+    kinds = {kind for kind in (request.GET.get("type") or "").split(",") if kind} or None
+    results = suggest.lookup(query, limit, kinds) if query else []
+    return JsonResponse({"query": query, "results": results})
+
+
+@cached_page(lambda: ['catalog'])
+def store_page_more(request):
+    """Следующая порция каталога для бесконечной прокрутки: HTML-фрагмент карточек + JSON.
+    Параметры — category и фасеты страницы (flower, price, store, channel)."""
+    category_slug = (request.GET.get("category") or "").strip()
+    cat = get_object_or_404(Category, slug=category_slug) if category_slug else None
+    index = facets.get_index()
+    page, next_cursor = _catalog_page(request, index, cat, facets.Selection.from_query(request.GET, index))
+    products = _build_product_list(page)
+    html = render_to_string("shop/partials/product_cards.html", {"products": products}, request=request)
+    return JsonResponse({"html": html, "items": products, "next_cursor": next_cursor})
+
+
+@cached_page(lambda slug: ['products', f'product:{slug}'])
 def product_page(request, slug):
-    def normalize_public_url(raw_url):
-        if not raw_url:
-            return ""
-        if raw_url.startswith("/"):
-            return raw_url
-        parsed = urlsplit(raw_url)
-        if parsed.scheme and parsed.netloc and parsed.path:
-            return parsed.path
-        return raw_url
-
     product = get_object_or_404(
         Product.objects.select_related("category").prefetch_related("stores", "flower_tags"),
         slug=slug,
         is_published=True,
     )
-    if product.uploaded_image:
-        image_url = product.uploaded_image.url
-    elif product.image:
-        image_url = normalize_public_url(product.image)
-    else:
-        image_url = "/static/hero/today-desktop.svg"
-    return render(request, "shop/product.html", {"product": product, "image_url": image_url})
+    return render(request, "shop/product.html", {"product": product, "image_url": _product_image_url(product)})
 
 
 def product_page_by_id(request, product_id):
@@ -327,6 +442,7 @@ def old_product_redirect(request, slug):
     return redirect(f'/store/{product.slug}/', permanent=True)
 
 
+@cached_page(lambda: ['categories'])
 def categories_page(request):
     categories = Category.objects.prefetch_related("products").order_by("name")
     return render(request, "shop/categories.html", {"categories": categories})
@@ -376,6 +492,7 @@ def site_page(request, slug):
     return render(request, "shop/site_page.html", {"page": page})
 
 
+@cached_page(lambda: ['contacts'])
 def contacts_page(request):
     from shop.models import Store
     stores = Store.objects.filter(is_active=True).prefetch_related('phones', 'photos').order_by('sort_order', 'name')
@@ -399,26 +516,69 @@ def api_root(request, format=None):
     })
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(OffsetPaginationOptInMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = StableCursorPagination
+
+    def _showcase_enabled(self):
+        online_showcase = self.request.query_params.get("online_showcase")
+        return bool(online_showcase and online_showcase.lower() in ("1", "true", "yes"))
+
+    def _search_query(self):
+        return (self.request.query_params.get("q") or "").strip()
+
+    # ?sort= (как в каталоге) -> порядок курсорной пагинации; ключи — индексы shop_product_pub_*_idx
+    SORT_ORDERINGS = {
+        'new': ('-id',),
+        'popular': ('-sold_count', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+    }
+
+    def _sort(self):
+        sort = self.request.query_params.get("sort")
+        return sort if sort in self.SORT_ORDERINGS else facets.SORT_NEW
+
+    def get_pagination_ordering(self):
+        if self._showcase_enabled():
+            return ('showcase_sort_order', '-id')
+        if self._search_query():
+            return ('search_rank', '-id')
+        return self.SORT_ORDERINGS[self._sort()]
 
     def get_queryset(self):
-        queryset = Product.objects.all().select_related("category").prefetch_related("stores", "flower_tags")
+        queryset = Product.objects.all().select_related("category").prefetch_related("stores", "flower_tags", "images")
         category = self.request.query_params.get("category")
-        online_showcase = self.request.query_params.get("online_showcase")
         store_subdomain = self.request.query_params.get("store__subdomain")
         flower_tag = self.request.query_params.get("flower_tag")
 
         if category:
             queryset = queryset.filter(category__name=category)
+        # DISTINCT нужен только при JOIN по M2M, иначе мешает идти по индексу сортировки
+        joined = False
         if store_subdomain is not None:
             queryset = queryset.filter(stores__subdomain=store_subdomain)
+            joined = True
         if flower_tag:
             queryset = queryset.filter(flower_tags__name=flower_tag)
-
-        showcase_enabled = bool(online_showcase and online_showcase.lower() in ("1", "true", "yes"))
+            joined = True
+        min_price = facets.parse_price(self.request.query_params.get("min_price"))
+        max_price = facets.parse_price(self.request.query_params.get("max_price"))
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+        if self._sort() in ('price', '-price'):
+            # Курсор по цене не умеет NULL — товары без цены в такой выдаче не участвуют
+            queryset = queryset.filter(price__isnull=False)
+        query = self._search_query()
+        if query:
+            # ?q= — полнотекстовый поиск, порядок по релевантности (search_rank)
+            queryset = search.ranked(queryset, search.search_ids(query))
+
+        showcase_enabled = self._showcase_enabled()
         if showcase_enabled:
             queryset = queryset.filter(is_online_showcase=True)
         if not self.request.user.is_authenticated:
@@ -426,13 +586,14 @@ class ProductViewSet(viewsets.ModelViewSet):
 
         if showcase_enabled:
             queryset = queryset.order_by('showcase_sort_order', '-id')
-        return queryset.distinct()
+        return queryset.distinct() if joined else queryset
 
     def perform_create(self, serializer):
         instance = serializer.save()
         if instance.uploaded_image and not instance.image:
             instance.image = self.request.build_absolute_uri(instance.uploaded_image.url)
             instance.save(update_fields=['image'])
+        jobs.enqueue_image_processing(instance, 'uploaded_image')
 
 
 class StoreViewSet(viewsets.ReadOnlyModelViewSet):
@@ -461,6 +622,40 @@ class BotProductCreateView(CreateAPIView):
                 store_slug = first_store.subdomain if first_store else 'main'
                 instance.article = slugify(f"{store_slug}-{instance.id}")[:64]
             instance.save(update_fields=['image', 'article'])
+            # Пережатие и превью — в фоне (run_worker), бот получает ответ сразу
+            jobs.enqueue_image_processing(instance, 'uploaded_image')
+
+
+class BotProductBulkCreateView(APIView):
+    """Альбом из бота: несколько фото → несколько товаров одним запросом и одной транзакцией."""
+    permission_classes = [BotTokenPermission]
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request):
+        serializer = BotProductBulkCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        store = serializer.validated_data['store_id']
+        store_slug = store.subdomain or 'main'
+        try:
+            with transaction.atomic():
+                products = serializer.save()
+                for product in products:
+                    product.image = request.build_absolute_uri(product.uploaded_image.url)
+                    product.article = slugify(f"{store_slug}-{product.id}")[:64]
+                Product.objects.bulk_update(products, ['image', 'article'])
+                for product in products:
+                    jobs.enqueue_image_processing(product, 'uploaded_image')
+                # bulk_create/bulk_update не шлют post_save — кэш, поиск, подсказки и фасеты обновляем сами
+                bulk_import.after_bulk_write(
+                    [product.id for product in products],
+                    groups=(*signals.MODEL_GROUPS[Product], *signals.MODEL_GROUPS[ShowcaseItem]),
+                )
+        except BaseException:
+            # Откат после serializer.save(): файлы альбома уже в media (при откате внутри save() их удалил он сам)
+            if serializer.instance is not None:
+                delete_uploaded_images(serializer.instance)
+            raise
+        return Response({'ids': [product.id for product in products], 'count': len(products)}, status=201)
 
 
 class BotAuthView(APIView):
@@ -471,37 +666,56 @@ class BotAuthView(APIView):
         if not telegram_id:
             return Response({'detail': 'telegram_id is required'}, status=400)
 
-        manager = StoreManager.objects.filter(telegram_id=telegram_id, is_active=True).first()
+        manager = (
+            StoreManager.objects.filter(telegram_id=telegram_id, is_active=True)
+            .prefetch_related('stores').first()
+        )
         if not manager:
-            return Response({'detail': 'Unauthorized'}, status=403)
+            return Response({'detail': 'Unauthorized', 'managers_version': StoreManager.version()}, status=403)
         data = StoreManagerSerializer(manager).data
+        data['managers_version'] = StoreManager.version()
         return Response(data, status=200)
 
 
+class BotManagersVersionView(APIView):
+    """Версия данных менеджеров: бот опрашивает её и сбрасывает свой кэш профилей при смене."""
+    permission_classes = [BotTokenPermission]
+
+    def get(self, request):
+        return Response({'managers_version': StoreManager.version()})
+
+
 class DiscountViewSet(viewsets.ModelViewSet):
     queryset = Discount.objects.all()
     serializer_class = DiscountSerializer
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(OffsetPaginationOptInMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = StableCursorPagination
+    # У заказа нет даты создания — курсор по UUID (стабильный, но не хронологический)
+    pagination_ordering = ('id',)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(OffsetPaginationOptInMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = StableCursorPagination
+    pagination_ordering = ('sort_order', 'id')
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(OffsetPaginationOptInMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = StableCursorPagination
+    pagination_ordering = ('sort_order', '-id')
 
     def get_queryset(self):
         queryset = Review.objects.all()
@@ -575,26 +789,6 @@ def _save_cart(request, cart):
     request.session.modified = True
 
 
-def _normalize_public_url(raw_url, request=None):
-    if not raw_url:
-        return ""
-    if raw_url.startswith("/"):
-        return raw_url
-    parsed = urlsplit(raw_url)
-    if parsed.scheme and parsed.netloc and parsed.path:
-        # Берём только путь — работает на любом домене/порту
-        return parsed.path
-    return raw_url
-
-
-def _product_image_url(product, request):
-    if product.uploaded_image:
-        return product.uploaded_image.url
-    if product.image:
-        return _normalize_public_url(product.image, request)
-    return "/static/hero/today-desktop.svg"
-
-
 def cart_page(request):
     """Страница корзины."""
     cart = _get_cart(request)
@@ -617,7 +811,7 @@ def cart_page(request):
             'id': product.id,
             'title': product.title,
             'price': price,
-            'image_url': _product_image_url(product, request),
+            'image_url': _product_image_url(product),
             'qty': qty,
             'line_total': line_total,
         })
@@ -688,7 +882,7 @@ def cart_drawer(request):
             'id': product.id,
             'title': product.title,
             'price': float(product.price) if product.price is not None else None,
-            'image_url': _product_image_url(product, request),
+            'image_url': _product_image_url(product),
             'qty': qty,
         })
 
@@ -760,14 +954,6 @@ def dashboard_login(request):
     return render(request, 'shop/dashboard/login.html', {'error': error})
 
 
-def _dash_product_image(product, request):
-    if product.uploaded_image:
-        return product.uploaded_image.url
-    if product.image:
-        return _normalize_public_url(product.image, request)
-    return "/static/hero/today-desktop.svg"
-
-
 def _get_manager_stores(user):
     """Возвращает queryset магазинов для пользователя.
     Superuser/staff — все магазины (None = без ограничений).
@@ -799,7 +985,7 @@ def dashboard_products(request):
             'category_name': p.category.name if p.category else '',
             'is_published': p.is_published,
             'is_online_showcase': p.is_online_showcase,
-            'image_url': _dash_product_image(p, request),
+            'image_url': _product_image_url(p),
         })
     return render(request, 'shop/dashboard/products.html', {'products': products, 'active': 'products'})
 
@@ -867,6 +1053,8 @@ def dashboard_product_form(request, product_id=None):
             if request.FILES.get('uploaded_image'):
                 product.uploaded_image = request.FILES['uploaded_image']
             product.save()
+            if request.FILES.get('uploaded_image'):
+                jobs.enqueue_image_processing(product, 'uploaded_image')
             store_ids = [int(x) for x in request.POST.getlist('stores') if x]
             product.stores.set(Store.objects.filter(id__in=store_ids))
             messages.success(request, 'Товар сохранён')
@@ -880,6 +1068,8 @@ def dashboard_product_form(request, product_id=None):
             if request.FILES.get('uploaded_image'):
                 product.uploaded_image = request.FILES['uploaded_image']
             product.save()
+            if request.FILES.get('uploaded_image'):
+                jobs.enqueue_image_processing(product, 'uploaded_image')
             store_ids = [int(x) for x in request.POST.getlist('stores') if x]
             product.stores.set(Store.objects.filter(id__in=store_ids))
             messages.success(request, 'Товар добавлен')
@@ -967,7 +1157,7 @@ def dashboard_showcase(request):
             'title': p.title,
             'price': p.price,
             'showcase_sort_order': item.sort_order,
-            'image_url': _dash_product_image(p, request),
+            'image_url': _product_image_url(p),
             'is_online_showcase': True,
             'store_name': item.store.name,
             'showcase_item_id': item.id,
@@ -985,7 +1175,7 @@ def dashboard_showcase(request):
             'id': p.id,
             'title': p.title,
             'price': p.price,
-            'image_url': _dash_product_image(p, request),
+            'image_url': _product_image_url(p),
             'is_online_showcase': p.id in showcase_product_ids,
         })
 
@@ -1206,6 +1396,8 @@ def dash_api_showcase_order(request):
                 ).update(sort_order=item.get('sort', 0))
             else:
                 Product.objects.filter(id=item['id']).update(showcase_sort_order=item.get('sort', 0))
+    # update() не шлёт post_save — порядок витрины на главной сбрасываем сами
+    page_cache.invalidate_on_commit(*signals.MODEL_GROUPS[ShowcaseItem])
     return JsonResponse({'ok': True})
 
 
@@ -1262,6 +1454,7 @@ def dash_api_banner_create(request):
         except Exception:
             pass
     banner.save()
+    jobs.enqueue_image_processing(banner, *(f for f in ('desktop_image', 'mobile_image') if request.FILES.get(f)))
     return JsonResponse({'ok': True, 'id': banner.id})
 
 
@@ -1318,6 +1511,7 @@ def dash_api_banner_save(request, banner_id):
         except Exception:
             pass
     banner.save()
+    jobs.enqueue_image_processing(banner, *(f for f in ('desktop_image', 'mobile_image') if request.FILES.get(f)))
     return JsonResponse({'ok': True})
 
 
@@ -1,34 +1,145 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
-from io import BytesIO
-from typing import Any
+import os
+import tempfile
+from typing import IO, Any, AsyncIterator, Callable
 
 import aiohttp
 from aiogram import Bot
 
 log = logging.getLogger(__name__)
 
+# Ответы, после которых запрос можно безопасно повторить (бэкенд перезапускается/перегружен)
+RETRY_STATUSES = frozenset({502, 503, 504})
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 8.0
+
+
+class ApiUnavailable(Exception):
+    """Бэкенд не ответил (сеть, таймаут) даже после повторов."""
+
 
 class ApiClient:
-    def __init__(self, base_url: str, bot_secret: str):
+    """Клиент Django API. Держит одну сессию aiohttp с пулом keep-alive соединений:
+    открывается в start() при запуске бота и закрывается в close()."""
+
+    def __init__(
+        self,
+        base_url: str,
+        bot_secret: str,
+        *,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        retries: int = 3,
+        pool_limit: int = 20,
+        upload_concurrency: int = 4,
+        max_photo_bytes: int = 10 * 1024 * 1024,
+    ):
         self.base_url = base_url.rstrip("/")
         self.bot_secret = bot_secret
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.retries = max(1, retries)
+        self.pool_limit = pool_limit
+        self.max_photo_bytes = max_photo_bytes
+        self._upload_slots = asyncio.Semaphore(max(1, upload_concurrency))
+        self._session: aiohttp.ClientSession | None = None
 
     @property
     def _headers(self) -> dict[str, str]:
         return {"X-Bot-Token": self.bot_secret}
 
-    async def auth_manager(self, telegram_id: int) -> dict[str, Any] | None:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/api/v1/auth/bot-token/",
+    async def start(self) -> None:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_limit,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
                 headers=self._headers,
-                json={"telegram_id": telegram_id},
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                return None
+                raise_for_status=False,
+            )
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        *,
+        idempotent: bool = True,
+        data_factory: Callable[[], Any] | None = None,
+        **kwargs: Any,
+    ) -> tuple[int, str]:
+        """Запрос с повторами при сетевых ошибках и 502/503/504.
+
+        Неидемпотентные запросы (создание товара) повторяются только если соединение
+        не установилось или бэкенд ответил 503 — иначе можно создать дубль.
+        data_factory пересоздаёт тело (FormData нельзя отправить дважды).
+        """
+        session = await self._get_session()
+        url = f"{self.base_url}{path}"
+        delay = RETRY_BACKOFF
+        for attempt in range(1, self.retries + 1):
+            if data_factory is not None:
+                kwargs["data"] = data_factory()
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    text = await response.text()
+                    retryable = response.status == 503 or (idempotent and response.status in RETRY_STATUSES)
+                    if not retryable or attempt == self.retries:
+                        return response.status, text
+                    log.warning("Django API %s %s -> %s, retry %s", method, path, response.status, attempt)
+            except aiohttp.ClientConnectorError as exc:
+                if attempt == self.retries:
+                    raise
+                log.warning("Django API %s %s: %s, retry %s", method, path, exc, attempt)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                if not idempotent or attempt == self.retries:
+                    raise
+                log.warning("Django API %s %s: %r, retry %s", method, path, exc, attempt)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_BACKOFF_MAX)
+        raise AssertionError("unreachable")
+
+    async def auth_manager(self, telegram_id: int) -> dict[str, Any] | None:
+        """Профиль менеджера (с managers_version) или None, если доступа нет.
+        ApiUnavailable — если бэкенд не ответил: это не отказ в доступе."""
+        try:
+            status, text = await self._request(
+                "POST", "/api/v1/auth/bot-token/", json={"telegram_id": telegram_id},
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            log.error("Django API unavailable: %r", exc)
+            raise ApiUnavailable(str(exc)) from exc
+        if status == 200:
+            return json.loads(text)
+        if status in (401, 403):
+            return None
+        raise ApiUnavailable(f"auth: HTTP {status}")
+
+    async def managers_version(self) -> str:
+        try:
+            status, text = await self._request("GET", "/api/v1/auth/managers-version/")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            raise ApiUnavailable(str(exc)) from exc
+        if status != 200:
+            raise ApiUnavailable(f"managers-version: HTTP {status}")
+        return json.loads(text)["managers_version"]
 
     async def create_product(
         self,
@@ -39,26 +150,162 @@ class ApiClient:
         price: str,
         title: str,
     ) -> tuple[bool, str]:
-        file_meta = await bot.get_file(photo_file_id)
-        file_bytes = BytesIO()
-        await bot.download_file(file_meta.file_path, destination=file_bytes)
-        file_bytes.seek(0)
-
-        form = aiohttp.FormData()
-        form.add_field("telegram_id", str(telegram_id))
-        form.add_field("store_id", str(store_id))
-        form.add_field("price", price)
-        form.add_field("title", title)
-        form.add_field("uploaded_image", file_bytes, filename="bouquet.jpg", content_type="image/jpeg")
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/api/v1/products/from-bot/",
-                data=form,
-                headers=self._headers,
-            ) as response:
-                if response.status in (200, 201):
-                    return True, "ok"
-                text = await response.text()
-                log.error("Django API error %s: %s", response.status, text[:500])
-                return False, text
+        return await self._post_photos(
+            bot,
+            "/api/v1/products/from-bot/",
+            "uploaded_image",
+            [photo_file_id],
+            {"telegram_id": str(telegram_id), "store_id": str(store_id), "price": price, "title": title},
+        )
+
+    async def create_products_bulk(
+        self,
+        bot: Bot,
+        telegram_id: int,
+        store_id: int,
+        photo_file_ids: list[str],
+        price: str,
+        title: str,
+    ) -> tuple[bool, str]:
+        """Альбом: товар на каждое фото, одним запросом."""
+        return await self._post_photos(
+            bot,
+            "/api/v1/products/from-bot/bulk/",
+            "uploaded_images",
+            photo_file_ids,
+            {"telegram_id": str(telegram_id), "store_id": str(store_id), "price": price, "title": title},
+        )
+
+    async def _post_photos(
+        self,
+        bot: Bot,
+        path: str,
+        file_field: str,
+        photo_file_ids: list[str],
+        fields: dict[str, str],
+    ) -> tuple[bool, str]:
+        files = await asyncio.gather(*(bot.get_file(file_id) for file_id in photo_file_ids))
+        if any(meta.file_size and meta.file_size > self.max_photo_bytes for meta in files):
+            return False, self._too_large_message
+        photos = [
+            _TelegramPhoto(bot, meta.file_path, meta.file_size, self.max_photo_bytes, self.timeout)
+            for meta in files
+        ]
+
+        def build_form() -> aiohttp.FormData:
+            form = aiohttp.FormData()
+            for name, value in fields.items():
+                form.add_field(name, value)
+            for index, photo in enumerate(photos, start=1):
+                form.add_field(file_field, photo.payload(), filename=f"bouquet-{index}.jpg", content_type="image/jpeg")
+            return form
+
+        # Фото идут из Telegram в Django потоком; одновременно — не больше upload_concurrency запросов
+        async with self._upload_slots:
+            try:
+                for photo in photos:
+                    if photo.size is None:
+                        await photo.spool()
+                status, text = await self._request("POST", path, idempotent=False, data_factory=build_form)
+            except PhotoTooLarge:
+                return False, self._too_large_message
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                if any(photo.too_large for photo in photos):
+                    return False, self._too_large_message
+                log.error("Django API unavailable: %r", exc)
+                return False, "сервер недоступен, попробуйте позже"
+            finally:
+                for photo in photos:
+                    photo.close()
+        if status in (200, 201):
+            return True, "ok"
+        log.error("Django API error %s: %s", status, text[:500])
+        return False, text
+
+    @property
+    def _too_large_message(self) -> str:
+        return f"фото больше {round(self.max_photo_bytes / (1024 * 1024), 1):g} МБ"
+
+
+class PhotoTooLarge(Exception):
+    pass
+
+
+class _StreamPayload(aiohttp.payload.AsyncIterablePayload):
+    """Потоковое тело известного размера: multipart получает Content-Length
+    (Django не читает chunked-запросы)."""
+
+    def __init__(self, value: AsyncIterator[bytes], size: int, **kwargs: Any):
+        super().__init__(value, **kwargs)
+        self._size = size
+
+
+class _TelegramPhoto:
+    """Фото из Telegram для отправки в Django без буферизации в памяти.
+
+    Обычно Telegram сообщает file_size — тогда файл идёт потоком прямо из ответа
+    Telegram в запрос к Django (при повторе скачивается заново). Если размера нет,
+    файл сначала сбрасывается во временный файл на диске (spool)."""
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, bot: Bot, file_path: str, size: int | None, max_bytes: int, timeout: aiohttp.ClientTimeout):
+        self.bot = bot
+        self.file_path = file_path
+        self.size = size
+        self.max_bytes = max_bytes
+        self.timeout = int(timeout.total or 30)
+        self.too_large = False
+        self._spooled: IO[bytes] | None = None
+
+    async def _chunks(self) -> AsyncIterator[bytes]:
+        api = self.bot.session.api
+        if api.is_local:
+            with open(api.wrap_local_file.to_local(self.file_path), "rb") as fh:
+                while chunk := await asyncio.to_thread(fh.read, self.CHUNK_SIZE):
+                    yield chunk
+            return
+        stream = self.bot.session.stream_content(
+            url=api.file_url(self.bot.token, self.file_path),
+            timeout=self.timeout,
+            chunk_size=self.CHUNK_SIZE,
+        )
+        async for chunk in stream:
+            yield chunk
+
+    async def _guarded_chunks(self, limit: int, exact: bool = False) -> AsyncIterator[bytes]:
+        received = 0
+        async for chunk in self._chunks():
+            received += len(chunk)
+            if received > limit:
+                self.too_large = received > self.max_bytes
+                raise PhotoTooLarge(f"{self.file_path}: more than {limit} bytes")
+            yield chunk
+        if exact and received != limit:
+            # Иначе Django ждал бы недостающие байты до таймаута
+            raise OSError(f"{self.file_path}: got {received} bytes, expected {limit}")
+
+    async def spool(self) -> None:
+        spooled = tempfile.TemporaryFile()
+        try:
+            async for chunk in self._guarded_chunks(self.max_bytes):
+                await asyncio.to_thread(spooled.write, chunk)
+        except BaseException:
+            spooled.close()
+            raise
+        self.size = spooled.tell()
+        self._spooled = spooled
+
+    def payload(self) -> aiohttp.payload.Payload:
+        if self._spooled is not None:
+            self._spooled.seek(0)
+            # Дубликат дескриптора: aiohttp закрывает файл после отправки, а форма может уйти повторно
+            return aiohttp.payload.BufferedReaderPayload(
+                os.fdopen(os.dup(self._spooled.fileno()), "rb"), content_type="image/jpeg",
+            )
+        return _StreamPayload(self._guarded_chunks(self.size, exact=True), self.size, content_type="image/jpeg")
+
+    def close(self) -> None:
+        if self._spooled is not None:
+            self._spooled.close()
+            self._spooled = None
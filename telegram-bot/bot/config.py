@@ -9,6 +9,24 @@ class Settings:
     bot_token: str
     django_api_url: str
     bot_secret: str
+    api_timeout: float = 30.0
+    api_retries: int = 3
+    api_pool_limit: int = 20
+    upload_concurrency: int = 4
+    max_photo_mb: int = 10
+    manager_cache_ttl: float = 300.0
+    managers_version_poll: float = 15.0
+    # sqlite — состояние форм переживает перезапуск; memory — как раньше
+    fsm_storage: str = "sqlite"
+    fsm_db_path: str = "fsm.sqlite3"
+    fsm_flush_interval: float = 0.5
+    # polling (по умолчанию, для локальной разработки) или webhook
+    bot_mode: str = "polling"
+    webhook_base_url: str = ""
+    webhook_path: str = "/telegram/webhook"
+    webhook_secret: str = ""
+    webhook_host: str = "127.0.0.1"
+    webhook_port: int = 3003
 
 
 def get_settings() -> Settings:
@@ -17,4 +35,20 @@ def get_settings() -> Settings:
         bot_token=os.getenv("BOT_TOKEN", "").strip(),
         django_api_url=os.getenv("DJANGO_API_URL", "http://127.0.0.1:3002").rstrip("/"),
         bot_secret=os.getenv("BOT_SECRET", "").strip(),
+        api_timeout=float(os.getenv("API_TIMEOUT", "30")),
+        api_retries=int(os.getenv("API_RETRIES", "3")),
+        api_pool_limit=int(os.getenv("API_POOL_LIMIT", "20")),
+        upload_concurrency=int(os.getenv("UPLOAD_CONCURRENCY", "4")),
+        max_photo_mb=int(os.getenv("MAX_PHOTO_MB", "10")),
+        manager_cache_ttl=float(os.getenv("MANAGER_CACHE_TTL", "300")),
+        managers_version_poll=float(os.getenv("MANAGERS_VERSION_POLL", "15")),
+        fsm_storage=os.getenv("FSM_STORAGE", "sqlite").strip().lower(),
+        fsm_db_path=os.getenv("FSM_DB_PATH", "fsm.sqlite3").strip(),
+        fsm_flush_interval=float(os.getenv("FSM_FLUSH_INTERVAL", "0.5")),
+        bot_mode=os.getenv("BOT_MODE", "polling").strip().lower(),
+        webhook_base_url=os.getenv("WEBHOOK_BASE_URL", "").strip().rstrip("/"),
+        webhook_path="/" + os.getenv("WEBHOOK_PATH", "/telegram/webhook").strip().strip("/"),
+        webhook_secret=os.getenv("WEBHOOK_SECRET", "").strip(),
+        webhook_host=os.getenv("WEBHOOK_HOST", "127.0.0.1").strip(),
+        webhook_port=int(os.getenv("WEBHOOK_PORT", "3003")),
     )
@@ -6,16 +6,30 @@ from decimal import Decimal, InvalidOperation
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
 from aiogram.types import BotCommand, CallbackQuery, Message
 
 from .api_client import ApiClient
 from .config import get_settings
 from .keyboards import confirm_keyboard, main_keyboard, stores_keyboard
+from .manager_cache import ManagerCache
 from .states import ProductForm
+from .storage import SQLiteStorage
+from .webhook import run_webhook
 
 router = Router()
 settings = get_settings()
-api_client = ApiClient(settings.django_api_url, settings.bot_secret)
+api_client = ApiClient(
+    settings.django_api_url,
+    settings.bot_secret,
+    timeout=settings.api_timeout,
+    retries=settings.api_retries,
+    pool_limit=settings.api_pool_limit,
+    upload_concurrency=settings.upload_concurrency,
+    max_photo_bytes=settings.max_photo_mb * 1024 * 1024,
+)
+manager_cache = ManagerCache(api_client, ttl=settings.manager_cache_ttl)
 
 
 def parse_price(raw: str) -> str | None:
@@ -30,7 +44,7 @@ def parse_price(raw: str) -> str | None:
 
 @router.message(Command("start"))
 async def start_handler(message: Message):
-    manager = await api_client.auth_manager(message.from_user.id)
+    manager = await manager_cache.get(message.from_user.id)
     if not manager:
         await message.answer("Нет доступа. Обратитесь к администратору.")
         return
@@ -52,7 +66,7 @@ async def btn_add_handler(message: Message, state: FSMContext):
 
 @router.message(Command("add"))
 async def add_handler(message: Message, state: FSMContext):
-    manager = await api_client.auth_manager(message.from_user.id)
+    manager = await manager_cache.get(message.from_user.id)
     if not manager:
         await message.answer("Нет доступа.")
         return
@@ -80,16 +94,60 @@ async def choose_store_handler(callback: CallbackQuery, state: FSMContext):
 
     await state.update_data(store_id=selected["id"], store_name=selected["name"])
     await state.set_state(ProductForm.waiting_photo)
-    await callback.message.answer(f"Магазин: {selected['name']}\nОтправьте фото букета.")
+    await callback.message.answer(
+        f"Магазин: {selected['name']}\nОтправьте фото букета (или альбом — по букету на каждое фото)."
+    )
     await callback.answer()
 
 
+# Альбом приходит отдельными сообщениями с общим media_group_id: собираем их,
+# пока новые фото перестанут приходить ALBUM_DEBOUNCE секунд
+ALBUM_DEBOUNCE = 1.0
+_albums: dict[tuple[int, str], dict] = {}
+
+
 @router.message(ProductForm.waiting_photo, F.photo)
 async def photo_handler(message: Message, state: FSMContext):
     photo = message.photo[-1]
-    await state.update_data(photo_file_id=photo.file_id)
+    if message.media_group_id is None:
+        await state.update_data(photo_file_ids=[photo.file_id])
+        await state.set_state(ProductForm.waiting_price)
+        await message.answer("Введите цену (например 45.50)")
+        return
+
+    key = (message.chat.id, message.media_group_id)
+    album = _albums.get(key)
+    loop = asyncio.get_running_loop()
+    if album is None:
+        album = _albums[key] = {"photos": [], "last_seen": 0.0}
+        # Ссылка на задачу хранится в album, чтобы её не собрал GC
+        album["task"] = asyncio.create_task(_finish_album(key, message, state))
+    album["photos"].append((message.message_id, photo.file_id))
+    album["last_seen"] = loop.time()
+
+
+async def _finish_album(key: tuple[int, str], message: Message, state: FSMContext):
+    loop = asyncio.get_running_loop()
+    album = _albums[key]
+    while (wait := album["last_seen"] + ALBUM_DEBOUNCE - loop.time()) > 0:
+        await asyncio.sleep(wait)
+    del _albums[key]
+    file_ids = [file_id for _, file_id in sorted(album["photos"])]
+    await state.update_data(photo_file_ids=file_ids)
     await state.set_state(ProductForm.waiting_price)
-    await message.answer("Введите цену (например 45.50)")
+    await message.answer(
+        f"Получено фото: {len(file_ids)} — будет создано {len(file_ids)} букетов.\n"
+        "Введите цену для всех (например 45.50)"
+    )
+
+
+def _summary(data: dict, title: str) -> str:
+    photos = len(data.get("photo_file_ids", []))
+    photos_line = f"\nФото: {photos} (отдельные букеты)" if photos > 1 else ""
+    return (
+        f"Проверьте данные:\nМагазин: {data['store_name']}\nЦена: {data['price']} BYN\n"
+        f"Название: {title}{photos_line}"
+    )
 
 
 @router.message(ProductForm.waiting_price, F.text)
@@ -108,10 +166,7 @@ async def skip_title_handler(message: Message, state: FSMContext):
     await state.update_data(title="Букет")
     await state.set_state(ProductForm.confirmation)
     data = await state.get_data()
-    await message.answer(
-        f"Проверьте данные:\nМагазин: {data['store_name']}\nЦена: {data['price']} BYN\nНазвание: Букет",
-        reply_markup=confirm_keyboard(),
-    )
+    await message.answer(_summary(data, "Букет"), reply_markup=confirm_keyboard())
 
 
 @router.message(ProductForm.waiting_title, F.text)
@@ -120,10 +175,7 @@ async def title_handler(message: Message, state: FSMContext):
     await state.update_data(title=title)
     await state.set_state(ProductForm.confirmation)
     data = await state.get_data()
-    await message.answer(
-        f"Проверьте данные:\nМагазин: {data['store_name']}\nЦена: {data['price']} BYN\nНазвание: {title}",
-        reply_markup=confirm_keyboard(),
-    )
+    await message.answer(_summary(data, title), reply_markup=confirm_keyboard())
 
 
 @router.callback_query(ProductForm.confirmation, F.data == "cancel")
@@ -136,18 +188,32 @@ async def cancel_handler(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(ProductForm.confirmation, F.data == "publish")
 async def publish_handler(callback: CallbackQuery, state: FSMContext, bot: Bot):
     data = await state.get_data()
-    ok, error = await api_client.create_product(
-        bot=bot,
-        telegram_id=callback.from_user.id,
-        store_id=data["store_id"],
-        photo_file_id=data["photo_file_id"],
-        price=data["price"],
-        title=data.get("title", "Букет"),
-    )
+    photo_file_ids = data["photo_file_ids"]
+    if len(photo_file_ids) > 1:
+        ok, error = await api_client.create_products_bulk(
+            bot=bot,
+            telegram_id=callback.from_user.id,
+            store_id=data["store_id"],
+            photo_file_ids=photo_file_ids,
+            price=data["price"],
+            title=data.get("title", "Букет"),
+        )
+    else:
+        ok, error = await api_client.create_product(
+            bot=bot,
+            telegram_id=callback.from_user.id,
+            store_id=data["store_id"],
+            photo_file_id=photo_file_ids[0],
+            price=data["price"],
+            title=data.get("title", "Букет"),
+        )
     await state.clear()
     if ok:
-        await callback.message.answer("Опубликовано в онлайн витрине.")
+        published = f" ({len(photo_file_ids)} букетов)" if len(photo_file_ids) > 1 else ""
+        await callback.message.answer(f"Опубликовано в онлайн витрине{published}.")
     else:
+        # Бэкенд мог отказать из-за изменившихся прав — следующий шаг перечитает профиль
+        manager_cache.invalidate(callback.from_user.id)
         short_error = error[:200] if error else "неизвестная ошибка"
         await callback.message.answer(f"Ошибка публикации: {short_error}")
     await callback.answer()
@@ -159,6 +225,12 @@ async def cancel_command_handler(message: Message, state: FSMContext):
     await message.answer("Действие отменено.")
 
 
+def build_storage() -> BaseStorage:
+    if settings.fsm_storage == "memory":
+        return MemoryStorage()
+    return SQLiteStorage(settings.fsm_db_path, flush_interval=settings.fsm_flush_interval)
+
+
 async def main():
     if not settings.bot_token or not settings.bot_secret:
         raise RuntimeError("BOT_TOKEN и BOT_SECRET обязательны.")
@@ -168,9 +240,23 @@ async def main():
         BotCommand(command="add", description="Добавить букет в витрину"),
         BotCommand(command="cancel", description="Отменить действие"),
     ])
-    dp = Dispatcher()
+    storage = build_storage()
+    # Апдейты одного пользователя — по очереди (webhook обрабатывает апдейты параллельно)
+    dp = Dispatcher(storage=storage, events_isolation=SimpleEventIsolation())
     dp.include_router(router)
-    await dp.start_polling(bot)
+    await api_client.start()
+    version_watcher = asyncio.create_task(manager_cache.watch(settings.managers_version_poll))
+    try:
+        if settings.bot_mode == "webhook":
+            await run_webhook(bot, dp, settings)
+        else:
+            # Оставшийся после webhook-режима вебхук блокирует getUpdates
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        version_watcher.cancel()
+        await storage.close()
+        await api_client.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+from .api_client import ApiClient, ApiUnavailable
+
+log = logging.getLogger(__name__)
+
+# Пауза watch() после ошибки растёт вдвое, но не больше этого (секунд)
+WATCH_BACKOFF_MAX = 300.0
+
+
+class ManagerCache:
+    """TTL-кэш профилей менеджеров (с их магазинами) по telegram id.
+
+    Бэкенд отдаёт managers_version — она меняется при любом изменении менеджеров
+    или их магазинов. watch() периодически сверяет версию и сбрасывает весь кэш,
+    поэтому отключённый менеджер теряет доступ через несколько секунд, а не через TTL.
+
+    Записей не больше max_entries: при переполнении сначала выбрасываются истёкшие,
+    затем самые старые. Запрос профиля на пользователя — один на всех ждущих
+    и живёт только пока выполняется.
+    """
+
+    def __init__(self, api_client: ApiClient, ttl: float = 300.0, max_entries: int = 1000):
+        self.api_client = api_client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version: str | None = None
+        self._entries: dict[int, tuple[float, dict[str, Any] | None]] = {}
+        self._inflight: dict[int, asyncio.Future] = {}
+
+    def invalidate(self, telegram_id: int | None = None) -> None:
+        if telegram_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(telegram_id, None)
+
+    def _apply_version(self, version: str | None) -> None:
+        if version is None or version == self.version:
+            return
+        if self.version is not None:
+            log.info("managers_version %s -> %s, cache cleared", self.version, version)
+            self._entries.clear()
+        self.version = version
+
+    def _store(self, telegram_id: int, profile: dict[str, Any] | None) -> None:
+        # Перевставка — запись становится самой новой в порядке словаря
+        self._entries.pop(telegram_id, None)
+        self._entries[telegram_id] = (time.monotonic() + self.ttl, profile)
+        if len(self._entries) <= self.max_entries:
+            return
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    async def get(self, telegram_id: int) -> dict[str, Any] | None:
+        """Профиль менеджера или None, если доступа нет."""
+        entry = self._entries.get(telegram_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        # Один запрос к бэкенду на пользователя, даже если он жмёт кнопки подряд
+        request = self._inflight.get(telegram_id)
+        if request is None:
+            request = asyncio.ensure_future(self._fetch(telegram_id))
+            self._inflight[telegram_id] = request
+            request.add_done_callback(lambda _: self._inflight.pop(telegram_id, None))
+        # shield: отмена одного ждущего не отменяет запрос для остальных
+        return await asyncio.shield(request)
+
+    async def _fetch(self, telegram_id: int) -> dict[str, Any] | None:
+        try:
+            profile = await self.api_client.auth_manager(telegram_id)
+        except ApiUnavailable:
+            # Бэкенд недоступен: лучше устаревший профиль, чем отказ
+            entry = self._entries.get(telegram_id)
+            return entry[1] if entry is not None else None
+        if profile is not None:
+            self._apply_version(profile.get("managers_version"))
+        self._store(telegram_id, profile)
+        return profile
+
+    async def watch(self, interval: float) -> None:
+        """Фоновая задача: сверять managers_version каждые interval секунд.
+        Ошибки не останавливают задачу: после них пауза растёт до WATCH_BACKOFF_MAX."""
+        delay = interval
+        while True:
+            try:
+                self._apply_version(await self.api_client.managers_version())
+            except ApiUnavailable as exc:
+                log.warning("managers_version check failed: %s", exc)
+                delay = min(delay * 2, max(interval, WATCH_BACKOFF_MAX))
+            except Exception:
+                log.exception("managers_version check failed")
+                delay = min(delay * 2, max(interval, WATCH_BACKOFF_MAX))
+            else:
+                delay = interval
+            await asyncio.sleep(delay)
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в SQLite: незаконченные формы менеджеров переживают перезапуск бота.
+
+    Чтения идут из памяти (с диска ключ читается один раз за жизнь процесса),
+    записи помечают ключ «грязным» и раз в flush_interval секунд сбрасываются
+    на диск одной транзакцией. Вся работа с sqlite3 — в одном отдельном потоке,
+    event loop не блокируется.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        flush_interval: float = 0.5,
+        ttl_days: float = 14,
+        key_builder: KeyBuilder | None = None,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.ttl_days = ttl_days
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self._conn: sqlite3.Connection | None = None
+        self._ready = False
+        self._init_lock = asyncio.Lock()
+        # key -> (state, data); запись удаляется с диска, когда оба пустые
+        self._entries: dict[str, tuple[str | None, dict[str, Any]]] = {}
+        self._dirty: set[str] = set()
+        self._flusher: asyncio.Task | None = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self) -> None:
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        # Брошенные формы не копим вечно
+        conn.execute("DELETE FROM fsm WHERE updated_at < ?", (time.time() - self.ttl_days * 86400,))
+        conn.commit()
+        self._conn = conn
+
+    async def _ensure_ready(self) -> None:
+        if self._ready:
+            return
+        async with self._init_lock:
+            if not self._ready:
+                await self._run(self._open)
+                self._flusher = asyncio.create_task(self._flush_loop())
+                self._ready = True
+
+    def _load(self, key: str) -> tuple[str | None, dict[str, Any]]:
+        row = self._conn.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], json.loads(row[1])
+
+    async def _entry(self, key: StorageKey) -> tuple[str, tuple[str | None, dict[str, Any]]]:
+        await self._ensure_ready()
+        built = self.key_builder.build(key)
+        entry = self._entries.get(built, _MISSING)
+        if entry is _MISSING:
+            entry = await self._run(self._load, built)
+            # Пока читали с диска, ключ мог быть записан — не затираем свежее значение
+            entry = self._entries.setdefault(built, entry)
+        return built, entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        built, (_, data) = await self._entry(key)
+        value = state.state if isinstance(state, State) else state
+        self._entries[built] = (value, data)
+        self._dirty.add(built)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        _, (state, _) = await self._entry(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        built, (state, _) = await self._entry(key)
+        self._entries[built] = (state, dict(data))
+        self._dirty.add(built)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, (_, data) = await self._entry(key)
+        return dict(data)
+
+    def _write(self, rows: list[tuple[str, str | None, dict[str, Any]]]) -> None:
+        now = time.time()
+        with self._conn:
+            for key, state, data in rows:
+                if state is None and not data:
+                    self._conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+                else:
+                    self._conn.execute(
+                        "INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                        "updated_at = excluded.updated_at",
+                        (key, state, json.dumps(data, ensure_ascii=False), now),
+                    )
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        rows = [(key, *self._entries[key]) for key in keys]
+        try:
+            await self._run(self._write, rows)
+        except Exception:
+            self._dirty |= keys
+            raise
+        # Пустые записи из памяти тоже убираем
+        for key, state, data in rows:
+            if state is None and not data and key not in self._dirty:
+                self._entries.pop(key, None)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("FSM storage flush failed")
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._ready:
+            await self.flush()
+            await self._run(self._conn.close)
+            self._ready = False
+        self._executor.shutdown(wait=True)
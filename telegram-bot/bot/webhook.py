@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from .config import Settings
+
+log = logging.getLogger(__name__)
+
+# Telegram принимает secret_token только из этих символов
+SECRET_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+
+async def healthz(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True})
+
+
+def build_app(bot: Bot, dp: Dispatcher, settings: Settings) -> web.Application:
+    app = web.Application()
+    # Обработчик сразу отвечает Telegram 200 и обрабатывает апдейт фоновой задачей,
+    # поэтому апдейты разных менеджеров идут параллельно. Чужие запросы без
+    # X-Telegram-Bot-Api-Secret-Token получают 401.
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=settings.webhook_secret,
+    ).register(app, path=settings.webhook_path)
+    app.router.add_get("/healthz", healthz)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, settings: Settings) -> None:
+    if not settings.webhook_base_url.startswith("https://"):
+        raise RuntimeError("Для BOT_MODE=webhook нужен WEBHOOK_BASE_URL вида https://домен.")
+    if not SECRET_RE.fullmatch(settings.webhook_secret):
+        raise RuntimeError("Для BOT_MODE=webhook нужен WEBHOOK_SECRET (A-Z, a-z, 0-9, _ и -).")
+
+    runner = web.AppRunner(build_app(bot, dp, settings))
+    await runner.setup()
+    site = web.TCPSite(runner, settings.webhook_host, settings.webhook_port)
+    await site.start()
+    url = f"{settings.webhook_base_url}{settings.webhook_path}"
+    await bot.set_webhook(
+        url,
+        secret_token=settings.webhook_secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    log.info("Webhook %s, listening on %s:%s", url, settings.webhook_host, settings.webhook_port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        # Вебхук не снимаем: апдейты во время перезапуска подождут в Telegram
+        await runner.cleanup()
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bot import main
+from bot.states import ProductForm
+
+DEBOUNCE = 0.1
+
+
+def make_message(message_id, file_id, media_group_id="album-1", chat_id=1):
+    return SimpleNamespace(
+        message_id=message_id,
+        media_group_id=media_group_id,
+        chat=SimpleNamespace(id=chat_id),
+        photo=[SimpleNamespace(file_id=f"{file_id}-small"), SimpleNamespace(file_id=file_id)],
+        answer=mock.AsyncMock(),
+    )
+
+
+def make_state(chat_id=1):
+    return FSMContext(MemoryStorage(), StorageKey(bot_id=100, chat_id=chat_id, user_id=chat_id))
+
+
+class AlbumTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(main, "ALBUM_DEBOUNCE", DEBOUNCE)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(main._albums.clear)
+
+    async def wait_albums(self):
+        await asyncio.gather(*(album["task"] for album in list(main._albums.values())))
+
+    async def test_single_photo_skips_debounce(self):
+        state = make_state()
+        message = make_message(1, "p1", media_group_id=None)
+        await main.photo_handler(message, state)
+        self.assertEqual(main._albums, {})
+        self.assertEqual(await state.get_data(), {"photo_file_ids": ["p1"]})
+        self.assertEqual(await state.get_state(), ProductForm.waiting_price.state)
+
+    async def test_album_is_grouped_in_message_order(self):
+        state = make_state()
+        messages = [make_message(12, "p2"), make_message(11, "p1"), make_message(13, "p3")]
+        for message in messages:
+            await main.photo_handler(message, state)
+        self.assertEqual(len(main._albums), 1)
+        await self.wait_albums()
+
+        self.assertEqual(main._albums, {})
+        self.assertEqual(await state.get_data(), {"photo_file_ids": ["p1", "p2", "p3"]})
+        self.assertEqual(await state.get_state(), ProductForm.waiting_price.state)
+        # Ответ один на весь альбом — первому сообщению
+        messages[0].answer.assert_awaited_once()
+        self.assertIn("Получено фото: 3", messages[0].answer.await_args.args[0])
+        messages[1].answer.assert_not_awaited()
+        messages[2].answer.assert_not_awaited()
+
+    async def test_late_photo_extends_debounce(self):
+        state = make_state()
+        first = make_message(1, "p1")
+        await main.photo_handler(first, state)
+        # Каждое фото приходит раньше, чем истекает пауза, — альбом ждёт дальше
+        for message_id in (2, 3, 4):
+            await asyncio.sleep(DEBOUNCE / 2)
+            self.assertIsNone(await state.get_state())
+            await main.photo_handler(make_message(message_id, f"p{message_id}"), state)
+        await self.wait_albums()
+
+        self.assertEqual(await state.get_data(), {"photo_file_ids": ["p1", "p2", "p3", "p4"]})
+        first.answer.assert_awaited_once()
+
+    async def test_albums_are_separated_by_chat_and_group(self):
+        state_a, state_b = make_state(1), make_state(2)
+        await main.photo_handler(make_message(1, "a1", "g1", chat_id=1), state_a)
+        await main.photo_handler(make_message(1, "b1", "g1", chat_id=2), state_b)
+        await main.photo_handler(make_message(2, "a2", "g1", chat_id=1), state_a)
+        self.assertEqual(set(main._albums), {(1, "g1"), (2, "g1")})
+        await self.wait_albums()
+
+        self.assertEqual(await state_a.get_data(), {"photo_file_ids": ["a1", "a2"]})
+        self.assertEqual(await state_b.get_data(), {"photo_file_ids": ["b1"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+from types import SimpleNamespace
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from bot import api_client
+from bot.api_client import ApiClient
+
+PHOTOS = {
+    "f1": b"\xff\xd8" + b"1" * 200_000,
+    "f2": b"\xff\xd8" + b"2" * 1000,
+}
+
+
+class FakeBot:
+    """Bot с файлами из PHOTOS: get_file и потоковое скачивание, как в aiogram."""
+
+    token = "TOKEN"
+
+    def __init__(self, sizes=None):
+        self.sizes = sizes or {}
+        self.downloads = []
+        self.session = SimpleNamespace(
+            api=SimpleNamespace(is_local=False, file_url=lambda token, path: f"https://files/{path}"),
+            stream_content=self.stream_content,
+        )
+
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_path=file_id, file_size=self.sizes.get(file_id, len(PHOTOS[file_id])))
+
+    async def stream_content(self, url, timeout, chunk_size):
+        path = url.rsplit("/", 1)[1]
+        self.downloads.append(path)
+        content = PHOTOS[path]
+        for start in range(0, len(content), chunk_size):
+            yield content[start:start + chunk_size]
+
+
+class UploadTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.requests = []
+        self.statuses = []
+        app = web.Application(client_max_size=10 * 1024 * 1024)
+        app.router.add_post("/api/v1/products/from-bot/", self.handle)
+        app.router.add_post("/api/v1/products/from-bot/bulk/", self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.addAsyncCleanup(self.server.close)
+        self.client = ApiClient(str(self.server.make_url("")), "secret", retries=2, max_photo_bytes=300_000)
+        self.addAsyncCleanup(self.client.close)
+        self.addCleanup(setattr, api_client, "RETRY_BACKOFF", api_client.RETRY_BACKOFF)
+        api_client.RETRY_BACKOFF = 0
+
+    async def handle(self, request):
+        fields, files = {}, []
+        reader = await request.multipart()
+        while (part := await reader.next()) is not None:
+            if part.filename:
+                files.append((part.name, part.filename, part.headers["Content-Type"], await part.read()))
+            else:
+                fields[part.name] = await part.text()
+        self.requests.append({"headers": request.headers, "fields": fields, "files": files})
+        status = self.statuses.pop(0) if self.statuses else 201
+        return web.Response(status=status, text="{}")
+
+    def assert_form(self, request, file_field, file_ids):
+        self.assertEqual(request["headers"]["X-Bot-Token"], "secret")
+        # Django не читает chunked-запросы — длина тела должна быть известна заранее
+        self.assertIn("Content-Length", request["headers"])
+        self.assertNotIn("Transfer-Encoding", request["headers"])
+        self.assertEqual(
+            request["fields"],
+            {"telegram_id": "7", "store_id": "3", "price": "45.50", "title": "Пионы"},
+        )
+        self.assertEqual(
+            request["files"],
+            [
+                (file_field, f"bouquet-{index}.jpg", "image/jpeg", PHOTOS[file_id])
+                for index, file_id in enumerate(file_ids, start=1)
+            ],
+        )
+
+    async def test_single_photo_is_streamed(self):
+        bot = FakeBot()
+        result = await self.client.create_product(bot, 7, 3, "f1", "45.50", "Пионы")
+        self.assertEqual(result, (True, "ok"))
+        [request] = self.requests
+        self.assert_form(request, "uploaded_image", ["f1"])
+        self.assertEqual(bot.downloads, ["f1"])
+
+    async def test_album_is_one_request(self):
+        bot = FakeBot()
+        result = await self.client.create_products_bulk(bot, 7, 3, ["f1", "f2"], "45.50", "Пионы")
+        self.assertEqual(result, (True, "ok"))
+        [request] = self.requests
+        self.assert_form(request, "uploaded_images", ["f1", "f2"])
+
+    async def test_retry_rebuilds_streamed_body(self):
+        self.statuses = [503]
+        bot = FakeBot()
+        with self.assertLogs("bot.api_client", "WARNING"):
+            result = await self.client.create_product(bot, 7, 3, "f2", "45.50", "Пионы")
+        self.assertEqual(result, (True, "ok"))
+        self.assertEqual(len(self.requests), 2)
+        for request in self.requests:
+            self.assert_form(request, "uploaded_image", ["f2"])
+        # Потоковое фото при повторе скачивается из Telegram заново
+        self.assertEqual(bot.downloads, ["f2", "f2"])
+
+    async def test_unknown_size_is_spooled_once(self):
+        self.statuses = [503]
+        bot = FakeBot(sizes={"f1": None, "f2": None})
+        with self.assertLogs("bot.api_client", "WARNING"):
+            result = await self.client.create_products_bulk(bot, 7, 3, ["f1", "f2"], "45.50", "Пионы")
+        self.assertEqual(result, (True, "ok"))
+        self.assertEqual(len(self.requests), 2)
+        for request in self.requests:
+            self.assert_form(request, "uploaded_images", ["f1", "f2"])
+        self.assertEqual(bot.downloads, ["f1", "f2"])
+
+    async def test_too_large_photo_is_rejected_before_upload(self):
+        bot = FakeBot(sizes={"f1": 400_000})
+        ok, message = await self.client.create_product(bot, 7, 3, "f1", "45.50", "Пионы")
+        self.assertFalse(ok)
+        self.assertIn("МБ", message)
+        self.assertEqual(self.requests, [])
+        self.assertEqual(bot.downloads, [])
+
+    async def test_too_large_unknown_size_is_rejected_while_spooling(self):
+        self.client.max_photo_bytes = 100_000
+        bot = FakeBot(sizes={"f1": None})
+        ok, message = await self.client.create_product(bot, 7, 3, "f1", "45.50", "Пионы")
+        self.assertFalse(ok)
+        self.assertIn("МБ", message)
+        self.assertEqual(self.requests, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from bot import manager_cache
+from bot.api_client import ApiUnavailable
+from bot.manager_cache import ManagerCache
+
+
+class FakeApi:
+    def __init__(self):
+        self.calls = []
+        self.versions = []
+
+    async def auth_manager(self, telegram_id):
+        self.calls.append(telegram_id)
+        await asyncio.sleep(0)
+        return {"telegram_id": telegram_id, "managers_version": "v1"}
+
+    async def managers_version(self):
+        result = self.versions.pop(0)
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+
+class ManagerCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_gets_share_one_request(self):
+        api = FakeApi()
+        cache = ManagerCache(api)
+        profiles = await asyncio.gather(*(cache.get(42) for _ in range(5)))
+        self.assertEqual(api.calls, [42])
+        self.assertEqual({p["telegram_id"] for p in profiles}, {42})
+        self.assertEqual(cache._inflight, {})
+        await cache.get(42)
+        self.assertEqual(api.calls, [42])
+
+    async def test_entries_are_bounded(self):
+        api = FakeApi()
+        cache = ManagerCache(api, max_entries=3)
+        for telegram_id in range(1, 6):
+            await cache.get(telegram_id)
+        self.assertEqual(list(cache._entries), [3, 4, 5])
+
+        # Истёкшие уходят раньше свежих
+        cache._entries[5] = (0.0, None)
+        cache.invalidate(4)
+        await cache.get(6)
+        await cache.get(7)
+        self.assertEqual(list(cache._entries), [3, 6, 7])
+
+    async def test_stale_profile_is_served_while_backend_is_down(self):
+        api = FakeApi()
+        cache = ManagerCache(api, ttl=0)
+        profile = await cache.get(42)
+        with mock.patch.object(api, "auth_manager", side_effect=ApiUnavailable("down")):
+            self.assertEqual(await cache.get(42), profile)
+            self.assertIsNone(await cache.get(43))
+
+    async def test_version_change_clears_cache(self):
+        api = FakeApi()
+        cache = ManagerCache(api)
+        await cache.get(42)
+        cache._apply_version("v2")
+        self.assertEqual(cache._entries, {})
+
+    async def test_watch_survives_errors_with_backoff(self):
+        api = FakeApi()
+        api.versions = [ApiUnavailable("down"), ValueError("bad json"), "v2", asyncio.CancelledError()]
+        cache = ManagerCache(api)
+        cache.version = "v1"
+        cache._entries[42] = (float("inf"), {})
+        delays = []
+
+        async def fake_sleep(delay):
+            delays.append(delay)
+
+        with mock.patch.object(manager_cache.asyncio, "sleep", fake_sleep), \
+                self.assertLogs("bot.manager_cache", "WARNING") as logs:
+            with self.assertRaises(asyncio.CancelledError):
+                await cache.watch(10)
+        self.assertEqual(delays, [20, 40, 10])
+        self.assertEqual(cache.version, "v2")
+        self.assertEqual(cache._entries, {})
+        self.assertIn("bad json", "\n".join(logs.output))
+
+
+if __name__ == "__main__":
+    unittest.main()
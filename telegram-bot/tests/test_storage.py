@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from aiogram.fsm.storage.base import StorageKey
+
+from bot.states import ProductForm
+from bot.storage import SQLiteStorage
+
+
+def make_key(user_id=1):
+    return StorageKey(bot_id=100, chat_id=user_id, user_id=user_id)
+
+
+class SQLiteStorageTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "fsm.sqlite3")
+
+    def open_storage(self):
+        # Долгий интервал: на диск пишут только явные flush()/close()
+        storage = SQLiteStorage(self.path, flush_interval=3600)
+        self.addAsyncCleanup(storage.close)
+        return storage
+
+    def rows(self):
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute("SELECT key, state, data FROM fsm").fetchall()
+
+    async def test_round_trip_in_memory(self):
+        storage = self.open_storage()
+        key = make_key()
+        self.assertIsNone(await storage.get_state(key))
+        self.assertEqual(await storage.get_data(key), {})
+
+        await storage.set_state(key, ProductForm.waiting_price)
+        await storage.set_data(key, {"store_id": 5, "photo_file_ids": ["a", "b"]})
+        self.assertEqual(await storage.get_state(key), ProductForm.waiting_price.state)
+        self.assertEqual(await storage.get_data(key), {"store_id": 5, "photo_file_ids": ["a", "b"]})
+        self.assertIsNone(await storage.get_state(make_key(2)))
+
+    async def test_get_data_returns_copy(self):
+        storage = self.open_storage()
+        key = make_key()
+        await storage.set_data(key, {"price": "45.00"})
+        data = await storage.get_data(key)
+        data["price"] = "1.00"
+        self.assertEqual(await storage.get_data(key), {"price": "45.00"})
+
+    async def test_state_survives_reopen(self):
+        storage = self.open_storage()
+        key = make_key()
+        await storage.set_state(key, ProductForm.waiting_title)
+        await storage.set_data(key, {"store_name": "Пионы", "price": "45.00"})
+        await storage.close()
+
+        reopened = self.open_storage()
+        self.assertEqual(await reopened.get_state(key), ProductForm.waiting_title.state)
+        self.assertEqual(await reopened.get_data(key), {"store_name": "Пионы", "price": "45.00"})
+
+    async def test_writes_are_batched_until_flush(self):
+        storage = self.open_storage()
+        key = make_key()
+        await storage.set_state(key, ProductForm.waiting_photo)
+        await storage.set_data(key, {"store_id": 1})
+        self.assertEqual(self.rows(), [])
+
+        await storage.flush()
+        [(_, state, data)] = self.rows()
+        self.assertEqual(state, ProductForm.waiting_photo.state)
+        self.assertEqual(data, '{"store_id": 1}')
+
+    async def test_clear_removes_record(self):
+        storage = self.open_storage()
+        key = make_key()
+        other = make_key(2)
+        await storage.set_state(key, ProductForm.confirmation)
+        await storage.set_data(key, {"title": "Букет"})
+        await storage.set_state(other, ProductForm.waiting_photo)
+        await storage.flush()
+        self.assertEqual(len(self.rows()), 2)
+
+        # Так FSMContext.clear() завершает форму
+        await storage.set_state(key, None)
+        await storage.set_data(key, {})
+        await storage.flush()
+        self.assertEqual([state for _, state, _ in self.rows()], [ProductForm.waiting_photo.state])
+        self.assertIsNone(await storage.get_state(key))
+        self.assertEqual(await storage.get_data(key), {})
+        await storage.close()
+
+        reopened = self.open_storage()
+        self.assertIsNone(await reopened.get_state(key))
+        self.assertEqual(await reopened.get_state(other), ProductForm.waiting_photo.state)
+
+    async def test_expired_records_are_dropped_on_open(self):
+        storage = self.open_storage()
+        await storage.set_state(make_key(), ProductForm.waiting_price)
+        await storage.close()
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("UPDATE fsm SET updated_at = 0")
+
+        reopened = self.open_storage()
+        self.assertIsNone(await reopened.get_state(make_key()))
+        self.assertEqual(self.rows(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
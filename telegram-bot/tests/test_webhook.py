@@ -0,0 +1,123 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.config import Settings
+from bot.webhook import build_app, run_webhook
+
+SECRET = "s3cret_token-1"
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 10,
+        "date": 0,
+        "chat": {"id": 5, "type": "private"},
+        "from": {"id": 5, "is_bot": False, "first_name": "Анна"},
+        "text": "/add",
+    },
+}
+
+
+def make_settings(**overrides):
+    values = dict(
+        bot_token="42:TEST",
+        django_api_url="http://127.0.0.1:3002",
+        bot_secret="secret",
+        bot_mode="webhook",
+        webhook_base_url="https://bot.example.by",
+        webhook_path="/telegram/webhook",
+        webhook_secret=SECRET,
+        webhook_port=0,
+    )
+    values.update(overrides)
+    return Settings(**values)
+
+
+class WebhookTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.bot = Bot(token="42:TEST")
+        self.addAsyncCleanup(self.bot.session.close)
+        self.messages = []
+        self.received = asyncio.Event()
+        self.hooks = []
+
+        router = Router()
+
+        @router.message()
+        async def on_message(message: Message):
+            self.messages.append(message.text)
+            self.received.set()
+
+        self.dp = Dispatcher()
+        self.dp.include_router(router)
+        self.dp.startup.register(lambda: self.hooks.append("startup"))
+        self.dp.shutdown.register(lambda: self.hooks.append("shutdown"))
+
+    async def start_client(self):
+        client = TestClient(TestServer(build_app(self.bot, self.dp, make_settings())))
+        await client.start_server()
+        self.addAsyncCleanup(client.close)
+        return client
+
+    async def test_update_with_secret_is_dispatched(self):
+        client = await self.start_client()
+        response = await client.post(
+            "/telegram/webhook", json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+        )
+        self.assertEqual(response.status, 200)
+        # Апдейт обрабатывается фоновой задачей уже после ответа Telegram
+        await asyncio.wait_for(self.received.wait(), 1)
+        self.assertEqual(self.messages, ["/add"])
+
+    async def test_requests_without_secret_are_rejected(self):
+        client = await self.start_client()
+        for headers in ({}, {"X-Telegram-Bot-Api-Secret-Token": "wrong"}):
+            response = await client.post("/telegram/webhook", json=UPDATE, headers=headers)
+            self.assertEqual(response.status, 401)
+        await asyncio.sleep(0)
+        self.assertEqual(self.messages, [])
+
+    async def test_healthz(self):
+        client = await self.start_client()
+        response = await client.get("/healthz")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(await response.json(), {"ok": True})
+
+    async def test_startup_and_shutdown_hooks(self):
+        client = await self.start_client()
+        self.assertEqual(self.hooks, ["startup"])
+        await client.close()
+        self.assertEqual(self.hooks, ["startup", "shutdown"])
+
+    async def test_run_webhook_sets_webhook_and_cleans_up(self):
+        with mock.patch.object(Bot, "set_webhook", new_callable=mock.AsyncMock) as set_webhook:
+            task = asyncio.create_task(run_webhook(self.bot, self.dp, make_settings()))
+            for _ in range(100):
+                if set_webhook.await_count:
+                    break
+                await asyncio.sleep(0.01)
+            set_webhook.assert_awaited_once_with(
+                "https://bot.example.by/telegram/webhook",
+                secret_token=SECRET,
+                allowed_updates=["message"],
+            )
+            self.assertEqual(self.hooks, ["startup"])
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        self.assertEqual(self.hooks, ["startup", "shutdown"])
+
+    async def test_run_webhook_requires_https_and_secret(self):
+        for overrides in ({"webhook_base_url": "http://bot.example.by"}, {"webhook_secret": ""},
+                          {"webhook_secret": "no spaces allowed"}):
+            with self.subTest(overrides), self.assertRaises(RuntimeError):
+                await run_webhook(self.bot, self.dp, make_settings(**overrides))
+        self.assertEqual(self.hooks, [])
+
+
+if __name__ == "__main__":
+    unittest.main()